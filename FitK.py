@@ -16,6 +16,15 @@ indicate a better quality fit. LL is the log-likelihood of the best fit.
 This is useful for statistical analysis of the significance of fitted 
 parameters (i.e. likelihood ratio test).
 
+All random starting points are descended together as one batched 
+(starts x trials) computation. The descent works on k and log m, so that 
+starts do not stall at m = 0. Starts that land on the same optimum are 
+pruned, and only the best few distinct optima are polished with L-BFGS-B.
+With grid=True (or fitkgrid) the likelihood is instead evaluated once on a 
+log-spaced (k, m) grid and only its best local minima are polished; this 
+also returns the full likelihood surface. IncrementalFitK keeps a fit up 
+to date while trials arrive, warm-starting from the previous optimum.
+
 @author: christianrodriguez 
 Check out:
 http://psych.stanford.edu/~dnl/
@@ -23,46 +32,322 @@ http://en.wikipedia.org/wiki/Hyperbolic_discounting
 
 """
 
-def fitk(data):
+def fitk(data, nstarts=1000, npolish=5, grid=False, mmin=1e-4):
     
     from scipy import optimize
-    import numpy, math
+    import numpy
     
     # make some shortcuts
     nprand  = numpy.random.rand
 
+    # evaluate a precomputed (k, m) grid instead of random starts
+    if grid:
+        return fitkgrid(data, npolish=npolish)[:4]
+
+    # kept for plotfit, the fit itself only uses data
     global d
     d = data
     LL = float('inf')
     
-    # optimize parameters 100 times, using different starting points
-    randstarts = 0
-    while randstarts < 1000:
-        
-        # pick random initial values
-        km0 = [nprand() * .02, nprand() * 2]
+    # pick random initial values for all the starting points at once
+    km0 = numpy.column_stack((nprand(nstarts) * .02, nprand(nstarts) * 2))
     
-        opts = {'maxiter':10000}
-        bnds = ((0,1), (0,200)) 
-        res = optimize.minimize(errorfit, km0, bounds=bnds, options=opts,\
-                                method='L-BFGS-B') #method='L-BFGS-B' TNC
+    # descend from every starting point together, one batched pass per step,
+    # in (k, log m): at m = 0 the k gradient vanishes, so starts descending
+    # in m would stall on its bound wherever k is still wrong
+    bnds = ((0,1), (0,200)) 
+    lbnds = ((0,1), (numpy.log(mmin), numpy.log(200)))
+    x0 = numpy.column_stack((km0[:,0], numpy.log(numpy.maximum(km0[:,1], mmin))))
+    x, lls = descend(errorgrad_logm, x0, lbnds, args=(data,))
     
-        # evaluate the softmax at the given values                 
-        loglike = errorfit(res.x)
+    # many starts end up in the same place, keep one of each (best first)
+    x, lls = uniqueoptima(x, lls, lbnds)
+    km = numpy.column_stack((x[:,0], numpy.exp(x[:,1])))
 
+    # polish only the best few distinct optima with L-BFGS-B (as fitkgrid)
+    opts = {'maxiter':10000, 'ftol':1e-12, 'gtol':1e-8}
+    for kmp in km[:npolish]:
+        res = optimize.minimize(errorgrad, kmp, args=(data,), jac=True, \
+                                bounds=bnds, options=opts, method='L-BFGS-B')
+        
         # use the new values if the loglikelihood is decreased
-        if loglike < LL and not(math.isinf(loglike)):
-            km = res.x
-            LL = loglike
-            
-        randstarts = randstarts + 1
-
+        if res.fun < LL:
+            kmbest = res.x
+            resbest = res
+            LL = res.fun
+    
     # output k, m, and loglikelihood
-    return km[0], km[1], -1*LL, res
+    return kmbest[0], kmbest[1], -1*LL, resbest
 
 #    # make a summary plot
 #    plotFit(km)
 
+def fitkgrid(data, kgrid=None, mgrid=None, npolish=3):
+    
+    '''
+    Fits k and m by evaluating the likelihood once on a dense (k, m) grid, 
+    then polishing only the best few local minima of the grid with L-BFGS-B.
+    Returns k, m and loglikelihood like fitk, followed by the optimizer 
+    result and the loglikelihood surface over (kgrid x mgrid). The default
+    grids come from kmgrid.
+    '''
+    
+    from scipy import optimize
+    import numpy
+    
+    global d
+    d = data
+    LL = float('inf')
+    
+    if kgrid is None or mgrid is None:
+        kg, mg = kmgrid()
+        kgrid = kg if kgrid is None else kgrid
+        mgrid = mg if mgrid is None else mgrid
+    
+    # -1*loglikelihood over the whole grid, (k x m)
+    surf = gridfit(data, kgrid, mgrid)
+    
+    # polish the best few local minima of the surface, to tight tolerances:
+    # k and m are scaled so differently that the defaults stop short
+    bnds = ((0,1), (0,200)) 
+    opts = {'maxiter':10000, 'ftol':1e-12, 'gtol':1e-8}
+    for ki, mi in gridminima(surf)[:npolish]:
+        res = optimize.minimize(errorgrad, [kgrid[ki], mgrid[mi]], 
+                                args=(data,), jac=True, bounds=bnds, 
+                                options=opts, method='L-BFGS-B')
+        if res.fun < LL:
+            kmbest = res.x
+            resbest = res
+            LL = res.fun
+    
+    return kmbest[0], kmbest[1], -1*LL, resbest, -1*surf
+
+def kmgrid(nk=121, nm=121):
+    
+    '''
+    Default grids for fitkgrid: log-spaced k in [1e-4, 1] and m in [1e-3, 200]
+    within the fitk bounds, each with 0 prepended.
+    '''
+    
+    import numpy
+    
+    kgrid = numpy.concatenate(([0], numpy.logspace(-4, 0, nk-1)))
+    mgrid = numpy.concatenate(([0], numpy.logspace(-3, numpy.log10(200), nm-1)))
+    
+    return kgrid, mgrid
+
+# discount factors 1/(1+k*d) per grid and delay, shared across subjects
+_dfcache = {}
+
+def discountgrid(kgrid, delays):
+    
+    '''
+    Returns 1/(1+k*d) for every k in kgrid (rows) and delay (columns). The 
+    factors only depend on the delay, so each distinct delay is computed 
+    once per grid and reused by every later call.
+    '''
+    
+    import numpy
+    
+    kgrid = numpy.asarray(kgrid, dtype=float)
+    cache = _dfcache.setdefault(kgrid.tobytes(), {})
+    
+    uniq, inv = numpy.unique(delays, return_inverse=True)
+    for delay in uniq:
+        if delay not in cache:
+            cache[delay] = 1/(1 + kgrid*delay)
+    
+    return numpy.column_stack([cache[delay] for delay in uniq])[:, inv]
+
+def gridfit(data, kgrid, mgrid):
+    
+    '''
+    Computes -1*loglikelihood of softmax fit assuming hyperbolic discounting
+    for every (k, m) in kgrid x mgrid in one vectorized pass. Returns an 
+    array of shape (len(kgrid), len(mgrid)).
+    '''
+    
+    import numpy
+    
+    # net discounted value of ll over ss per k and trial, (k x trials)
+    dV = data[:,2]*discountgrid(kgrid, data[:,3]) - \
+         data[:,0]*discountgrid(kgrid, data[:,1])
+    
+    # signed softmax argument over the whole grid, (k x m x trials)
+    s = numpy.where(data[:,4] == 1, -1., 1.)
+    z = (s*dV)[:,None,:] * numpy.asarray(mgrid, dtype=float)[None,:,None]
+    
+    return numpy.sum(numpy.logaddexp(0, z), axis=-1)
+
+def gridminima(surf):
+    
+    '''
+    Returns (row, column) indices of the local minima of a 2-d surface 
+    (no lower neighbour, diagonals included), sorted from lowest to highest.
+    '''
+    
+    import numpy
+    
+    pad = numpy.pad(surf, 1, mode='constant', constant_values=numpy.inf)
+    ismin = numpy.ones(surf.shape, dtype=bool)
+    nr, nc = surf.shape
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            if dr or dc:
+                ismin &= surf <= pad[1+dr:1+dr+nr, 1+dc:1+dc+nc]
+    
+    rows, cols = numpy.nonzero(ismin)
+    order = numpy.argsort(surf[rows, cols], kind='mergesort')
+    
+    return list(zip(rows[order], cols[order]))
+
+class IncrementalFitK(object):
+    
+    '''
+    Keeps a fit of k and m up to date as trials arrive one at a time. The 
+    trials are kept in a preallocated matrix, and each new trial triggers 
+    one L-BFGS-B run on the errorfit likelihood warm-started from the 
+    previous optimum, which usually converges in a few iterations. Every 
+    recheck trials, the likelihood is also evaluated on a coarse (k, m) grid
+    (reusing the cached discount factors) and the fit restarts from the grid
+    minimum if that is better, so it does not get stuck in a local optimum
+    of an early, small data set.
+    
+    Usage:
+      fit = IncrementalFitK()
+      k, m, LL = fit.add([r1, d1, r2, d2, choice])
+    '''
+    
+    def __init__(self, data=None, km0=(.02, 1.), recheck=10, size=256):
+        
+        import numpy
+        
+        self.data = numpy.zeros((size, 5))
+        self.n = 0
+        self.km = numpy.array(km0, dtype=float)
+        self.LL = float('nan')
+        self.recheck = recheck
+        self.grid = kmgrid(41, 41)
+        if data is not None and len(data):
+            self.add(data)
+    
+    def trials(self):
+        
+        return self.data[:self.n]
+    
+    def objective(self, km):
+        
+        f, g = errorgrad_batch(km, self.trials())
+        
+        return f[0], g[0]
+    
+    def add(self, trials):
+        
+        '''
+        Adds one trial [r1 d1 r2 d2 choice] (or several, as rows) and 
+        refits. Returns k, m and loglikelihood.
+        '''
+        
+        from scipy import optimize
+        import numpy
+        
+        trials = numpy.atleast_2d(numpy.asarray(trials, dtype=float))
+        
+        # grow the trial matrix by doubling when it is full
+        while self.n + len(trials) > len(self.data):
+            self.data = numpy.concatenate((self.data, numpy.zeros(self.data.shape)))
+        self.data[self.n:self.n + len(trials)] = trials
+        nold = self.n
+        self.n = self.n + len(trials)
+        
+        # once in a while, make sure a better basin has not appeared
+        km0 = self.km
+        if self.recheck and (self.n // self.recheck) > (nold // self.recheck):
+            kgrid, mgrid = self.grid
+            surf = gridfit(self.trials(), kgrid, mgrid)
+            ki, mi = numpy.unravel_index(numpy.argmin(surf), surf.shape)
+            if surf[ki, mi] < self.objective(km0)[0]:
+                km0 = numpy.array([kgrid[ki], mgrid[mi]])
+        
+        bnds = ((0,1), (0,200)) 
+        res = optimize.minimize(self.objective, km0, jac=True, bounds=bnds,
+                                method='L-BFGS-B')
+        self.km = res.x
+        self.LL = -1*res.fun
+        
+        return self.km[0], self.km[1], self.LL
+
+def descend(fun, x0, bnds, args=(), maxiter=1000, tol=1e-7):
+    
+    '''
+    Batched bounded minimization of fun from every row of x0 (starts x params).
+    fun(x, *args) must return the objective per row and its gradient (same
+    shape as x). Uses resilient backpropagation steps (iRprop-), which only 
+    need gradient signs, so every start gets its own step size per parameter
+    and poorly scaled parameters like k and m need no rescaling. Returns the
+    final points and their objective values.
+    '''
+    
+    import numpy
+    
+    # make some shortcuts
+    npwhere = numpy.where
+    npclip  = numpy.clip
+    
+    lo = numpy.array([b[0] for b in bnds], dtype=float)
+    hi = numpy.array([b[1] for b in bnds], dtype=float)
+    wid = hi - lo
+    
+    x = npclip(numpy.array(x0, dtype=float), lo, hi)
+    f, g = fun(x, *args)
+    delta = numpy.ones(x.shape) * wid * .01
+    gprev = numpy.zeros(x.shape)
+    
+    it = 0
+    while it < maxiter:
+        
+        # grow steps while the gradient keeps its sign, shrink when it flips
+        sgn = g * gprev
+        delta = npwhere(sgn > 0, numpy.minimum(delta * 1.2, wid * .1), delta)
+        delta = npwhere(sgn < 0, delta * .5, delta)
+        g = npwhere(sgn < 0, 0, g)
+        
+        # take the step and stay inside the bounds
+        x = npclip(x - numpy.sign(g) * delta, lo, hi)
+        gprev = g
+        f, g = fun(x, *args)
+        
+        # done when every parameter either has a tiny step or sits on a bound
+        pinned = ((x <= lo) & (g > 0)) | ((x >= hi) & (g < 0))
+        if numpy.all((delta < tol * wid) | pinned | (g == 0)):
+            break
+        it = it + 1
+        
+    return x, f
+
+def uniqueoptima(km, lls, bnds, tol=1e-4):
+    
+    '''
+    Prune rows of km that converged to the same optimum. Parameters are 
+    compared on the scale of their bounds, to within tol. Returns one row 
+    per optimum and its -1*loglikelihood, sorted from best to worst.
+    '''
+    
+    import numpy
+    
+    lo = numpy.array([b[0] for b in bnds], dtype=float)
+    hi = numpy.array([b[1] for b in bnds], dtype=float)
+    
+    order = numpy.argsort(lls, kind='mergesort')
+    km, lls = km[order], lls[order]
+    
+    # snap to a tol sized grid, the first (best) row of each cell is kept
+    cells = numpy.round((km - lo) / (hi - lo) / tol)
+    _, first = numpy.unique(cells, axis=0, return_index=True)
+    first = numpy.sort(first)
+    
+    return km[first], lls[first]
+
 def errorfit(km):
     
     #d = fitkd
@@ -70,38 +355,95 @@ def errorfit(km):
     Computes -1*loglikelihood of softmax fit assuming hyperbolic discounting.
     '''
     
+    return errorgrad(km)[0]
+
+def errorgrad(km, data=None):
+    
+    '''
+    Computes -1*loglikelihood of softmax fit assuming hyperbolic discounting, 
+    together with its exact gradient with respect to (k, m). Meant to be 
+    passed to optimize.minimize with jac=True. Uses the data of the last 
+    fitk call unless data is given.
+    '''
+    
+    if data is None:
+        data = d
+    f, g = errorgrad_batch(km, data)
+    
+    return f[0], g[0]
+
+def errorgrad_logm(x, data):
+    
+    '''
+    errorgrad_batch with the rows of x holding (k, log m), the gradient with
+    respect to (k, log m). Used by fitk for the batched descent.
+    '''
+    
     import numpy
     
+    x = numpy.atleast_2d(x)
+    km = numpy.column_stack((x[:,0], numpy.exp(x[:,1])))
+    f, g = errorgrad_batch(km, data)
+    
+    return f, numpy.column_stack((g[:,0], g[:,1]*km[:,1]))
+
+def errorfit_batch(km, data):
+    
+    '''
+    Computes -1*loglikelihood of softmax fit assuming hyperbolic discounting,
+    for many (k, m) pairs at once. km holds one pair per row and the result
+    has one value per row. data is a single trial matrix, or one per row of
+    km stacked along the first axis.
+    '''
+    
+    return errorgrad_batch(km, data)[0]
+
+def errorgrad_batch(km, data):
+    
+    '''
+    Batched -1*loglikelihood and its exact gradient with respect to (k, m). 
+    The choice probabilities are never formed: with z = m*(Vll-Vss) and 
+    s = +1 for ll choices and -1 otherwise, -log p(choice) = softplus(-s*z),
+    which stays finite where pll saturates to 0 or 1, so contradictions 
+    cost a large but finite penalty instead of inf.
+    '''
+    
+    import numpy
+    from scipy.special import expit
+    
     # make some shortcuts
-    concat  = numpy.concatenate
-    nplog   = numpy.log
-    npexp   = numpy.exp
-    npnot   = numpy.logical_not
     npsum   = numpy.sum
-            
-    # discounted values based on current k guess
-    V1 = d[:,0]/(1 + km[0]*d[:,1]) # Vss
-    V2 = d[:,2]/(1 + km[0]*d[:,3]) # Vll
     
-    # p of choosing ll (ll=2)
-    pll = 1/(1+ npexp(-km[1]*(V2-V1))) 
+    km = numpy.atleast_2d(numpy.asarray(km, dtype=float))
+    k  = km[:,0:1]
+    m  = km[:,1:2]
     
-    # boolean of ll choices
-    lls = d[:,4]==1 
-
-    # penalize contradictions (ll and pll=0 or ss and pll=1)
-    if 0 in pll[lls] or 1 in pll[npnot(lls)]:
-        loglik = float('inf') # maximum float, avoids inf errors
-    else:
-        loglik = npsum(  nplog( concat( ( pll[lls], 1-pll[npnot(lls)] ) ) ) )
+    # discounted values and their k derivatives, (starts x trials)
+    D1 = 1/(1 + k*data[...,1])
+    D2 = 1/(1 + k*data[...,3])
+    V1 = data[...,0]*D1 # Vss
+    V2 = data[...,2]*D2 # Vll
+    dV = V2 - V1
+    dVdk = -data[...,2]*data[...,3]*D2**2 + data[...,0]*data[...,1]*D1**2
+    
+    # signed softmax argument, ll=1 
+    s = numpy.where(data[...,4] == 1, 1., -1.)
+    z = -s*m*dV
+    
+    # -log p(choice) and its derivative with respect to the net value
+    loglik = npsum(numpy.logaddexp(0, z), axis=-1)
+    dz = -s*expit(z)
+    
+    g = numpy.column_stack((npsum(dz*m*dVdk, axis=-1), 
+                            npsum(dz*dV, axis=-1)))
             
-    return  -1*loglik
+    return loglik, g
 
-def plotfit(km):
+def plotfit(km, data=None):
     
-    #d = fitkd
     '''
-    Make various fit diagnostic plots.
+    Make various fit diagnostic plots of the trials in data (by default
+    the data of the last fitk call) in a new figure, which is returned.
     '''
     
     import numpy
@@ -117,12 +459,15 @@ def plotfit(km):
     npmin   = numpy.amin
     npexp   = numpy.exp
 
+    if data is None:
+        data = d
+
 
     # get range of x axis
-    maxd1 = npmax(d[:,1])
-    maxd2 = npmax(d[:,3])
-    mind1 = npmin(d[:,1])
-    mind2 = npmin(d[:,3])
+    maxd1 = npmax(data[:,1])
+    maxd2 = npmax(data[:,3])
+    mind1 = npmin(data[:,1])
+    mind2 = npmin(data[:,3])
     mind  =  npmin(nparray([mind1, mind2]))
     maxd  =  npmax(nparray([maxd1, maxd2]));
 
@@ -130,7 +475,7 @@ def plotfit(km):
     t = nprange(0, maxd, .1)
 
     # open a new figure
-    plt.figure()    
+    fig = plt.figure()    
     
     subplot(1,3,1)
     plot(t, 1/(1+km[0]*t), '-k')
@@ -138,12 +483,12 @@ def plotfit(km):
     plt.title('1/(1+kt)') #y.labels get crowded
     
     # make arrays of delays and discounted values
-    ss = d[:,4] == 0
-    delayss =  (d[ss,1], d[ss,3])
-    valss   =  ( d[ss,0]/(1+km[0]*d[ss,1]), d[ss,2]/(1+km[0]*d[ss,3]) ) 
-    ll = d[:,4] == 1
-    delayll =  (d[ll,1], d[ll,3])
-    valll   =  ( d[ll,0]/(1+km[0]*d[ll,1]), d[ll,2]/(1+km[0]*d[ll,3]) ) 
+    ss = data[:,4] == 0
+    delayss =  (data[ss,1], data[ss,3])
+    valss   =  ( data[ss,0]/(1+km[0]*data[ss,1]), data[ss,2]/(1+km[0]*data[ss,3]) ) 
+    ll = data[:,4] == 1
+    delayll =  (data[ll,1], data[ll,3])
+    valll   =  ( data[ll,0]/(1+km[0]*data[ll,1]), data[ll,2]/(1+km[0]*data[ll,3]) ) 
    
     subplot(1,3,2)
     plot( delayss, valss, 'o-r')
@@ -154,8 +499,8 @@ def plotfit(km):
     plt.title('SV') #y.labels get crowded
     
     # discounted values based on current k guess
-    V1 = d[:,0]/(1 + km[0]*d[:,1]) # Vss
-    V2 = d[:,2]/(1 + km[0]*d[:,3]) # Vll
+    V1 = data[:,0]/(1 + km[0]*data[:,1]) # Vss
+    V2 = data[:,2]/(1 + km[0]*data[:,3]) # Vll
     netval = V2-V1
     
     # p of choosing ll (ll=2)
@@ -163,7 +508,9 @@ def plotfit(km):
     
     subplot(1,3,3)
     plot( netval, pll, 'og')
-    plot( netval[ss], d[ss,4], 'or')
-    plot( netval[ll], d[ll,4], 'ob')
+    plot( netval[ss], data[ss,4], 'or')
+    plot( netval[ll], data[ll,4], 'ob')
     plt.xlabel('V(ll)-V(ss)')
     plt.title('p(ll)') #y.labels get crowded
+
+    return fig
@@ -9,7 +9,20 @@ four runs where a quarter of the offers are presented. Each trial presents a
 fixation cross for .5s, then a fixed offer for 1.5s. The first offer could be 
 an SS or LL. Then a fixation cross is presented for 6 seconds before the 
 probability adjusted offer is presented for a maximum of 4 seconds. The ITI 
-goes from 2-3 seconds, with uniform jitter.
+goes from 2-3 seconds, with uniform jitter. The offer screens of the run are
+rendered and preloaded before the scanner is triggered (see stimcache.py).
+All onsets are planned up front from the start mark and each event waits for
+its absolute deadline, so presentation overhead does not accumulate; the ITI
+absorbs whatever is left of the decision window (see trialsched.py). The
+scanner port is handled in a background thread that timestamps every TR 
+pulse; the pulse times are written next to the data file (see scannerio.py).
+With rtdir set, ROI means are streamed from the volumes the scanner exports
+(see rtvolumes.py) and trial-wise betas are estimated online after every
+volume (see onlineglm.py). With adaptive set, each adjusted offer is
+recomputed from the choices so far in a background thread during the delay
+and ITI, falling back to the generated offer if it is not ready in time (see
+designworker.py). The time spent in each phase of every trial is written
+next to the data file as _profile.csv (see phaseprof.py).
 
 This code depends on the expyriment package there are several additional 
 dependencies that come along. Check out the link below for more info.
@@ -35,14 +48,33 @@ dprest  = 6000        # length of delay period (ms)
 maxdt   = 5000        # max decision time, presentation of second offer (ms)
 itir    = (2000,3001) # range for inter-stimulus-interval
 secs = 10             # seconds to wait if warining screen is ran
+scanport = '/dev/tty.usbmodem12341' # serial port of the scanner trigger box
+fakescan = False      # use a stand-in scanner on a pty (see scannerio.py)
+tr      = 2.          # TR (s), also used by the stand-in scanner
+rtdir   = None        # directory the scanner exports volumes to (None = off)
+roifile = 'data/rois.npz' # boolean 3-d ROI masks, one array per ROI name
+adaptive = False      # recompute each adjusted offer from the choices so far
+margin  = 500         # ms before the second offer an adapted one must be ready
+preahead = None       # trials of offer screens kept preloaded (None = whole
+                      # run), screens of finished trials are then unloaded
 
 
 from expyriment import design, control, stimuli, misc
-import os, serial
+import os
 import numpy as np
+from scannerio import ScannerIO, FakeScanner
+from rtvolumes import VolumeStream
+from onlineglm import OnlineGLM
+from designworker import DesignWorker, Retarget
+from stimcache import OfferScreens
+from trialsched import planrun, Scheduler, timingfile
+from phaseprof import PhaseProfile
+import trialstore
 
-# make sure the script runs on the appropriate directory
-maindir = '/Users/christianrodriguez/Dropbox/Python'
+# make sure the script runs on the appropriate directory (ITC_MAINDIR, set
+# e.g. by headless.py replays, overrides it)
+maindir = os.environ.get('ITC_MAINDIR', 
+                         '/Users/christianrodriguez/Dropbox/Python')
 os.chdir(maindir)
 
 # indicate the run number (x/4)
@@ -56,9 +88,19 @@ control.initialize(exp)
 # shortcut to the keyboard
 response_device = exp.keyboard
 
+# open the scanner port in the background and start listening for pulses
+if fakescan:
+    fake = FakeScanner(tr=tr)
+    fake.start()
+    scanport = fake.port
+scanner = ScannerIO(scanport, 57600, now=misc.Clock.monotonic_time)
+scanner.start()
+
 # preload fixation cross for ITI
 fixcross = stimuli.FixCross(colour=white, size= crossize)
 fixcross.preload()
+blank = stimuli.BlankScreen()
+blank.preload()
 
 # name variables to be collected
 exp.data_variable_names = ['run','trial', 'famnt', 'fdel', 'pamnt', 'pdel',
@@ -70,9 +112,9 @@ control.start(skip_ready_screen=True)
 # get subject number and load stimulus file, notify if stim file doesnt exist
 subj = exp.subject
 try:
-    offers = np.genfromtxt('%s/data/offers/%s_offers.txt' % (maindir, subj),
-                           delimiter=',', skip_header=1)
-except IOError: 
+    offers = trialstore.readoffers('%s/data/offers/%s_offers.txt' % 
+                                   (maindir, subj))
+except (IOError, OSError): 
     control.end(goodbye_text=None, goodbye_delay=None, fast_quit=None)
     print('The subject number you entered (%s) does not have a stimulus file.'
     % (subj))
@@ -125,78 +167,115 @@ if blck == 1:
         response_device.wait()
         screennum = screennum + 1
 
-## communicate with scanner
-ser = serial.Serial('/dev/tty.usbmodem12341', 57600, timeout=1) # open port
-ser.write("[t]") # start the scanner
-ser.close() # close port
+# adapt offers in the background, starting from the staircase fit
+if adaptive:
+    k0, m0, ll0 = trialstore.readparams('%s/data/fitted/%s_fitkparams.txt' % 
+                                        (maindir, str(subj).zfill(2)))
+    worker = DesignWorker(Retarget(k0, m0))
+    worker.start()
+history = []
+
+# render and preload the offer screens of the run before the trigger
+screens = OfferScreens(offers, tsize, amtpos, delpos, ahead=preahead)
+screens.prepare()
+
+# stream ROI means from the exported volumes as they arrive
+if rtdir is not None:
+    rois = np.load(roifile)
+    stream = VolumeStream(rtdir, dict((name, rois[name]) for name in rois.files))
+    stream.start()
+
+## communicate with scanner, pulses are timestamped from now on
+scanner.trigger() # start the scanner
 
 # start clock and get the a relative t = 0 mark
 clock = misc.Clock()
 strtt = clock.monotonic_time()
+
+# plan every onset of the run from strtt, trials start after the countdown
+itis = np.random.randint(itir[0], itir[1], size=len(offers))
+sched = Scheduler(planrun(len(offers), secs, fixcprest, foprest, dprest, 
+                          maxdt, itis), strtt, now=clock.monotonic_time, 
+                  wait=exp.clock.wait)
+
+# time spent in each phase of every trial, including the deadline waits
+prof = PhaseProfile(('fixwait', 'fix', 'fowait', 'foffer', 'dwait', 'delay',
+                     'adapt', 'pwait', 'poffer', 'response', 'iti', 'glm',
+                     'log', 'request'), len(offers), now=clock.monotonic_time)
+
+# trial-wise betas of the streamed ROIs, updated online
+if rtdir is not None:
+    glm = OnlineGLM(len(stream.names), sched.planned[-1,-1] + maxdt/1000.)
           
 # wait for several seconds to allow for signal saturation
-while secs > 0:
-    intro = 'The task will start in %d seconds' % secs
-    stimuli.TextScreen('', intro, text_size= instsize, 
-                       text_colour= white).present()
-    exp.clock.wait(1000)
-    secs = secs - 1
+for sec in range(secs):
+    intro = 'The task will start in %d seconds' % (secs - sec)
+    countdown = stimuli.TextScreen('', intro, text_size= instsize, 
+                                   text_colour= white)
+    countdown.preload()
+    sched.waituntil(0, onset=sec)
+    countdown.present()
 
 # loop for specified number of trials
 trial = 0
 while trial < len(offers):
     
-    # present fixation cross and wait sometime
+    # present fixation cross at its deadline
+    prof.start(trial)
+    sched.waituntil(trial, 0)
+    prof.mark(trial, 'fixwait')
     fixcross.present()
-    exp.clock.wait(fixcprest)
-    
+    sched.mark(trial, 0)
+    prof.mark(trial, 'fix')
     
     # get the fixed offer, present and wait for sometime
     foffer = offers[trial,:2]
-    famnt = '$'+'%.2f' % (np.round(foffer[0], decimals = 1))
-    if foffer[1] == 0:
-        fdel = 'Today'
-    else:
-        fdel = '%.0f' % (foffer[1])+' days'
-        
-    screen = stimuli.BlankScreen()
-    stim1 = stimuli.TextLine(text=famnt, position=amtpos, 
-                             text_colour=(255,255,0), text_size = tsize)
-    stim2 = stimuli.TextLine(text=fdel, position=delpos, 
-                             text_colour=(255,255,0), text_size = tsize)
-    stim1.plot(screen)
-    stim2.plot(screen)
-    screen.present()
-    foffert = clock.monotonic_time() - strtt # when the first offer appears
-    exp.clock.wait(foprest)
+    sched.waituntil(trial, 1)
+    prof.mark(trial, 'fowait')
+    screens.first(trial).present()
+    foffert = sched.mark(trial, 1) # when the first offer appears
+    prof.mark(trial, 'foffer')
     
     # present fixation cross and wait sometime
+    sched.waituntil(trial, 2)
+    prof.mark(trial, 'dwait')
     fixcross.present()
-    dtime = clock.monotonic_time() - strtt # when the fix-cross appears
-    exp.clock.wait(dprest)
+    dtime = sched.mark(trial, 2) # when the fix-cross appears
+    prof.mark(trial, 'delay')
     
-    # get probability adjusted offer, present and wait (some max  time) for resp
+    # pick up the offer adapted in the background, or keep the generated one
     poffer = offers[trial,2:]
-    pamnt = '$'+'%.2f' % (np.round(poffer[0], decimals = 1))
-    if poffer[1] == 0:
-        pdel = 'Today'
-    else:
-        pdel = '%.0f' % (poffer[1])+' days'
+    if adaptive:
+        poffer, adapted = worker.get(trial, poffer, timeout=max(0, 
+                    sched.planned[trial,3] - sched.elapsed() - margin/1000.))
+        if adapted:
+            screens.setsecond(trial, poffer)
+    prof.mark(trial, 'adapt')
     
-    screen = stimuli.BlankScreen()    
-    stim3 = stimuli.TextLine(text=pamnt, position=amtpos,
-                            text_colour=(0,255,0), text_size = tsize)
-    stim4 = stimuli.TextLine(text=pdel, position=delpos,
-                            text_colour=(0,255,0), text_size = tsize)
-    stim3.plot(screen)
-    stim4.plot(screen)
-    screen.present()
-    poffert = clock.monotonic_time() - strtt # when the second offer appears
-    button, rt = response_device.wait_char([fbutton,sbutton], duration=maxdt)
+    # present probability adjusted offer and wait (some max  time) for resp
+    sched.waituntil(trial, 3)
+    prof.mark(trial, 'pwait')
+    screens.second(trial).present()
+    poffert = sched.mark(trial, 3) # when the second offer appears
+    prof.mark(trial, 'poffer')
+    button, rt = response_device.wait_char([fbutton,sbutton], 
+                                    duration=sched.remaining(trial, 3, maxdt))
+    prof.mark(trial, 'response')
     
-    # present random ITI screen
-    screen = stimuli.BlankScreen().present()
-    exp.clock.wait(np.random.randint(itir[0],itir[1]))
+    # present ITI screen, it stays up until the next trial's deadline
+    blank.present()
+    if preahead is not None:
+        screens.release(trial)
+    prof.mark(trial, 'iti')
+
+    # add the trial's events and catch up with the volumes that arrived
+    if rtdir is not None:
+        glm.addevent(trial, 'foffer', foffert, foprest/1000.)
+        glm.addevent(trial, 'delay', dtime, dprest/1000.)
+        glm.addevent(trial, 'poffer', poffert, 
+                     (maxdt if button is None else rt)/1000.)
+        glm.feed(stream.timecourse(), scanner.pulsetimes()[0] - strtt, tr)
+    prof.mark(trial, 'glm')
             
     # code choices
     if button is None:
@@ -211,9 +290,32 @@ while trial < len(offers):
     exp.data.add([blck, trial, float(foffer[0]), float(foffer[1]),
                   float(poffer[0]), float(poffer[1]), choice, rt, 
                   foffert, dtime, poffert])
+    prof.mark(trial, 'log')
+
+    # start on the next trial's offer while this ITI runs
+    history.append([foffer[0], foffer[1], poffer[0], poffer[1], choice])
+    if adaptive and trial + 1 < len(offers):
+        worker.request(trial + 1, list(history), offers[trial + 1])
+    prof.mark(trial, 'request')
                   
     # move onto next trial              
     trial = trial + 1
 
+if adaptive:
+    worker.close()
+
+# log planned vs actual onsets next to the data file
+sched.write(timingfile(exp.data.fullpath))
+prof.write(timingfile(exp.data.fullpath, '_profile.csv'))
+scanner.write(timingfile(exp.data.fullpath, '_pulses.csv'), strtt)
+scanner.close()
+if fakescan:
+    fake.close()
+if rtdir is not None:
+    stream.write(timingfile(exp.data.fullpath, '_roi.csv'))
+    glm.feed(stream.timecourse(), scanner.pulsetimes()[0] - strtt, tr)
+    glm.write(timingfile(exp.data.fullpath, '_betas.csv'), stream.names)
+    stream.close()
+
 # End Experiment
 control.end(goodbye_text=None, goodbye_delay=None, fast_quit=None)
\ No newline at end of file
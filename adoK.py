@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Adaptive design optimization (ADO) for the intertemporal choice staircase.
+
+A grid posterior over the hyperbolic discount rate k and the softmax slope m
+is kept in log space and updated after every choice. The next offer is the
+design with the largest expected information gain about (k, m), i.e. the
+mutual information between the choice and the parameters:
+
+  I(d) = H(sum_t p(t) pll(d,t)) - sum_t p(t) H(pll(d,t))
+
+where H is the binary entropy. The choice probabilities and their entropies
+for every candidate design are tabulated once, so picking a design is two
+matrix-vector products and an update is one pass over the grid.
+
+Designs are rows [ssamnt ssdel llamnt lldel], in the same column order as
+the trial matrices used by FitK. The candidate offers follow the staircase:
+SS from a small set of options, LL delays from 16 to 45 days and LL amounts
+set to the indifference point of a range of design k values, rounded to
+10 cents.
+
+Usage:
+  ado = ADOK()
+  ssamt, ssdel, llamt, lldel = ado.nextdesign()
+  ado.update([ssamt, ssdel, llamt, lldel], choice)   # choice 1 for ll
+  k, m = ado.estimate()
+
+"""
+
+import numpy
+from scipy.special import expit
+
+# candidate offers, as presented by stairK
+ssopts = [(10, 0), (10, 15), (20, 0), (20, 15)]
+lldels = range(16, 46)
+
+def adodesigns(ssopts=ssopts, lldels=lldels, kdes=None):
+
+    '''
+    Builds the candidate design matrix [ssamnt ssdel llamnt lldel]. For each
+    SS option and LL delay, the LL amount makes a subject with discount rate
+    kd (one per value in kdes) indifferent, rounded like the staircase does.
+    '''
+
+    if kdes is None:
+        kdes = numpy.logspace(-3, -.5, 30)
+
+    designs = []
+    for ss in ssopts:
+        for lldel in lldels:
+            for kd in kdes:
+                ssval = ss[0]/(1+kd*ss[1])
+                llamt = round(ssval+ssval*kd*lldel, 1)
+                designs.append((ss[0], ss[1], llamt, lldel))
+
+    # equal amounts can come out of neighbouring kd values after rounding
+    return numpy.unique(numpy.array(designs, dtype=float), axis=0)
+
+def adogrid(nk=50, nm=30):
+
+    '''
+    Default parameter grid for ADOK: log-spaced k in [1e-4, 1] and m in
+    [.01, 20].
+    '''
+
+    kgrid = numpy.logspace(-4, 0, nk)
+    mgrid = numpy.logspace(-2, numpy.log10(20), nm)
+
+    return kgrid, mgrid
+
+def pllgrid(designs, kgrid, mgrid):
+
+    '''
+    p of choosing ll for every design (rows) and every (k, m) pair of the
+    grid, flattened k-major into columns.
+    '''
+
+    designs = numpy.atleast_2d(designs)
+    k = numpy.asarray(kgrid, dtype=float)[:,None,None]
+    m = numpy.asarray(mgrid, dtype=float)[None,:,None]
+
+    V1 = designs[:,0]/(1 + k*designs[:,1]) # Vss, (k x 1 x designs)
+    V2 = designs[:,2]/(1 + k*designs[:,3]) # Vll
+    pll = expit(m*(V2-V1))                 # (k x m x designs)
+
+    return pll.reshape(-1, len(designs)).T
+
+def binentropy(p):
+
+    '''
+    Binary entropy (nats) of an array of probabilities.
+    '''
+
+    p = numpy.clip(numpy.asarray(p, dtype=float), 1e-12, 1-1e-12)
+
+    return -p*numpy.log(p) - (1-p)*numpy.log(1-p)
+
+class ADOK(object):
+
+    '''
+    Grid posterior over (k, m) and expected information gain design choice.
+
+    kgrid, mgrid: parameter grid (see adogrid)
+    designs: candidate designs (see adodesigns)
+    tables: optional (pll, entropy) arrays of shape (designs x grid points)
+            to use instead of computing them, e.g. the memory-mapped tables
+            from adotables.loadtables
+    '''
+
+    def __init__(self, kgrid=None, mgrid=None, designs=None, tables=None):
+
+        if kgrid is None or mgrid is None:
+            kg, mg = adogrid()
+            kgrid = kg if kgrid is None else kgrid
+            mgrid = mg if mgrid is None else mgrid
+        if designs is None:
+            designs = adodesigns()
+
+        self.kgrid = numpy.asarray(kgrid, dtype=float)
+        self.mgrid = numpy.asarray(mgrid, dtype=float)
+        self.designs = numpy.asarray(designs, dtype=float)
+
+        # flattened (k, m) values of every grid point
+        self.ks = numpy.repeat(self.kgrid, len(self.mgrid))
+        self.ms = numpy.tile(self.mgrid, len(self.kgrid))
+
+        # tabulate p(ll) and its entropy once per design and grid point
+        if tables is None:
+            self.pll = pllgrid(self.designs, self.kgrid,
+                               self.mgrid).astype(numpy.float32)
+            self.ent = binentropy(self.pll).astype(numpy.float32)
+        else:
+            self.pll, self.ent = tables
+
+        # flat prior over the log-spaced grid
+        self.logpost = numpy.zeros(len(self.ks))
+        self.post = numpy.ones(len(self.ks)) / len(self.ks)
+        self.ntrials = 0
+
+    def update(self, design, choice):
+
+        '''
+        Adds one choice (1 for ll, 0 for ss) made on design [ssamnt ssdel
+        llamnt lldel]. The design does not need to be one of the candidates.
+        '''
+
+        ssamt, ssdel, llamt, lldel = design
+        dV = llamt/(1 + self.ks*lldel) - ssamt/(1 + self.ks*ssdel)
+        s = 1. if choice == 1 else -1.
+
+        # log p(choice) through softplus, never overflows
+        self.logpost -= numpy.logaddexp(0, -s*self.ms*dV)
+        self.logpost -= self.logpost.max()
+        post = numpy.exp(self.logpost)
+        self.post = post / post.sum()
+        self.ntrials = self.ntrials + 1
+
+    def infogain(self):
+
+        '''
+        Expected information gain (nats) of every candidate design under the
+        current posterior.
+        '''
+
+        post = self.post.astype(numpy.float32)
+        pbar = self.pll.dot(post)
+
+        return binentropy(pbar) - self.ent.dot(post)
+
+    def nextdesign(self):
+
+        '''
+        Returns the candidate design [ssamnt ssdel llamnt lldel] with the
+        largest expected information gain.
+        '''
+
+        return self.designs[numpy.argmax(self.infogain())]
+
+    def estimate(self):
+
+        '''
+        Posterior means of k and m, averaged in log space like the grid.
+        '''
+
+        k = numpy.exp(self.post.dot(numpy.log(self.ks)))
+        m = numpy.exp(self.post.dot(numpy.log(self.ms)))
+
+        return k, m
+
+    def marginals(self):
+
+        '''
+        Posterior marginals over kgrid and mgrid.
+        '''
+
+        post = self.post.reshape(len(self.kgrid), len(self.mgrid))
+
+        return post.sum(1), post.sum(0)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Precomputed design tables for adaptive design optimization (see adoK.py).
+
+The offer space is small and discrete, so p(ll) and its binary entropy for
+every candidate design and every (k, m) point of the parameter grid only
+need computing once. maketables writes them to a float32 .npy file of shape
+(2, designs, grid points), filled in chunks so the full table never sits in
+memory, and the grids and designs to a small .npz next to it. loadtables
+memory-maps the .npy read-only, so startup costs no rebuild and every
+candidate is scored with a matrix-vector product against the posterior.
+
+The tables are not tied to the staircase: any design matrix with rows
+[amount1 delay1 amount2 delay2] (option 2 being the one coded as choice 1)
+can be tabulated, e.g. the fixed/adjusted offer pairs used in WMITC.py.
+
+Usage:
+  python adotables.py [basename]    # build the staircase tables once
+
+  kgrid, mgrid, designs, tables = loadtables(basename)
+  ado = adoK.ADOK(kgrid, mgrid, designs, tables)
+
+"""
+
+import os, sys
+import numpy
+import adoK
+
+def tablefiles(basename):
+
+    '''
+    Names of the table (.npy) and grid/design (.npz) files for basename.
+    '''
+
+    return '%s.npy' % basename, '%s_grid.npz' % basename
+
+def maketables(basename, kgrid=None, mgrid=None, designs=None, chunk=256):
+
+    '''
+    Computes p(ll) and its entropy for every design and (k, m) grid point
+    and writes them to disk, chunk designs at a time. Defaults are those of
+    adoK.ADOK. Returns the table and grid file names.
+    '''
+
+    if kgrid is None or mgrid is None:
+        kg, mg = adoK.adogrid()
+        kgrid = kg if kgrid is None else kgrid
+        mgrid = mg if mgrid is None else mgrid
+    if designs is None:
+        designs = adoK.adodesigns()
+
+    designs = numpy.asarray(designs, dtype=float)
+    ngrid = len(kgrid)*len(mgrid)
+    tabfile, gridfile = tablefiles(basename)
+
+    # write into a temporary name so a half built file is never mapped
+    tmpfile = tabfile + '.tmp.npy'
+    tab = numpy.lib.format.open_memmap(tmpfile, mode='w+',
+                                       dtype=numpy.float32,
+                                       shape=(2, len(designs), ngrid))
+    row = 0
+    while row < len(designs):
+        pll = adoK.pllgrid(designs[row:row+chunk], kgrid, mgrid)
+        tab[0, row:row+chunk] = pll
+        tab[1, row:row+chunk] = adoK.binentropy(pll)
+        row = row + chunk
+    tab.flush()
+    del tab
+
+    numpy.savez(gridfile, kgrid=kgrid, mgrid=mgrid, designs=designs)
+    os.rename(tmpfile, tabfile)
+
+    return tabfile, gridfile
+
+def loadtables(basename):
+
+    '''
+    Maps the tables written by maketables without reading them. Returns
+    kgrid, mgrid, designs and the (pll, entropy) tables, in the argument
+    order of adoK.ADOK.
+    '''
+
+    tabfile, gridfile = tablefiles(basename)
+    grid = numpy.load(gridfile)
+    tab = numpy.load(tabfile, mmap_mode='r')
+
+    if tab.shape[1:] != (len(grid['designs']),
+                         len(grid['kgrid'])*len(grid['mgrid'])):
+        raise ValueError('%s does not match the grids in %s'
+                         % (tabfile, gridfile))
+
+    return grid['kgrid'], grid['mgrid'], grid['designs'], (tab[0], tab[1])
+
+def hastables(basename):
+
+    '''
+    True if both table files for basename exist.
+    '''
+
+    return all(os.path.isfile(f) for f in tablefiles(basename))
+
+if __name__ == '__main__':
+
+    basename = sys.argv[1] if len(sys.argv) > 1 else 'data/ado/stairK'
+    if os.path.dirname(basename) and not os.path.isdir(os.path.dirname(basename)):
+        os.makedirs(os.path.dirname(basename))
+    print('wrote %s and %s' % maketables(basename))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Non-interactive version of runFitK.py for a whole cohort. Every staircase
+file (stairK_NN_*.xpd) in the data directory is fitted with FitK, one
+subject per worker process across all cores. Each subject's parameters are
+written to fitted/NN_fitkparams.txt exactly as runFitK.py does, and all of
+them are collected in one table, fitted/fitkparams_all.txt.
+
+Subjects whose _fitkparams.txt is newer than their staircase file are not
+refitted (use --force to refit anyway); their stored parameters still go
+into the table. If a subject has more than one staircase file, the most
+recent one is used.
+
+With --group, all subjects are instead fitted together under a population
+prior (see groupK.py), which shrinks noisy estimates towards the group; the
+population parameters go to fitted/fitkgroup.txt.
+
+Usage:
+  python batchFitK.py [datadir] [--force] [--procs N] [--grid] [--group]
+
+"""
+
+import os, argparse
+from multiprocessing import Pool, cpu_count
+import FitK, trialstore, catalog
+
+datadir = '/Users/christianrodriguez/Dropbox/Python/data'
+
+def loadstair(fname):
+
+    '''
+    Reads a staircase .xpd file into a FitK trial matrix
+    [ssamnt ssdel llamnt lldel choice], through its binary copy in the
+    trial store (made on first use).
+    '''
+
+    return trialstore.fitmatrix(trialstore.load(fname))
+
+def stairfiles(datadir):
+
+    '''
+    Maps each subject number string ('01', ...) to its most recent
+    staircase file, looked up in the session catalog of datadir (updated
+    first). The timestamp in the file name orders the sessions.
+    '''
+
+    cat = catalog.Catalog(datadir).update()
+
+    return dict(('%02d' % subj, cat.latest(subj, 'stairK'))
+                for subj in cat.subjects('stairK'))
+
+def paramsfile(datadir, subns):
+
+    return '%s/fitted/%s_fitkparams.txt' % (datadir, subns)
+
+def isfitted(datadir, subns, fname):
+
+    '''
+    True if the subject's _fitkparams.txt is newer than its data file.
+    '''
+
+    pfile = paramsfile(datadir, subns)
+
+    return os.path.isfile(pfile) and \
+           os.path.getmtime(pfile) > os.path.getmtime(fname)
+
+def fitsubject(job):
+
+    '''
+    Fits one subject and writes its _fitkparams.txt. Runs in a worker.
+    '''
+
+    datadir, subns, fname, grid = job
+    k, m, ll, res = FitK.fitk(loadstair(fname), grid=grid)
+    trialstore.writeparams(paramsfile(datadir, subns), k, m, ll)
+
+    return subns, k, m, ll, fname
+
+def readparams(datadir, subns, fname):
+
+    k, m, ll = trialstore.readparams(paramsfile(datadir, subns))
+
+    return subns, k, m, ll, fname
+
+def batchfit(datadir, force=False, procs=None, grid=False):
+
+    '''
+    Fits every subject in datadir that needs it, in a process pool, and
+    writes the consolidated fitted/fitkparams_all.txt. Returns its rows
+    as (subject, k, m, ll, file) tuples, sorted by subject.
+    '''
+
+    if not os.path.isdir('%s/fitted' % datadir):
+        os.mkdir('%s/fitted' % datadir)
+
+    subs = stairfiles(datadir)
+    jobs = [(datadir, subns, subs[subns], grid) for subns in sorted(subs)
+            if force or not isfitted(datadir, subns, subs[subns])]
+    done = [readparams(datadir, subns, subs[subns]) for subns in sorted(subs)
+            if not force and isfitted(datadir, subns, subs[subns])]
+
+    if jobs:
+        pool = Pool(min(procs or cpu_count(), len(jobs)))
+        try:
+            done = done + pool.map(fitsubject, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    done = sorted(done)
+    writetable(datadir, done)
+
+    return done
+
+def writetable(datadir, done):
+
+    f = open('%s/fitted/fitkparams_all.txt' % datadir, 'w')
+    f.write('"subject","k","m","ll","file"\n')
+    for subns, k, m, ll, fname in done:
+        f.write('%s, %f, %f, %f, %s\n' % (subns, k, m, ll,
+                                          os.path.basename(fname)))
+    f.close()
+
+def groupfit(datadir):
+
+    '''
+    Fits every subject together with a population prior (groupK) and
+    writes the same files as batchfit, plus the population parameters in
+    fitted/fitkgroup.txt. Everyone is refitted, since each estimate
+    depends on the whole group.
+    '''
+
+    import groupK
+
+    if not os.path.isdir('%s/fitted' % datadir):
+        os.mkdir('%s/fitted' % datadir)
+
+    subs = stairfiles(datadir)
+    subnss = sorted(subs)
+    if not subnss:
+        return []
+    fit = groupK.groupfit([loadstair(subs[subns]) for subns in subnss])
+
+    done = []
+    for i, subns in enumerate(subnss):
+        k, m, ll = fit['k'][i], fit['m'][i], fit['ll'][i]
+        trialstore.writeparams(paramsfile(datadir, subns), k, m, ll)
+        done.append((subns, k, m, ll, subs[subns]))
+    writetable(datadir, done)
+
+    f = open('%s/fitted/fitkgroup.txt' % datadir, 'w')
+    f.write('"k","m","sdlogk","sdlogm"\n')
+    f.write('%f, %f, %f, %f\n' % (fit['kgroup'], fit['mgroup'],
+                                  fit['sd'][0], fit['sd'][1]))
+    f.close()
+
+    return done
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Fit k and m for every '
+                                     'staircase file in a data directory.')
+    parser.add_argument('datadir', nargs='?', default=datadir)
+    parser.add_argument('--force', action='store_true',
+                        help='refit subjects that are up to date')
+    parser.add_argument('--procs', type=int, default=None,
+                        help='number of worker processes (all cores)')
+    parser.add_argument('--grid', action='store_true',
+                        help='fit on the (k, m) grid instead of random starts')
+    parser.add_argument('--group', action='store_true',
+                        help='fit all subjects together with a population '
+                        'prior (groupK.py)')
+    args = parser.parse_args()
+
+    if args.group:
+        done = groupfit(args.datadir)
+    else:
+        done = batchfit(args.datadir, args.force, args.procs, args.grid)
+    for subns, k, m, ll, fname in done:
+        print('%s: k = %.5f, m = %.3f, likelihood = %.5f' % (subns, k, m, ll))
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the fitting, offer generation and trial selection hot paths,
+on seeded synthetic data so runs are comparable. The staircase data come
+from simagents (softmax-hyperbolic agents through the stairK.py staircase)
+for several trial counts. Each case is timed repeatedly after a warm-up
+call and reported as percentiles of the wall time per call:
+
+  errorfit      one -1*loglikelihood and gradient, FitK.errorgrad
+  errorbatch    1000 (k, m) pairs in one FitK.errorfit_batch call
+  fitk          the full FitK.fitk
+  fitkgrid      FitK.fitk(grid=True)
+  incremental   IncrementalFitK.add of one trial
+  offers        genoffers.makeoffers for 1 and 100 subjects
+  ado           one ADOK.update and nextdesign (per staircase trial)
+  retarget      one designworker.Retarget call (per WMITC trial)
+
+A run can be saved as the baseline (json) and later runs compared with it:
+cases whose median is more than tol slower than the baseline are flagged
+and make the script exit with status 1. bench_baseline.json is kept with
+the scripts; store it again (--save) on a new machine or after a change
+that is meant to alter the timings. Without a baseline a warning is
+printed and nothing is compared.
+
+Usage:
+  python benchK.py --save              # write bench_baseline.json
+  python benchK.py                     # compare with it
+  python benchK.py --only fitk --trials 60 120 --repeat 10
+
+"""
+
+import json, os, re, timeit
+import numpy as np
+import FitK, genoffers, adoK, designworker, simagents
+
+ntrials = (30, 60, 120)
+baselinefile = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'bench_baseline.json')
+
+def stairdata(ntrials, seed=0):
+
+    '''
+    Staircase trial matrix of one agent (k=.02, m=.8), seeded.
+    '''
+
+    rng = np.random.RandomState(seed)
+    data, kvals = simagents.simstair([.02], [.8], ntrials, rng=rng)
+
+    return data[0]
+
+def timings(fun, repeat, warmup=1):
+
+    '''
+    Wall times in s of repeat calls of fun, after warmup untimed calls. A
+    fun that times itself (to leave out its setup) returns its time as a
+    float, which is used instead.
+    '''
+
+    clock = timeit.default_timer
+    for i in range(warmup):
+        fun()
+    times = np.zeros(repeat)
+    for i in range(repeat):
+        start = clock()
+        out = fun()
+        times[i] = clock() - start
+        if type(out) is float:
+            times[i] = out
+
+    return times
+
+def percentiles(times):
+
+    return {'n': len(times),
+            'min': float(np.min(times)),
+            'p50': float(np.percentile(times, 50)),
+            'p90': float(np.percentile(times, 90)),
+            'p99': float(np.percentile(times, 99))}
+
+def cases(trials=ntrials, seed=0):
+
+    '''
+    Benchmark cases as (name, function, repeats). Inputs are built here,
+    outside the timed functions.
+    '''
+
+    out = []
+    rng = np.random.RandomState(seed)
+    kms = np.column_stack((rng.rand(1000)*.02, rng.rand(1000)*2))
+
+    for n in trials:
+        data = stairdata(n, seed)
+        out.append(('errorfit/%d' % n,
+                    lambda data=data: FitK.errorgrad([.02, .8], data), 2000))
+        out.append(('errorbatch/%d' % n,
+                    lambda data=data: FitK.errorfit_batch(kms, data), 50))
+        out.append(('fitk/%d' % n,
+                    lambda data=data: FitK.fitk(data), 5))
+        out.append(('fitkgrid/%d' % n,
+                    lambda data=data: FitK.fitk(data, grid=True), 10))
+
+        def incremental(data=data):
+            fit = FitK.IncrementalFitK(data[:-1])
+            start = timeit.default_timer()
+            fit.add(data[-1:])
+            return timeit.default_timer() - start
+        out.append(('incremental/%d' % n, incremental, 20))
+
+    out.append(('offers/1', lambda: genoffers.makeoffers(.02, .8, rng=rng),
+                200))
+    ks, ms = rng.rand(100)*.05, .2 + rng.rand(100)*2
+    out.append(('offers/100', lambda: genoffers.makeoffers(ks, ms, rng=rng),
+                50))
+
+    # one ADO step, from a posterior that has seen a few choices
+    ado = adoK.ADOK()
+    for i in range(5):
+        ado.update(ado.nextdesign(), i % 2)
+    def adostep():
+        ado.update(ado.nextdesign(), rng.rand() < .5)
+    out.append(('ado', adostep, 100))
+
+    # one retarget call, from a history long enough to be fitting
+    # (choices of an agent, so the live fit gives an offer to check)
+    offers = genoffers.makeoffers(.02, .8, rng=np.random.RandomState(seed))
+    data = designworker.fitmatrix(np.column_stack((offers,
+                                                   np.zeros(len(offers)))))
+    choices = simagents.choose([.02], [.8], data[None,:,:4], rng)[0]
+    history = [list(o) + [float(c)] for o, c in zip(offers, choices)]
+    def retarget():
+        fun = designworker.Retarget(.02, .8)
+        fun(39, history[:39], offers[39])
+        start = timeit.default_timer()
+        poffer = fun(40, history[:40], offers[40])
+        elapsed = timeit.default_timer() - start
+        # WMITC shows the result as the second offer [pamnt pdel]
+        if np.shape(poffer) != (2,):
+            raise ValueError('Retarget returned %s, not [pamnt pdel]' %
+                             (poffer,))
+        return elapsed
+    out.append(('retarget', retarget, 20))
+
+    return out
+
+def run(trials=ntrials, only=None, repeat=None, seed=0):
+
+    '''
+    Runs every case (or those whose name matches the regular expression
+    only) and returns {name: percentiles}. repeat overrides the number of
+    calls of every case.
+    '''
+
+    results = {}
+    for name, fun, nrep in cases(trials, seed):
+        if only is not None and not re.search(only, name):
+            continue
+        nrep = nrep if repeat is None else repeat
+        results[name] = percentiles(timings(fun, nrep))
+
+    return results
+
+def savebaseline(results, fname=baselinefile):
+
+    f = open(fname, 'w')
+    json.dump(results, f, indent=1, sort_keys=True)
+    f.close()
+
+def loadbaseline(fname=baselinefile):
+
+    if not os.path.isfile(fname):
+        return None
+    f = open(fname)
+    baseline = json.load(f)
+    f.close()
+
+    return baseline
+
+def regressions(results, baseline, tol=.25):
+
+    '''
+    Names of the cases whose median is more than tol (fraction) above the
+    baseline median.
+    '''
+
+    if not baseline:
+        return []
+
+    return sorted(name for name in results if name in baseline and
+                  results[name]['p50'] > (1 + tol)*baseline[name]['p50'])
+
+def report(results, baseline=None, tol=.25):
+
+    '''
+    Table of the percentiles (ms) of every case, with the ratio to the
+    baseline median and a flag for regressions.
+    '''
+
+    slow = regressions(results, baseline, tol)
+    lines = ['%-16s %6s %10s %10s %10s %10s %8s' %
+             ('case', 'n', 'min', 'p50', 'p90', 'p99', 'vs base')]
+    for name in sorted(results):
+        r = results[name]
+        if baseline and name in baseline:
+            ratio = '%7.2fx' % (r['p50']/baseline[name]['p50'])
+        else:
+            ratio = '%8s' % '-'
+        lines.append('%-16s %6d %10.3f %10.3f %10.3f %10.3f %s%s' %
+                     (name, r['n'], 1e3*r['min'], 1e3*r['p50'], 1e3*r['p90'],
+                      1e3*r['p99'], ratio, ' SLOWER' if name in slow else ''))
+
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+
+    import argparse, sys
+
+    parser = argparse.ArgumentParser(description='Benchmark fitting, offer '
+                                     'generation and trial selection.')
+    parser.add_argument('--trials', type=int, nargs='+', default=ntrials,
+                        help='staircase trial counts')
+    parser.add_argument('--only', default=None,
+                        help='regular expression of the cases to run')
+    parser.add_argument('--repeat', type=int, default=None,
+                        help='calls per case (default per case)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=baselinefile)
+    parser.add_argument('--save', action='store_true',
+                        help='store this run as the baseline')
+    parser.add_argument('--tol', type=float, default=.25,
+                        help='slowdown of the median flagged as regression')
+    args = parser.parse_args()
+
+    results = run(args.trials, args.only, args.repeat, args.seed)
+    baseline = None if args.save else loadbaseline(args.baseline)
+    if not args.save and baseline is None:
+        sys.stderr.write('no baseline in %s, nothing to compare with (store '
+                         'one with --save)\n' % args.baseline)
+    print(report(results, baseline, args.tol))
+
+    if args.save:
+        # keep the cases of the stored baseline that were not run now
+        old = loadbaseline(args.baseline) or {}
+        old.update(results)
+        savebaseline(old, args.baseline)
+        print('baseline saved to %s' % args.baseline)
+    elif regressions(results, baseline, args.tol):
+        sys.exit(1)
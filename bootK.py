@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Bootstrap confidence intervals for the k and m fitted by FitK.
+
+Replicate data sets are either simulated from the fitted softmax-hyperbolic
+model on the same offers (parametric, the default) or resampled trials
+(resample). All replicates are fitted together. The per-trial -1*loglikelihood
+for each choice is tabulated once on a (k, m) grid, using FitK's cached
+discount factors, and a replicate only changes how often each trial enters
+with each choice. The -1*loglikelihood surfaces of all replicates are then
+two matrix products:
+
+  LL(b, k, m) = Wll(b, t) . Lll(t, k, m) + Wss(b, t) . Lss(t, k, m)
+
+The grid minimum of every replicate is polished by the batched descent of
+FitK on the (replicates x trials) data, in k and log m as in fitk.
+
+Usage:
+  kci, mci, boot = bootk(data, km)    # km = (k, m) from fitk
+  boot[:,0], boot[:,1]                # replicate estimates of k and m
+
+"""
+
+import numpy as np
+from scipy.special import expit
+import FitK
+
+def replicates(data, km, nboot, method='parametric', rng=None):
+
+    '''
+    Replicate data sets, (replicates x trials x 5), and the number of times
+    each trial enters each replicate with an ll and an ss choice.
+    '''
+
+    if rng is None:
+        rng = np.random.mtrand._rand
+
+    data = np.asarray(data, dtype=float)
+    ntrials = len(data)
+    boot = np.repeat(data[None], nboot, axis=0)
+
+    if method == 'parametric':
+        # simulate choices from the fitted model on the same offers
+        k, m = km
+        V1 = data[:,0]/(1 + k*data[:,1]) # Vss
+        V2 = data[:,2]/(1 + k*data[:,3]) # Vll
+        pll = expit(m*(V2-V1))
+        choice = (rng.rand(nboot, ntrials) < pll).astype(float)
+        boot[:,:,4] = choice
+        wll = choice
+        wss = 1 - choice
+    elif method == 'resample':
+        # draw trials with replacement
+        idx = rng.randint(0, ntrials, size=(nboot, ntrials))
+        boot = data[idx]
+        counts = np.zeros((nboot, ntrials))
+        np.add.at(counts, (np.arange(nboot)[:,None], idx), 1)
+        lls = data[:,4] == 1
+        wll = counts*lls
+        wss = counts*(1 - lls)
+    else:
+        raise ValueError('method must be parametric or resample, not %s'
+                         % method)
+
+    return boot, wll, wss
+
+def bootk(data, km, nboot=2000, method='parametric', alpha=.05, grid=None,
+          chunk=500, rng=None, mmin=1e-4):
+
+    '''
+    Bootstrap percentile confidence intervals for k and m. data is a FitK
+    trial matrix and km the fitted (k, m). grid is the (kgrid, mgrid) used
+    to start each replicate (a coarse FitK.kmgrid by default). Returns the
+    k and m intervals and the (replicates x 2) replicate estimates.
+    '''
+
+    if grid is None:
+        grid = FitK.kmgrid(61, 61)
+    kgrid, mgrid = grid
+    data = np.asarray(data, dtype=float)
+    boot, wll, wss = replicates(data, km, nboot, method, rng)
+
+    # per-trial -1*loglikelihood of each choice over the grid, (trials x grid)
+    dV = data[:,2]*FitK.discountgrid(kgrid, data[:,3]) - \
+         data[:,0]*FitK.discountgrid(kgrid, data[:,1])
+    z = dV.T[:,:,None] * np.asarray(mgrid, dtype=float)[None,None,:]
+    lll = np.logaddexp(0, -z).reshape(len(data), -1)
+    lss = np.logaddexp(0, z).reshape(len(data), -1)
+
+    # grid minimum of every replicate, a chunk of replicates at a time
+    best = np.zeros(nboot, dtype=int)
+    for row in range(0, nboot, chunk):
+        surf = wll[row:row+chunk].dot(lll) + wss[row:row+chunk].dot(lss)
+        best[row:row+chunk] = np.argmin(surf, axis=1)
+    ki, mi = np.unravel_index(best, (len(kgrid), len(mgrid)))
+    km0 = np.column_stack((kgrid[ki], mgrid[mi]))
+
+    # polish all replicates together, each on its own data, in (k, log m)
+    # as fitk does, so none stalls on the m = 0 bound
+    lbnds = ((0,1), (np.log(mmin), np.log(200)))
+    x0 = np.column_stack((km0[:,0], np.log(np.maximum(km0[:,1], mmin))))
+    x = FitK.descend(FitK.errorgrad_logm, x0, lbnds, args=(boot,))[0]
+    est = np.column_stack((x[:,0], np.exp(x[:,1])))
+
+    lo, hi = 100*alpha/2, 100*(1-alpha/2)
+    kci = np.percentile(est[:,0], [lo, hi])
+    mci = np.percentile(est[:,1], [lo, hi])
+
+    return kci, mci, est
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Catalog of the session files under a data directory, indexed by subject,
+task, run and time stamp, so scripts look files up instead of globbing a
+directory and taking whichever file comes first.
+
+Files are recognised by the names the scripts give them:
+
+  <task>_<NN>_<YYYYMMDDHHMM>.xpd            session data (stairK, WMITC)
+  <task>_<NN>_<YYYYMMDDHHMM>_<kind>.csv     logs next to it (timing, pulses,
+                                            profile, roi, betas)
+  <NN>_offers.txt                           WMITC offers of a subject
+  <NN>_fitkparams.txt                       staircase fit of a subject
+
+The run of a WMITC session is read from the run column of its first data
+row. The catalog is kept in <datadir>/.catalog.json with the modification
+time of every directory, and update() only lists the directories that
+changed since and only parses files it has not seen, so keeping it current
+costs one stat per directory. add() registers a single new file.
+
+Usage:
+  cat = Catalog(datadir).update()
+  cat.latest(1, 'stairK')                  # newest staircase .xpd of subject 1
+  cat.only(1, 'WMITC', run=2)              # error if not exactly one
+  cat.latest(1, 'WMITC', run=2, kind='timing')
+  cat.offers(1), cat.params(1)
+  python catalog.py [datadir]              # update and list
+
+"""
+
+import os, re, json, time
+import trialstore
+
+# session files and the per subject files
+sessionre = re.compile(r'^(?P<task>[A-Za-z]+)_(?P<subject>\d+)_'
+                       r'(?P<stamp>\d{12})(?:_(?P<kind>[a-z]+))?'
+                       r'\.(?P<ext>xpd|csv)$')
+subjectre = re.compile(r'^(?P<subject>\d+)_(?P<kind>offers|fitkparams)\.txt$')
+
+catalogname = '.catalog.json'
+
+def parsename(name):
+
+    '''
+    What a file name says: a dict with task, subject, stamp and kind
+    ('data' for the .xpd itself), or with subject and kind for the offers
+    and fitkparams files. None for anything else.
+    '''
+
+    match = sessionre.match(name)
+    if match:
+        kind = match.group('kind') or 'data'
+        if (match.group('ext') == 'xpd') != (kind == 'data'):
+            return None
+        return {'task': match.group('task'),
+                'subject': int(match.group('subject')),
+                'stamp': match.group('stamp'), 'kind': kind}
+    match = subjectre.match(name)
+    if match:
+        return {'subject': int(match.group('subject')),
+                'kind': match.group('kind')}
+
+    return None
+
+def readrun(fname):
+
+    '''
+    Run number from the first data row of a .xpd file, None if it has no
+    run column or no rows.
+    '''
+
+    names, nskip = trialstore.readnames(fname)
+    if 'run' not in names:
+        return None
+    f = open(fname)
+    for i, line in enumerate(f):
+        if i == nskip:
+            f.close()
+            try:
+                return int(float(line.split(',')[names.index('run')]))
+            except (ValueError, IndexError):
+                return None
+    f.close()
+
+    return None
+
+def parentof(path):
+
+    '''
+    Directory of a relative path, '.' for the top level.
+    '''
+
+    return os.path.dirname(path) or '.'
+
+class Catalog(object):
+
+    '''
+    Index of the session files under datadir. Paths are stored relative
+    to datadir and returned absolute.
+    '''
+
+    def __init__(self, datadir, fname=None):
+
+        self.datadir = os.path.abspath(datadir)
+        self.fname = fname or os.path.join(self.datadir, catalogname)
+        self.dirs = {}
+        self.files = {}
+        if os.path.isfile(self.fname):
+            f = open(self.fname)
+            saved = json.load(f)
+            f.close()
+            self.dirs = saved['dirs']
+            self.files = saved['files']
+        self.reindex()
+
+    def reindex(self):
+
+        '''
+        Builds the lookup tables from the file entries.
+        '''
+
+        self.sessionfiles = {}    # (task, subject, stamp) -> {kind: path}
+        self.runs = {}            # (task, subject, stamp) -> run
+        self.bykey = {}           # (task, subject) -> [stamps], sorted
+        self.subjectfiles = {}    # (subject, kind) -> path
+        for path in sorted(self.files):
+            self.index(path, self.files[path])
+
+    def index(self, path, entry):
+
+        if 'task' not in entry:
+            self.subjectfiles[(entry['subject'], entry['kind'])] = path
+            return
+        sess = (entry['task'], entry['subject'], entry['stamp'])
+        if sess not in self.sessionfiles:
+            self.sessionfiles[sess] = {}
+            stamps = self.bykey.setdefault(sess[:2], [])
+            stamps.append(sess[2])
+            stamps.sort()
+        self.sessionfiles[sess][entry['kind']] = path
+        if entry.get('run') is not None:
+            self.runs[sess] = entry['run']
+
+    def add(self, fname):
+
+        '''
+        Registers one file (if its name is one the catalog knows). Returns
+        True if it was added.
+        '''
+
+        full = os.path.abspath(fname)
+        path = os.path.relpath(full, self.datadir)
+        entry = parsename(os.path.basename(full))
+        if entry is None or not os.path.isfile(full):
+            return False
+        if entry['kind'] == 'data':
+            entry['run'] = readrun(full)
+        self.files[path] = entry
+        self.index(path, entry)
+
+        return True
+
+    def scandir(self, rel, now):
+
+        '''
+        Lists one directory: adds its new files, drops the ones that are
+        gone and returns its subdirectories.
+        '''
+
+        full = os.path.join(self.datadir, rel)
+        names = os.listdir(full)
+        prefix = '' if rel == '.' else rel + os.sep
+        present = set()
+        subdirs = []
+        for name in names:
+            if name.startswith('.'):
+                continue
+            path = os.path.normpath(prefix + name)
+            if os.path.isdir(os.path.join(full, name)):
+                subdirs.append(path)
+            else:
+                present.add(path)
+                if path not in self.files:
+                    self.add(os.path.join(full, name))
+        for path in [p for p in self.files if parentof(p) == rel]:
+            if path not in present:
+                del self.files[path]
+        self.dirs[rel] = [os.path.getmtime(full), now]
+
+        return subdirs
+
+    def update(self, save=True):
+
+        '''
+        Brings the catalog up to date. Only directories whose modification
+        time changed (or that changed within a second of the last scan, so
+        that a file written right after it is not missed) are listed again.
+        Returns the catalog.
+        '''
+
+        now = time.time()
+        changed = False
+        todo = ['.']
+        seen = set()
+        while todo:
+            rel = todo.pop()
+            seen.add(rel)
+            full = os.path.join(self.datadir, rel)
+            if not os.path.isdir(full):
+                continue
+            mtime = os.path.getmtime(full)
+            known = self.dirs.get(rel)
+            if known is None or known[0] != mtime or known[1] - mtime < 1:
+                subdirs = self.scandir(rel, now)
+                changed = True
+            else:
+                subdirs = [d for d in self.dirs
+                           if d != '.' and parentof(d) == rel]
+            todo.extend(d for d in subdirs if d not in seen)
+
+        # directories that are gone, and their files
+        for rel in [d for d in self.dirs if d not in seen or
+                    not os.path.isdir(os.path.join(self.datadir, d))]:
+            del self.dirs[rel]
+            for path in [p for p in self.files if parentof(p) == rel]:
+                del self.files[path]
+            changed = True
+
+        if changed:
+            self.reindex()
+            if save:
+                self.save()
+
+        return self
+
+    def save(self):
+
+        tmp = self.fname + '.tmp'
+        f = open(tmp, 'w')
+        json.dump({'dirs': self.dirs, 'files': self.files}, f)
+        f.close()
+        os.rename(tmp, self.fname)
+
+    def fullpath(self, path):
+
+        return None if path is None else os.path.join(self.datadir, path)
+
+    def sessions(self, subject, task, run=None):
+
+        '''
+        Time stamps of a subject's sessions of a task (with run, only that
+        run), oldest first.
+        '''
+
+        stamps = self.bykey.get((task, int(subject)), [])
+        if run is None:
+            return list(stamps)
+
+        return [s for s in stamps
+                if self.runs.get((task, int(subject), s)) == run]
+
+    def file(self, subject, task, stamp, kind='data'):
+
+        return self.fullpath(self.sessionfiles.get(
+            (task, int(subject), stamp), {}).get(kind))
+
+    def latest(self, subject, task, run=None, kind='data'):
+
+        '''
+        The file of kind of the newest matching session, or None.
+        '''
+
+        stamps = self.sessions(subject, task, run)
+        if not stamps:
+            return None
+
+        return self.file(subject, task, stamps[-1], kind)
+
+    def only(self, subject, task, run=None, kind='data'):
+
+        '''
+        Like latest, but raises ValueError unless exactly one session
+        matches.
+        '''
+
+        stamps = self.sessions(subject, task, run)
+        if len(stamps) != 1:
+            raise ValueError('%d %s sessions of subject %s%s' %
+                             (len(stamps), task, subject,
+                              '' if run is None else ' run %s' % run))
+
+        return self.file(subject, task, stamps[0], kind)
+
+    def subjects(self, task=None, kind=None):
+
+        '''
+        Subjects with sessions of task, or with offers/fitkparams files.
+        '''
+
+        if kind is not None:
+            return sorted(s for s, k in self.subjectfiles if k == kind)
+
+        return sorted(set(s for t, s in self.bykey
+                          if task is None or t == task))
+
+    def offers(self, subject):
+
+        return self.fullpath(self.subjectfiles.get((int(subject), 'offers')))
+
+    def params(self, subject):
+
+        return self.fullpath(self.subjectfiles.get((int(subject),
+                                                    'fitkparams')))
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Update and list the '
+                                     'session catalog of a data directory.')
+    parser.add_argument('datadir', nargs='?', default='data')
+    args = parser.parse_args()
+
+    cat = Catalog(args.datadir).update()
+    for task, subject in sorted(cat.bykey):
+        for stamp in cat.sessions(subject, task):
+            run = cat.runs.get((task, subject, stamp))
+            kinds = sorted(cat.sessionfiles[(task, subject, stamp)])
+            print('%-8s %02d %s run %s: %s' % (task, subject, stamp,
+                                                '-' if run is None else run,
+                                                ', '.join(kinds)))
+    for subject in cat.subjects(kind='offers'):
+        print('offers   %02d %s' % (subject, cat.offers(subject)))
+    for subject in cat.subjects(kind='fitkparams'):
+        print('fitted   %02d %s' % (subject, cat.params(subject)))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Background computation of the next trial's offer. Each WMITC trial has a 6 s
+delay and a 2-3 s ITI in which the main thread only waits, so the adaptive
+work (refitting, ADO scoring, neural feedback) runs in a worker thread
+during those windows: the loop requests the next trial's offer right after a
+response and picks up the result before it is needed. If the result is not
+ready by the deadline, the loop uses the pre-generated row from _offers.txt,
+so adaptation never delays a presentation.
+
+The worker runs any function compute(trial, *args) that returns the second
+offer of the trial [pamnt pdel], or None to keep the pre-generated one. Retarget is
+the one used by WMITC.py: it keeps a live fit of (k, m) on the choices made
+so far and recomputes the adjusted amount so that the offer keeps the
+choice probability it was generated for.
+
+Usage:
+  worker = DesignWorker(Retarget(k0, m0))
+  worker.start()
+  worker.request(trial+1, history, offers[trial+1])
+  poffer, adapted = worker.get(trial+1, offers[trial+1,2:], timeout=.5)
+  worker.close()
+
+"""
+
+import threading, time
+import numpy as np
+from scipy.special import expit
+import FitK
+
+class DesignWorker(object):
+
+    '''
+    Single worker thread computing offers on request. Only the latest
+    request is kept: an older one that has not started is dropped.
+    '''
+
+    def __init__(self, compute):
+
+        self.compute = compute
+        self.cond = threading.Condition()
+        self.job = None
+        self.results = {}
+        self.errors = {}
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+
+        self.thread.start()
+
+    def request(self, trial, *args):
+
+        '''
+        Asks for the offer of trial, computed as compute(trial, *args).
+        '''
+
+        with self.cond:
+            self.job = (trial, args)
+            self.cond.notify_all()
+
+    def run(self):
+
+        while True:
+            with self.cond:
+                while self.job is None and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                trial, args = self.job
+                self.job = None
+            try:
+                result = self.compute(trial, *args)
+            except Exception as err:
+                result = None
+                self.errors[trial] = err
+            with self.cond:
+                self.results[trial] = result
+                self.cond.notify_all()
+
+    def get(self, trial, fallback, timeout=0):
+
+        '''
+        Returns the offer computed for trial, waiting at most timeout s,
+        and whether it came from the worker. Falls back to fallback if the
+        worker missed the deadline or had nothing to offer. Late results of
+        earlier trials are dropped.
+        '''
+
+        # Condition.wait_for is python 3 only, the task scripts are python 2
+        deadline = time.time() + timeout
+        with self.cond:
+            while trial not in self.results:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            result = self.results.pop(trial, None)
+
+            # results that came in after their trial's deadline
+            for old in [t for t in self.results if t < trial]:
+                del self.results[old]
+                self.errors.pop(old, None)
+
+        if result is None:
+            return np.asarray(fallback), False
+
+        return np.asarray(result), True
+
+    def close(self):
+
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.thread.join(1)
+
+def fitmatrix(history):
+
+    '''
+    FitK trial matrix [ss amount, ss delay, ll amount, ll delay, choice]
+    from WMITC rows [famnt fdel pamnt pdel choice] (choice 1 for ll). The
+    option with the longer delay is the ll. Trials without a choice are
+    dropped.
+    '''
+
+    history = np.atleast_2d(np.asarray(history, dtype=float))
+    history = history[np.isfinite(history[:,4])]
+    fll = history[:,1] > history[:,3]
+    ss = np.where(fll[:,None], history[:,2:4], history[:,0:2])
+    ll = np.where(fll[:,None], history[:,0:2], history[:,2:4])
+
+    return np.column_stack((ss, ll, history[:,4]))
+
+def adjustamount(offer, p, k, m):
+
+    '''
+    Adjusted amount that gives the offer [famnt fdel pamnt pdel] a choice
+    probability p(ll) under (k, m), as in Gen_WMITC_offers.py.
+    '''
+
+    famnt, fdel, pamnt, pdel = offer
+    svf = famnt/(1+k*fdel)                       # hyperbolic discounted value
+    if fdel > pdel:
+        psv = svf + np.log(1/p-1)/m              # softmax value for ss
+    else:
+        psv = svf - np.log(1/p-1)/m              # softmax value for ll
+
+    return round(psv + psv*k*pdel, 2)
+
+class Retarget(object):
+
+    '''
+    Re-adjusts pre-generated offers so they keep the p(ll) they had under
+    the staircase fit (k0, m0), using a live fit of the run's choices
+    (FitK.IncrementalFitK) that is updated with only the new trials on
+    each call. Returns the second offer [pamnt pdel] with the new amount,
+    or None until minfit choices are available or if the new amount is not
+    positive.
+    '''
+
+    def __init__(self, k0, m0, minfit=10):
+
+        self.k0 = k0
+        self.m0 = m0
+        self.minfit = minfit
+        self.fit = FitK.IncrementalFitK(km0=(k0, m0))
+        self.nhist = 0
+
+    def __call__(self, trial, history, offer):
+
+        # add only the trials the live fit has not seen
+        data = fitmatrix(history[self.nhist:]) if len(history) > self.nhist \
+               else np.zeros((0, 5))
+        self.nhist = len(history)
+        if len(data):
+            self.fit.add(data)
+        if self.fit.n < self.minfit:
+            return None
+
+        k0, m0 = self.k0, self.m0
+        famnt, fdel, pamnt, pdel = offer
+        if fdel > pdel:
+            dv = famnt/(1+k0*fdel) - pamnt/(1+k0*pdel)
+        else:
+            dv = pamnt/(1+k0*pdel) - famnt/(1+k0*fdel)
+        p = np.clip(expit(m0*dv), 1e-3, 1-1e-3)
+
+        k, m = self.fit.km
+        if m <= 0:
+            return None
+        amount = adjustamount(offer, p, k, m)
+        if amount <= 0:
+            return None
+
+        return [amount, pdel]
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fits several discount functions to the same trial matrix in one pass and
+reports them side by side. Every model is a discount factor D(d) with its
+own parameters; the softmax choice rule, the batched starts-descent and the
+pruning of FitK (descend, uniqueoptima) and the L-BFGS-B polish are shared,
+so a new model only needs its discount factor and the derivatives of it.
+
+  hyperbolic    V = r/(1+k*d)             params k, m
+  exponential   V = r*exp(-k*d)           params k, m
+  hyperboloid   V = r/(1+k*d)**s          params k, s, m
+
+m is the softmax slope, the last parameter of every model. The data are
+passed explicitly everywhere (no module state), so fits can run in threads
+or processes at the same time. fitmodels fits the models in parallel worker
+processes and returns one result per model with the loglikelihood, AIC and
+BIC; lrtest compares nested models (hyperbolic is hyperboloid with s=1).
+
+Usage:
+  res = fitmodels(data)                     # data as for FitK
+  print(report(res))
+  stat, df, p = lrtest(res[0], res[2])      # hyperbolic vs hyperboloid
+
+  python discmodels.py file.xpd
+
+"""
+
+import numpy as np
+from scipy import optimize, stats
+from scipy.special import expit
+import FitK
+
+class Hyperbolic(object):
+
+    '''
+    V = r/(1+k*d), as in FitK.
+    '''
+
+    name = 'hyperbolic'
+    params = ('k', 'm')
+    bounds = ((0,1), (0,200))
+
+    def starts(self, n, rng):
+
+        return np.column_stack((rng.rand(n)*.02, rng.rand(n)*2))
+
+    def discount(self, theta, delay):
+
+        '''
+        Discount factors at delay (starts x trials) and their derivatives
+        with respect to each discount parameter in theta (starts x 1).
+        '''
+
+        D = 1/(1 + theta[:,0:1]*delay)
+
+        return D, [-delay*D**2]
+
+class Exponential(object):
+
+    '''
+    V = r*exp(-k*d).
+    '''
+
+    name = 'exponential'
+    params = ('k', 'm')
+    bounds = ((0,1), (0,200))
+
+    def starts(self, n, rng):
+
+        return np.column_stack((rng.rand(n)*.02, rng.rand(n)*2))
+
+    def discount(self, theta, delay):
+
+        D = np.exp(-theta[:,0:1]*delay)
+
+        return D, [-delay*D]
+
+class Hyperboloid(object):
+
+    '''
+    V = r/(1+k*d)**s (Green & Myerson). s=1 is the hyperbolic model.
+    '''
+
+    name = 'hyperboloid'
+    params = ('k', 's', 'm')
+    bounds = ((0,1), (.01,10), (0,200))
+
+    def starts(self, n, rng):
+
+        return np.column_stack((rng.rand(n)*.02, .2 + rng.rand(n)*2,
+                                rng.rand(n)*2))
+
+    def discount(self, theta, delay):
+
+        k = theta[:,0:1]
+        s = theta[:,1:2]
+        logbase = np.log1p(k*delay)
+        D = np.exp(-s*logbase)
+
+        return D, [-s*delay*D/(1 + k*delay), -logbase*D]
+
+# fitted by fitmodels unless told otherwise
+models = (Hyperbolic(), Exponential(), Hyperboloid())
+
+def modelgrad(theta, data, model):
+
+    '''
+    Batched -1*loglikelihood of the softmax fit of model, and its exact
+    gradient, for one parameter vector per row of theta. data is a single
+    FitK trial matrix or one per row of theta. Same softplus form as
+    FitK.errorgrad_batch, so saturated choices cost a finite penalty.
+    '''
+
+    theta = np.atleast_2d(np.asarray(theta, dtype=float))
+    m = theta[:,-1:]
+
+    D1, dD1 = model.discount(theta[:,:-1], data[...,1])
+    D2, dD2 = model.discount(theta[:,:-1], data[...,3])
+    dV = data[...,2]*D2 - data[...,0]*D1
+
+    # signed softmax argument, ll=1
+    s = np.where(data[...,4] == 1, 1., -1.)
+    z = -s*m*dV
+    loglik = np.sum(np.logaddexp(0, z), axis=-1)
+    dz = -s*expit(z)
+
+    g = [np.sum(dz*m*(data[...,2]*g2 - data[...,0]*g1), axis=-1)
+         for g1, g2 in zip(dD1, dD2)]
+    g.append(np.sum(dz*dV, axis=-1))
+
+    return loglik, np.column_stack(g)
+
+def logmgrad(x, data, model):
+
+    '''
+    modelgrad with the last column of x holding log m, the gradient with
+    respect to log m in that column (as FitK.errorgrad_logm).
+    '''
+
+    x = np.atleast_2d(x)
+    theta = np.column_stack((x[:,:-1], np.exp(x[:,-1])))
+    f, g = modelgrad(theta, data, model)
+    g[:,-1] = g[:,-1]*theta[:,-1]
+
+    return f, g
+
+def fitmodel(data, model, nstarts=1000, npolish=5, maxiter=100, rng=None,
+             mmin=1e-4):
+
+    '''
+    Fits one model like FitK.fitk: batched descent from nstarts random
+    starts, pruning of repeated optima and an L-BFGS-B polish of the best
+    npolish. As in fitk the descent runs in log m, so starts do not stall on
+    the m = 0 bound. It is stopped after maxiter steps, which is enough to
+    find the basins; the polish finishes along flat ridges such as the
+    k-s ridge of the hyperboloid. Returns a dict with the parameters, the
+    loglikelihood, the number of parameters, AIC, BIC and the optimizer
+    result.
+    '''
+
+    if rng is None:
+        rng = np.random.RandomState()
+
+    data = np.asarray(data, dtype=float)
+    bnds = model.bounds
+
+    lbnds = bnds[:-1] + ((np.log(mmin), np.log(bnds[-1][1])),)
+    x0 = model.starts(nstarts, rng)
+    x0[:,-1] = np.log(np.maximum(x0[:,-1], mmin))
+    x, lls = FitK.descend(logmgrad, x0, lbnds, args=(data, model),
+                          maxiter=maxiter)
+    x, lls = FitK.uniqueoptima(x, lls, lbnds)
+    theta = np.column_stack((x[:,:-1], np.exp(x[:,-1])))
+
+    def objective(th):
+        f, g = modelgrad(th, data, model)
+        return f[0], g[0]
+
+    best = None
+    opts = {'maxiter':10000, 'ftol':1e-12, 'gtol':1e-8}
+    for th in theta[:npolish]:
+        res = optimize.minimize(objective, th, jac=True, bounds=bnds,
+                                options=opts, method='L-BFGS-B')
+        if best is None or res.fun < best.fun:
+            best = res
+
+    LL = -1*float(best.fun)
+    npar = len(model.params)
+    ntrials = len(data)
+
+    return {'model': model.name,
+            'params': dict(zip(model.params, best.x)),
+            'LL': LL,
+            'npar': npar,
+            'ntrials': ntrials,
+            'AIC': 2*npar - 2*LL,
+            'BIC': npar*np.log(ntrials) - 2*LL,
+            'res': best}
+
+def _fitjob(job):
+
+    data, model, nstarts, npolish, seed = job
+
+    return fitmodel(data, model, nstarts, npolish,
+                    rng=np.random.RandomState(seed))
+
+def fitmodels(data, models=models, nstarts=1000, npolish=5, procs=None,
+              seed=None):
+
+    '''
+    Fits every model to the same data, one worker process per model
+    (procs=1 fits them in this process). Returns the fitmodel results in
+    the order of models.
+    '''
+
+    import multiprocessing
+
+    data = np.asarray(data, dtype=float)
+    seeds = np.random.RandomState(seed).randint(2**31 - 1, size=len(models))
+    jobs = [(data, model, nstarts, npolish, sd)
+            for model, sd in zip(models, seeds)]
+
+    if procs is None:
+        procs = min(len(jobs), multiprocessing.cpu_count())
+    if procs <= 1:
+        return [_fitjob(job) for job in jobs]
+
+    pool = multiprocessing.Pool(procs)
+    try:
+        results = pool.map(_fitjob, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+def lrtest(nested, full):
+
+    '''
+    Likelihood-ratio test of a nested model against the fuller one (e.g.
+    hyperbolic against hyperboloid). Returns the statistic, the degrees of
+    freedom and the chi-square p value.
+    '''
+
+    stat = max(2*(full['LL'] - nested['LL']), 0.)
+    df = full['npar'] - nested['npar']
+
+    return stat, df, stats.chi2.sf(stat, df)
+
+def report(results):
+
+    '''
+    Table of the fits, one model per line, with the best AIC and BIC
+    marked.
+    '''
+
+    aic = min(r['AIC'] for r in results)
+    bic = min(r['BIC'] for r in results)
+    lines = ['%-12s %-36s %10s %4s %10s %10s' %
+             ('model', 'params', 'LL', 'npar', 'AIC', 'BIC')]
+    for r in results:
+        params = ' '.join('%s=%.4g' % (p, r['params'][p])
+                          for p in sorted(r['params'], key=lambda p: p == 'm'))
+        lines.append('%-12s %-36s %10.3f %4d %10.3f%s %10.3f%s' %
+                     (r['model'], params, r['LL'], r['npar'],
+                      r['AIC'], '*' if r['AIC'] == aic else ' ',
+                      r['BIC'], '*' if r['BIC'] == bic else ' '))
+
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+
+    import argparse
+    import trialstore
+
+    parser = argparse.ArgumentParser(description='Fit hyperbolic, '
+                                     'exponential and hyperboloid discounting '
+                                     'to a staircase data file.')
+    parser.add_argument('fname', help='stairK .xpd file')
+    parser.add_argument('--procs', type=int, default=None,
+                        help='worker processes (default one per model)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    data = trialstore.fitmatrix(trialstore.load(args.fname))
+    results = fitmodels(data, procs=args.procs, seed=args.seed)
+    print(report(results))
+    byname = dict((r['model'], r) for r in results)
+    if 'hyperbolic' in byname and 'hyperboloid' in byname:
+        stat, df, p = lrtest(byname['hyperbolic'], byname['hyperboloid'])
+        print('hyperbolic vs hyperboloid: chi2(%d) = %.3f, p = %.4g'
+              % (df, stat, p))
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local fitting service. A long-running process keeps numpy, scipy and the
+fitting modules loaded (and warmed up by one fit at start) and takes jobs
+over a Unix socket, so scripts on the stimulus machine get a fit or a set
+of offers back without starting a new interpreter. Requests from several
+clients are queued and run by a fixed number of worker threads; results
+are cached by a hash of the job, its parameters and its data, so asking
+again for the same fit returns at once. Offers without a seed are random
+and never cached.
+
+Jobs:
+  fit       data (FitK trial matrix), grid  -> k, m, ll
+  fitfile   fname (staircase .xpd), grid    -> k, m, ll
+  offers    k, m, seed, offer parameters    -> offers [famnt fdel pamnt pdel]
+  ping                                      -> pid, jobs done, cache size
+  stop                                      -> shuts the service down
+
+Each request and reply is one line of JSON. Replies are {"ok": true,
+"result": ..., "cached": ...} or {"ok": false, "error": ...}.
+
+Usage:
+  python fitserver.py [--socket /tmp/fitK.sock] [--workers 1]
+
+  client = FitClient()
+  k, m, ll = client.fit(data)
+  offers = client.offers(k, m, seed=1)
+  k, m, ll = remotefit(data)    # in-process FitK.fitk if no service runs
+
+"""
+
+import os, json, hashlib, socket, threading
+from collections import OrderedDict
+import numpy as np
+import FitK, genoffers, trialstore
+
+try:
+    import socketserver
+    import queue
+except ImportError:
+    import SocketServer as socketserver
+    import Queue as queue
+
+sockpath = '/tmp/fitK.sock'
+
+def jobkey(job, args, data=None):
+
+    '''
+    Cache key of a job: its name and parameters, and the bytes of its data
+    as float64.
+    '''
+
+    h = hashlib.sha1(json.dumps([job, args], sort_keys=True).encode())
+    if data is not None:
+        h.update(np.ascontiguousarray(data, dtype=float).tobytes())
+
+    return h.hexdigest()
+
+def runfit(data, grid=False):
+
+    k, m, ll, res = FitK.fitk(np.asarray(data, dtype=float), grid=grid)
+
+    return [float(k), float(m), float(ll)]
+
+def runoffers(k, m, seed=None, **params):
+
+    offers = genoffers.makeoffers(k, m, rng=np.random.RandomState(seed),
+                                  **params)
+
+    return offers.tolist()
+
+class FitService(object):
+
+    '''
+    Job queue, workers and result cache. Jobs are dicts as sent by clients;
+    submit blocks until the job is done and returns the reply dict.
+    '''
+
+    def __init__(self, workers=1, cachesize=256):
+
+        self.jobs = queue.Queue()
+        self.cache = OrderedDict()
+        self.cachesize = cachesize
+        self.lock = threading.Lock()
+        self.ndone = 0
+        self.threads = [threading.Thread(target=self.work)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def work(self):
+
+        while True:
+            request, reply, done = self.jobs.get()
+            try:
+                reply.update(self.run(request))
+            except Exception as err:
+                reply.update({'ok': False, 'error': '%s: %s' %
+                              (type(err).__name__, err)})
+            done.set()
+
+    def run(self, request):
+
+        '''
+        Runs one job, or returns its cached result.
+        '''
+
+        request = dict(request)
+        job = request.pop('job')
+        data = request.pop('data', None)
+
+        if job == 'fitfile':
+            data = trialstore.fitmatrix(trialstore.load(request.pop('fname')))
+            job = 'fit'
+
+        # offers without a seed are meant to be new every time
+        cacheable = job != 'offers' or request.get('seed') is not None
+        key = jobkey(job, request, data)
+        with self.lock:
+            if cacheable and key in self.cache:
+                self.cache[key] = self.cache.pop(key)
+                return {'ok': True, 'result': self.cache[key], 'cached': True}
+
+        if job == 'fit':
+            result = runfit(data, **request)
+        elif job == 'offers':
+            result = runoffers(**request)
+        else:
+            raise ValueError('unknown job %s' % job)
+
+        with self.lock:
+            if cacheable:
+                self.cache[key] = result
+                while len(self.cache) > self.cachesize:
+                    self.cache.popitem(last=False)
+            self.ndone = self.ndone + 1
+
+        return {'ok': True, 'result': result, 'cached': False}
+
+    def submit(self, request):
+
+        reply, done = {}, threading.Event()
+        self.jobs.put((request, reply, done))
+        done.wait()
+
+        return reply
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+
+        for line in self.rfile:
+            request = json.loads(line.decode())
+            job = request.get('job')
+            if job == 'ping':
+                reply = {'ok': True, 'result': {'pid': os.getpid(),
+                         'done': self.server.service.ndone,
+                         'cached': len(self.server.service.cache)}}
+            elif job == 'stop':
+                reply = {'ok': True, 'result': None}
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                reply = self.server.service.submit(request)
+            self.wfile.write((json.dumps(reply) + '\n').encode())
+            self.wfile.flush()
+
+class FitServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+def serve(path=sockpath, workers=1, cachesize=256, warm=True):
+
+    '''
+    Runs the service on the Unix socket path until a stop job arrives.
+    A stale socket file left by a dead service is replaced.
+    '''
+
+    if os.path.exists(path):
+        if FitClient(path).alive():
+            raise RuntimeError('a fitting service is already running on %s'
+                               % path)
+        os.remove(path)
+
+    if warm:
+        # load and exercise the whole fitting path once
+        rng = np.random.RandomState(0)
+        data = np.column_stack((np.full(20, 10.), rng.randint(0, 16, 20),
+                                rng.uniform(10, 30, 20),
+                                rng.randint(16, 46, 20),
+                                rng.randint(0, 2, 20)))
+        runfit(data)
+        runfit(data, grid=True)
+        runoffers(.02, .8)
+
+    server = FitServer(path, Handler)
+    server.service = FitService(workers, cachesize)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+class FitClient(object):
+
+    '''
+    Client of the fitting service. One connection per request.
+    '''
+
+    def __init__(self, path=sockpath, timeout=None):
+
+        self.path = path
+        self.timeout = timeout
+
+    def call(self, job, **args):
+
+        '''
+        Sends one job and returns its result. Raises RuntimeError with the
+        service's message if the job failed.
+        '''
+
+        args['job'] = job
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+            sock.sendall((json.dumps(args) + '\n').encode())
+            reply = json.loads(sock.makefile('rb').readline().decode())
+        finally:
+            sock.close()
+
+        if not reply['ok']:
+            raise RuntimeError(reply['error'])
+
+        return reply['result']
+
+    def alive(self):
+
+        try:
+            self.call('ping')
+        except (socket.error, ValueError):
+            return False
+
+        return True
+
+    def fit(self, data, grid=False):
+
+        data = np.asarray(data, dtype=float).tolist()
+
+        return tuple(self.call('fit', data=data, grid=grid))
+
+    def fitfile(self, fname, grid=False):
+
+        return tuple(self.call('fitfile', fname=os.path.abspath(fname),
+                               grid=grid))
+
+    def offers(self, k, m, seed=None, **params):
+
+        return np.array(self.call('offers', k=float(k), m=float(m),
+                                  seed=seed, **params))
+
+    def stop(self):
+
+        self.call('stop')
+
+def remotefit(data, grid=False, path=sockpath):
+
+    '''
+    k, m and loglikelihood from the fitting service if it is running,
+    otherwise from FitK.fitk in this process.
+    '''
+
+    client = FitClient(path)
+    try:
+        return client.fit(data, grid)
+    except socket.error:
+        return tuple(runfit(data, grid))
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the local fitting '
+                                     'service.')
+    parser.add_argument('--socket', default=sockpath)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='jobs run at the same time')
+    parser.add_argument('--cache', type=int, default=256,
+                        help='results kept in the cache')
+    parser.add_argument('--stop', action='store_true',
+                        help='stop the service running on --socket')
+    args = parser.parse_args()
+
+    if args.stop:
+        FitClient(args.socket).stop()
+    else:
+        serve(args.socket, args.workers, args.cache)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Offer generation for the WMITC task, for any number of subjects at once.
+The offers are built as in 'Gen_WMITC_offers.py' (see there for the design):
+half the trials have a fixed SS and a probability adjusted LL, the other
+half a fixed LL and a probability adjusted SS, with the adjusted amount set
+so that a softmax-hyperbolic chooser with the subject's (k, m) picks the LL
+with probability pll. Here every row of every subject is computed in single
+array operations, (subjects x trials), from arrays of k and m.
+
+Usage:
+  offers = makeoffers(k, m)        # (subjects x 160 x 4), or (160 x 4)
+  python genoffers.py [paramsdir] [offersdir] [--seed N]
+      writes NN_offers.txt for every fitted subject in paramsdir
+
+"""
+
+import os, argparse
+import numpy as np
+import catalog, trialstore
+
+# default parameters, as in Gen_WMITC_offers.py
+ssa  = 20
+ssd1 = 0
+ssd2 = 15
+lla  = 40
+lld1 = 15
+lld2 = 60
+pll  = [.1, .4, .6, .9]
+tsperbin = 40
+
+paramsdir = '/Users/christianrodriguez/Dropbox/Python/data/fitted'
+offersdir = '/Users/christianrodriguez/Dropbox/Python/data/offers'
+
+def makeoffers(k, m, ssa=ssa, ssd1=ssd1, ssd2=ssd2, lla=lla, lld1=lld1,
+               lld2=lld2, pll=pll, tsperbin=tsperbin, rng=None):
+
+    '''
+    Generates the shuffled offer table [famnt fdelay pamnt pdelay] for every
+    (k, m) pair. k and m are scalars or equal length arrays; the result is
+    (subjects x trials x 4), or (trials x 4) for scalars. rng is a
+    numpy RandomState (the global numpy random state by default).
+    '''
+
+    if rng is None:
+        rng = np.random.mtrand._rand
+
+    scalar = np.ndim(k) == 0
+    k = np.atleast_1d(np.asarray(k, dtype=float))[:,None]
+    m = np.atleast_1d(np.asarray(m, dtype=float))[:,None]
+    nsub = len(k)
+    nbin = tsperbin*2
+
+    # fixed offers, the first half of each kind at the shorter delay
+    fssd = np.repeat([ssd1, ssd2], tsperbin).astype(float)
+    flld = np.repeat([lld1, lld2], tsperbin).astype(float)
+
+    # target p(ll) for each row, and the value offset that produces it
+    ps = np.tile(pll, nbin//len(pll))
+    dv = np.log(1/ps-1)/m                                 # (subjects x rows)
+
+    # fixed ss trials: adjust the ll amount at a random delay
+    svss  = ssa/(1+k*fssd)                       # hyperbolic discounted value
+    psvll = svss - dv                            # softmax value for ll
+    # add a day to the minimum p adjusted ll, to prevent trivial offers
+    pssd  = rng.randint(lld1+1, lld2, size=(nsub, nbin)).astype(float)
+    pssa  = np.round(psvll + psvll*k*pssd, 2)
+
+    # fixed ll trials: adjust the ss amount at a random delay
+    svll  = lla/(1+k*flld)
+    psvss = svll + dv
+    plld  = rng.randint(ssd1, ssd2, size=(nsub, nbin)).astype(float)
+    plla  = np.round(psvss + psvss*k*plld, 2)
+
+    fss = np.stack((np.full((nsub, nbin), float(ssa)),
+                    np.broadcast_to(fssd, (nsub, nbin)), pssa, pssd), -1)
+    fll = np.stack((np.full((nsub, nbin), float(lla)),
+                    np.broadcast_to(flld, (nsub, nbin)), plla, plld), -1)
+    offers = np.concatenate((fss, fll), 1)
+
+    # shuffle the rows of each subject independently
+    order = np.argsort(rng.rand(nsub, offers.shape[1]), axis=1)
+    offers = np.take_along_axis(offers, order[:,:,None], axis=1)
+
+    return offers[0] if scalar else offers
+
+def saveoffers(fname, offers):
+
+    '''
+    Writes one subject's offer table in the format WMITC.py reads.
+    '''
+
+    trialstore.writeoffers(fname, offers)
+
+def readfits(paramsdir):
+
+    '''
+    Reads fitted parameters for every subject in paramsdir, from the table
+    written by batchFitK.py and from every NN_fitkparams.txt in the session
+    catalog (see catalog.py). Where both have a subject, the newer file
+    wins. Returns subject number strings and arrays of k and m, sorted by
+    subject.
+    '''
+
+    fits = {}    # subject -> (mtime, k, m)
+    allfile = '%s/fitkparams_all.txt' % paramsdir
+    if os.path.isfile(allfile):
+        mtime = os.path.getmtime(allfile)
+        for line in open(allfile).readlines()[1:]:
+            cols = [c.strip() for c in line.split(',')]
+            fits[int(cols[0])] = (mtime, float(cols[1]), float(cols[2]))
+
+    cat = catalog.Catalog(paramsdir).update()
+    for subj in cat.subjects(kind='fitkparams'):
+        fname = cat.params(subj)
+        mtime = os.path.getmtime(fname)
+        if subj in fits and fits[subj][0] > mtime:
+            continue
+        k, m, ll = trialstore.readparams(fname)
+        fits[subj] = (mtime, k, m)
+
+    subjs = sorted(fits)
+
+    return ['%02d' % subj for subj in subjs], \
+           np.array([fits[subj][1] for subj in subjs]), \
+           np.array([fits[subj][2] for subj in subjs])
+
+def writeall(paramsdir=paramsdir, offersdir=offersdir, rng=None, **params):
+
+    '''
+    Generates and writes NN_offers.txt for every fitted subject in one pass.
+    Extra keyword arguments override the offer parameters of makeoffers.
+    Returns the subject numbers written.
+    '''
+
+    if not os.path.isdir(offersdir):
+        os.mkdir(offersdir)
+
+    subns, k, m = readfits(paramsdir)
+    if not subns:
+        return subns
+    offers = makeoffers(k, m, rng=rng, **params)
+    for subn, subo in zip(subns, offers):
+        saveoffers('%s/%s_offers.txt' % (offersdir, subn), subo)
+
+    return subns
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Write WMITC offers for '
+                                     'every fitted subject.')
+    parser.add_argument('paramsdir', nargs='?', default=paramsdir)
+    parser.add_argument('offersdir', nargs='?', default=offersdir)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    subns = writeall(args.paramsdir, args.offersdir,
+                     np.random.RandomState(args.seed))
+    print('wrote offers for %d subjects: %s' % (len(subns), ', '.join(subns)))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Hierarchical fit of k and m for a whole group of subjects at once. Each
+subject's log k and log m are drawn from a normal population prior with
+mean mu and sd sd (per parameter), and mu and sd are estimated from the
+group by expectation-maximization with a Laplace approximation:
+
+  E: every subject's posterior mode of (log k, log m) under the current
+     prior, for all subjects together with FitK's batched descent, and its
+     posterior covariance from the Hessian at the mode
+  M: mu = mean of the modes, sd**2 = mean of (mode - mu)**2 + variance
+
+Subjects with few or inconsistent choices are pulled towards the group,
+so short staircases give less noisy k. The trial matrices of all subjects
+are stacked into one zero-padded (subjects x trials x 5) array: a padded
+trial has no amounts, so it adds a constant log(2) and no gradient, and
+that constant is removed again. The first E step starts from each
+subject's best point on a coarse (k, m) grid (simagents.fitagents).
+
+Usage:
+  fit = groupfit([data1, data2, ...])     # FitK trial matrices
+  fit['k'], fit['m']                      # shrunken estimates per subject
+  fit['kgroup'], fit['mgroup'], fit['sd'] # population median k, m and sd
+
+"""
+
+import numpy as np
+import FitK, simagents
+
+# bounds of log k and log m, as the fitk bounds with 0 moved off
+bnds = ((np.log(1e-6), 0.), (np.log(1e-4), np.log(200.)))
+
+def stackpad(datas):
+
+    '''
+    Stacks trial matrices of different lengths into one zero-padded
+    (subjects x max trials x 5) array. Returns it and the number of padded
+    trials per subject.
+    '''
+
+    ntrials = np.array([len(d) for d in datas])
+    data = np.zeros((len(datas), ntrials.max(), 5))
+    for i, d in enumerate(datas):
+        data[i,:len(d)] = d
+
+    return data, ntrials.max() - ntrials
+
+def posterior(x, data, npad, mu, sd):
+
+    '''
+    -1*log posterior (up to a constant) of every subject's x = (log k,
+    log m), one row per subject, and its gradient with respect to x.
+    '''
+
+    km = np.exp(x)
+    f, g = FitK.errorgrad_batch(km, data)
+    z = (x - mu)/sd
+
+    return f - npad*np.log(2) + .5*np.sum(z**2, axis=1), g*km + z/sd
+
+def hessian(x, data, npad, mu, sd, eps=1e-4):
+
+    '''
+    Hessian of posterior at every row of x, (subjects x 2 x 2), by central
+    differences of the gradient.
+    '''
+
+    H = np.zeros((len(x), 2, 2))
+    for j in range(2):
+        step = np.zeros(2)
+        step[j] = eps
+        gp = posterior(x + step, data, npad, mu, sd)[1]
+        gm = posterior(x - step, data, npad, mu, sd)[1]
+        H[:,:,j] = (gp - gm)/(2*eps)
+
+    return (H + np.transpose(H, (0, 2, 1)))/2
+
+def laplacevar(H):
+
+    '''
+    Diagonal of the inverse of each 2 x 2 Hessian, the posterior variances.
+    Where a Hessian is not positive definite (a mode on a bound) the
+    inverse of its diagonal is used.
+    '''
+
+    det = H[:,0,0]*H[:,1,1] - H[:,0,1]**2
+    ok = (det > 0) & (H[:,0,0] > 0)
+    var = np.column_stack((H[:,1,1], H[:,0,0]))/np.where(ok, det, 1)[:,None]
+    diag = 1/np.maximum(np.column_stack((H[:,0,0], H[:,1,1])), 1e-8)
+
+    return np.where(ok[:,None], var, diag)
+
+def groupfit(datas, maxiter=50, tol=1e-3, minsd=.05):
+
+    '''
+    Fits every subject's trial matrix in datas (a list) together under the
+    population prior. Returns a dict with per subject k, m, loglikelihood
+    (without the prior) and posterior sd of log k and log m, the population
+    mu and sd of (log k, log m), the population median kgroup and mgroup,
+    and the number of EM iterations.
+    '''
+
+    data, npad = stackpad(datas)
+
+    # maximum likelihood start, the padding does not move the optimum
+    k, m, ll = simagents.fitagents(data)
+    lo = np.array([b[0] for b in bnds])
+    hi = np.array([b[1] for b in bnds])
+    x = np.clip(np.log(np.maximum(np.column_stack((k, m)), 1e-300)), lo, hi)
+    mu = x.mean(axis=0)
+    sd = np.maximum(x.std(axis=0), minsd)
+
+    it = 0
+    while it < maxiter:
+        it = it + 1
+
+        # E: modes and their variances under the current prior
+        x, f = FitK.descend(posterior, x, bnds, args=(data, npad, mu, sd))
+        var = laplacevar(hessian(x, data, npad, mu, sd))
+
+        # M: population mean and sd
+        newmu = x.mean(axis=0)
+        newsd = np.sqrt(np.maximum(np.mean((x - newmu)**2 + var, axis=0),
+                                   minsd**2))
+        done = np.all(np.abs(newmu - mu) < tol) and \
+               np.all(np.abs(newsd - sd) < tol)
+        mu, sd = newmu, newsd
+        if done:
+            break
+
+    km = np.exp(x)
+    ll = -(FitK.errorfit_batch(km, data) - npad*np.log(2))
+
+    return {'k': km[:,0], 'm': km[:,1], 'll': ll, 'se': np.sqrt(var),
+            'mu': mu, 'sd': sd, 'kgroup': np.exp(mu[0]),
+            'mgroup': np.exp(mu[1]), 'iters': it}
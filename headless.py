@@ -0,0 +1,612 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Headless replay of the task scripts (stairK.py, WMITC.py) on a virtual
+clock. The scripts run unchanged against a stand-in for the parts of
+expyriment they use: screens are recorded instead of drawn, every wait
+advances a virtual clock instead of sleeping, and responses come from a
+responder, either a softmax-hyperbolic model agent that reads the offers
+off the presented screens or a fixed script of keys. The scanner is
+replaced by one that pulses every TR on the same virtual clock. A whole
+session takes a fraction of a second and writes the same files as a real
+one (.xpd, _timing.csv, _pulses.csv, _profile.csv) with simulated onsets.
+
+Each read of the virtual clock moves it on by 'tick' ms and each present()
+by 'flip' ms, so busy waits end and presentations have a cost. Answers to
+the scripts' input() prompts (the WMITC run number) are given as a list.
+The scripts are run in workdir (through ITC_MAINDIR), which needs what they
+read: data/offers/<subject>_offers.txt for WMITC (see makeoffers below)
+and optionally data/ado tables for stairK.
+
+Usage:
+  replay('stairK.py', '/tmp/replay', subject=1, responder=ModelAgent(.02, .8))
+  replay('WMITC.py', '/tmp/replay', subject=1, answers=[1])
+  replay('WMITC.py', '/tmp/replay', answers=[1], settings={'adaptive': True})
+
+  python headless.py stairK.py --workdir /tmp/replay --sessions 100
+  python headless.py WMITC.py --workdir /tmp/replay --answer 1 --offers
+  python headless.py WMITC.py --answer 1 --offers --set adaptive=True
+
+"""
+
+import os, re, sys, ast, types, runpy, random, datetime
+import numpy as np
+from scipy.special import expit
+import scannerio
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+# modules that import expyriment when they are loaded
+expmodules = ('stimcache',)
+
+class VirtualClock(object):
+
+    '''
+    Time in ms that only moves when something waits, plus tick ms on
+    every read.
+    '''
+
+    def __init__(self, tick=.05):
+
+        self.ms = 0.
+        self.tick = tick
+
+    def advance(self, ms):
+
+        self.ms = self.ms + max(0., ms)
+
+    def read(self):
+
+        self.ms = self.ms + self.tick
+
+        return self.ms
+
+def parseoffers(text):
+
+    '''
+    Offers [amount delay] in the order they appear in the text of a screen
+    ('$20.00' followed by 'Today' or '15 days').
+    '''
+
+    amounts = re.findall(r'\$(\d+(?:\.\d*)?)', text)
+    delays = re.findall(r'(Today|(\d+) days)', text)
+
+    return [(float(a), 0. if d[0] == 'Today' else float(d[1]))
+            for a, d in zip(amounts, delays)]
+
+class Display(object):
+
+    '''
+    Log of the presented screens: virtual time of each present() and the
+    offers shown on it.
+    '''
+
+    def __init__(self, clock, flip=1.):
+
+        self.clock = clock
+        self.flip = flip
+        self.shown = []
+
+    def show(self, stim):
+
+        self.clock.advance(self.flip)
+        self.shown.append((self.clock.ms, parseoffers(stim.alltext())))
+
+        return self.flip
+
+    def recentoffers(self, n=2):
+
+        '''
+        The last n offers shown, oldest first. Screens without offers (the
+        fixation cross, blanks) are skipped.
+        '''
+
+        out = []
+        for t, offers in reversed(self.shown):
+            out = list(offers) + out
+            if len(out) >= n:
+                break
+
+        return out[-n:]
+
+class ModelAgent(object):
+
+    '''
+    Softmax-hyperbolic responder: picks the second of the last two offers
+    shown with p = expit(m*(V2-V1)), V = r/(1+k*d). chars are the keys
+    for the first and second offer, in that order. RTs are log-normal
+    around rt ms; a response slower than the window is a miss.
+    '''
+
+    def __init__(self, k=.02, m=.8, rt=900., rtsd=.3, rng=None):
+
+        self.k = k
+        self.m = m
+        self.rt = rt
+        self.rtsd = rtsd
+        self.rng = np.random.RandomState() if rng is None else rng
+
+    def __call__(self, chars, duration, display):
+
+        rt = self.rt*np.exp(self.rtsd*self.rng.randn())
+        if duration is not None and rt > duration:
+            return None, None
+        offers = display.recentoffers(2)
+        if len(offers) < 2:
+            return chars[0], rt
+        (r1, d1), (r2, d2) = offers
+        dv = r2/(1 + self.k*d2) - r1/(1 + self.k*d1)
+        second = self.rng.rand() < expit(self.m*dv)
+
+        return chars[1 if second else 0], rt
+
+class ScriptedResponder(object):
+
+    '''
+    Responds with the given keys in turn (None for a miss), after rt ms.
+    '''
+
+    def __init__(self, keys, rt=800.):
+
+        self.keys = list(keys)
+        self.rt = rt
+        self.n = 0
+
+    def __call__(self, chars, duration, display):
+
+        key = self.keys[self.n % len(self.keys)]
+        self.n = self.n + 1
+        if key is None or (duration is not None and self.rt > duration):
+            return None, None
+
+        return key, self.rt
+
+class Session(object):
+
+    '''
+    State shared by the stand-in expyriment modules during one replay.
+    '''
+
+    def __init__(self, mainfile, subject, responder, clock, display, tr):
+
+        self.mainfile = mainfile
+        self.subject = subject
+        self.responder = responder
+        self.clock = clock
+        self.display = display
+        self.tr = tr
+
+def stimulusclasses(session):
+
+    '''
+    Null stimuli: they keep their text and the stimuli plotted on them, and
+    present() only logs them on the display.
+    '''
+
+    class Stimulus(object):
+
+        def __init__(self, *args, **kwargs):
+
+            self.texts = [a for a in args if isinstance(a, str)]
+            if isinstance(kwargs.get('text'), str):
+                self.texts.append(kwargs['text'])
+            self.children = []
+
+        def alltext(self):
+
+            return '\n'.join(self.texts + [c.alltext()
+                                           for c in self.children])
+
+        def plot(self, other):
+
+            other.children.append(self)
+
+        def preload(self):
+
+            return 0
+
+        def unload(self):
+
+            return 0
+
+        def present(self, *args, **kwargs):
+
+            return session.display.show(self)
+
+    names = ('BlankScreen', 'TextBox', 'TextLine', 'TextScreen', 'FixCross',
+             'Canvas', 'Circle', 'Rectangle')
+
+    return dict((name, type(name, (Stimulus,), {})) for name in names)
+
+def expyrimentmodules(session):
+
+    '''
+    Stand-in expyriment package (design, control, stimuli, misc, io) bound
+    to a session.
+    '''
+
+    clock = session.clock
+
+    class Clock(object):
+
+        @staticmethod
+        def monotonic_time():
+
+            return clock.read()/1000.
+
+        def __init__(self):
+
+            self.start = clock.read()
+
+        @property
+        def time(self):
+
+            return int(clock.read() - self.start)
+
+        def wait(self, ms, *args, **kwargs):
+
+            clock.advance(ms)
+
+    class Keyboard(object):
+
+        def wait(self, keys=None, duration=None, *args, **kwargs):
+
+            clock.advance(1)
+            return (keys[0] if keys else None), 1
+
+        def wait_char(self, char, duration=None, *args, **kwargs):
+
+            chars = [char] if isinstance(char, str) else list(char)
+            key, rt = session.responder(chars, duration, session.display)
+            if key is None:
+                clock.advance(duration or 0)
+                return None, None
+            clock.advance(rt)
+            return key, int(rt)
+
+    class Screen(object):
+
+        window_size = (1024, 768)
+
+    class Data(object):
+
+        def __init__(self, exp, fullpath):
+
+            self.exp = exp
+            self.fullpath = fullpath
+            self.rows = []
+
+        def add(self, row):
+
+            self.rows.append(list(row))
+
+        def save(self):
+
+            writexpd(self.fullpath, self.exp, self.rows, session.mainfile)
+
+    class Experiment(object):
+
+        def __init__(self, name='', *args, **kwargs):
+
+            self.name = name
+            self.data_variable_names = []
+            self.subject = None
+            self.data = None
+
+    class Defaults(object):
+
+        initialize_delay = 0
+
+    def initialize(exp=None):
+
+        exp.clock = Clock()
+        exp.keyboard = Keyboard()
+        exp.screen = Screen()
+
+        return exp
+
+    def start(exp=None, *args, **kwargs):
+
+        exp = exp if isinstance(exp, Experiment) else session.exp
+        exp.subject = session.subject
+        exp.data = Data(exp, datafile(session.mainfile, session.subject))
+
+    def end(*args, **kwargs):
+
+        exp = session.exp
+        if exp.data is not None and not session.ended:
+            exp.data.save()
+        session.ended = True
+
+    def makeexperiment(*args, **kwargs):
+
+        session.exp = Experiment(*args, **kwargs)
+
+        return session.exp
+
+    package = types.ModuleType('expyriment')
+    parts = {}
+    parts['design'] = {'Experiment': makeexperiment}
+    parts['control'] = {'defaults': Defaults(), 'initialize': initialize,
+                        'start': start, 'end': end}
+    parts['stimuli'] = stimulusclasses(session)
+    parts['misc'] = {'Clock': Clock}
+    parts['io'] = {}
+    modules = {'expyriment': package}
+    for name in parts:
+        mod = types.ModuleType('expyriment.' + name)
+        mod.__dict__.update(parts[name])
+        setattr(package, name, mod)
+        modules['expyriment.' + name] = mod
+
+    return modules
+
+class VirtualScanner(object):
+
+    '''
+    Stands in for scannerio.ScannerIO: after trigger() a pulse arrives
+    every TR of virtual time.
+    '''
+
+    def __init__(self, session, *args, **kwargs):
+
+        self.session = session
+        self.now = kwargs.get('now') or (lambda: session.clock.read()/1000.)
+        self.tr = session.tr
+        self.t0 = None
+
+    def start(self):
+
+        pass
+
+    def trigger(self, timeout=5):
+
+        self.t0 = self.now()
+
+        return True
+
+    def volume(self):
+
+        if self.t0 is None:
+            return 0
+
+        return int((self.now() - self.t0)/self.tr) + 1
+
+    def pulsetimes(self):
+
+        return self.t0 + self.tr*np.arange(self.volume()), 0
+
+    def lastpulse(self):
+
+        times = self.pulsetimes()[0]
+
+        return times[-1] if len(times) else None
+
+    def waitvolume(self, vol, timeout=None):
+
+        wait = self.t0 + vol*self.tr - self.now()
+        self.session.clock.advance(wait*1000.)
+
+        return True
+
+    def write(self, fname, t0=0):
+
+        times, first = self.pulsetimes()
+        f = open(fname, 'w')
+        f.write('"volume","time"\n')
+        for vol, t in enumerate(times):
+            f.write('%d, %.6f\n' % (first + vol, t - t0))
+        f.close()
+
+    def close(self):
+
+        pass
+
+class NullFakeScanner(object):
+
+    port = None
+
+    def __init__(self, *args, **kwargs):
+
+        pass
+
+    def start(self):
+
+        pass
+
+    def close(self):
+
+        pass
+
+def datafile(mainfile, subject, datadir='data'):
+
+    '''
+    Data file name as expyriment makes it, script_NN_YYYYMMDDHHMM.xpd. The
+    time stamp moves on by a minute until the name is free, so back to back
+    replays keep distinct, ordered files.
+    '''
+
+    if not os.path.isdir(datadir):
+        os.makedirs(datadir)
+    base = os.path.splitext(os.path.basename(mainfile))[0]
+    stamp = datetime.datetime.now().replace(second=0, microsecond=0)
+    while True:
+        fname = '%s/%s_%02d_%s.xpd' % (datadir, base, subject,
+                                       stamp.strftime('%Y%m%d%H%M'))
+        if not os.path.exists(fname):
+            return os.path.abspath(fname)
+        stamp = stamp + datetime.timedelta(minutes=1)
+
+def writexpd(fname, exp, rows, mainfile='-'):
+
+    '''
+    Writes the rows like an expyriment .xpd: comment lines, the variable
+    names with subject_id in front, then one line per row.
+    '''
+
+    f = open(fname, 'w')
+    f.write('#Expyriment headless replay, Python %d.%d\n' %
+            sys.version_info[:2])
+    f.write('#date: %s\n' % datetime.datetime.now().strftime('%c'))
+    f.write('#--EXPERIMENT INFO\n')
+    f.write('#e mainfile: %s\n' % os.path.basename(mainfile))
+    f.write('#e name: %s\n' % exp.name)
+    f.write('#--SUBJECT INFO\n')
+    f.write('#s id: %s\n' % exp.subject)
+    f.write('#--TRIAL DATA\n')
+    f.write('#d virtual clock\n')
+    f.write(','.join(['subject_id'] + list(exp.data_variable_names)) + '\n')
+    for row in rows:
+        f.write(','.join([str(exp.subject)] + [str(v) for v in row]) + '\n')
+    f.close()
+
+def runscript(script, settings=None):
+
+    '''
+    Runs a script as __main__, with the top-level assignments of the names
+    in settings (e.g. {'adaptive': True}) replaced by the given values.
+    '''
+
+    if not settings:
+        return runpy.run_path(script, run_name='__main__')
+
+    f = open(script)
+    tree = ast.parse(f.read(), script)
+    f.close()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and \
+           isinstance(node.targets[0], ast.Name) and \
+           node.targets[0].id in settings:
+            value = ast.parse(repr(settings[node.targets[0].id]), mode='eval')
+            node.value = ast.copy_location(value.body, node.value)
+    ast.fix_missing_locations(tree)
+    scope = {'__name__': '__main__', '__file__': script}
+    exec(compile(tree, script, 'exec'), scope)
+
+    return scope
+
+def replay(script, workdir, subject=1, answers=(), responder=None, tick=.05,
+           flip=1., tr=2., seed=None, settings=None):
+
+    '''
+    Runs a task script headless in workdir. Returns the data file written.
+    settings overrides the script's settings (see runscript). The stand-in
+    modules, input() and the scanner classes are restored afterwards, also
+    if the script fails.
+    '''
+
+    if responder is None:
+        responder = ModelAgent(rng=np.random.RandomState(seed))
+    random.seed(seed)
+    np.random.seed(seed)
+
+    clock = VirtualClock(tick)
+    session = Session(script, subject, responder, clock,
+                      Display(clock, flip), tr)
+    session.exp = None
+    session.ended = False
+
+    saved = dict((name, sys.modules.get(name)) for name in
+                 ('expyriment', 'expyriment.design', 'expyriment.control',
+                  'expyriment.stimuli', 'expyriment.misc', 'expyriment.io')
+                 + expmodules)
+    answers = iter(answers)
+    oldinput = builtins.input
+    oldscanner = scannerio.ScannerIO, scannerio.FakeScanner
+    oldenv = os.environ.get('ITC_MAINDIR')
+    oldcwd = os.getcwd()
+    script = os.path.abspath(script)
+    session.mainfile = script
+
+    sys.modules.update(expyrimentmodules(session))
+    for name in expmodules:
+        sys.modules.pop(name, None)
+    builtins.input = lambda prompt='': next(answers)
+    scannerio.ScannerIO = lambda *a, **kw: VirtualScanner(session, *a, **kw)
+    scannerio.FakeScanner = NullFakeScanner
+    os.environ['ITC_MAINDIR'] = os.path.abspath(workdir)
+    if os.path.dirname(script) not in sys.path:
+        sys.path.insert(0, os.path.dirname(script))
+    try:
+        runscript(script, settings)
+    finally:
+        for name in saved:
+            if saved[name] is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = saved[name]
+        builtins.input = oldinput
+        scannerio.ScannerIO, scannerio.FakeScanner = oldscanner
+        if oldenv is None:
+            os.environ.pop('ITC_MAINDIR', None)
+        else:
+            os.environ['ITC_MAINDIR'] = oldenv
+        os.chdir(oldcwd)
+
+    if session.exp is None or session.exp.data is None:
+        return None
+
+    return session.exp.data.fullpath
+
+def makeoffers(workdir, subject, k=.02, m=.8, seed=None):
+
+    '''
+    Writes the offers WMITC.py reads for subject into workdir, made with
+    genoffers from (k, m), and the staircase fit it reads when adaptive.
+    '''
+
+    import genoffers, trialstore
+
+    for sub in ('offers', 'fitted'):
+        if not os.path.isdir('%s/data/%s' % (workdir, sub)):
+            os.makedirs('%s/data/%s' % (workdir, sub))
+    offers = genoffers.makeoffers(k, m, rng=np.random.RandomState(seed))
+    genoffers.saveoffers('%s/data/offers/%s_offers.txt' % (workdir, subject),
+                         offers)
+    trialstore.writeparams('%s/data/fitted/%02d_fitkparams.txt' %
+                           (workdir, subject), k, m, 0)
+
+if __name__ == '__main__':
+
+    import argparse, time
+
+    parser = argparse.ArgumentParser(description='Run task sessions headless '
+                                     'on a virtual clock.')
+    parser.add_argument('script', help='stairK.py or WMITC.py')
+    parser.add_argument('--workdir', default='replay')
+    parser.add_argument('--subject', type=int, default=1)
+    parser.add_argument('--sessions', type=int, default=1,
+                        help='sessions to run, one subject number each')
+    parser.add_argument('--answer', action='append', default=[],
+                        help="answers to input() prompts, in order "
+                        "(numbers are passed as int)")
+    parser.add_argument('--k', type=float, default=.02)
+    parser.add_argument('--m', type=float, default=.8)
+    parser.add_argument('--offers', action='store_true',
+                        help='write WMITC offers for each subject first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE', help='override a setting of '
+                        'the script, e.g. adaptive=True')
+    args = parser.parse_args()
+
+    settings = dict((a.split('=', 1)[0], ast.literal_eval(a.split('=', 1)[1]))
+                    for a in args.set)
+
+    answers = [int(a) if re.match(r'^-?\d+$', a) else a for a in args.answer]
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+    start = time.time()
+    for i in range(args.sessions):
+        subject = args.subject + i
+        seed = args.seed + i
+        if args.offers:
+            makeoffers(args.workdir, subject, args.k, args.m, seed)
+        agent = ModelAgent(args.k, args.m, rng=np.random.RandomState(seed))
+        fname = replay(args.script, args.workdir, subject, answers, agent,
+                       seed=seed, settings=settings)
+        print(fname)
+    print('%d sessions in %.2f s' % (args.sessions, time.time() - start))
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Online trial-wise GLM for real-time fMRI. The events logged by WMITC.py
+(first offer at foffert, delay at dtime, second offer at poffert) become
+per-trial regressors, boxcars convolved with the canonical double-gamma HRF,
+and the betas of every ROI are updated with recursive least squares (RLS)
+after each new volume. Slow drifts are removed online by polynomial drift
+regressors (constant, linear, quadratic over the planned run length) that
+are estimated along with the trial betas.
+
+To keep the cost per TR constant, a trial only occupies parameter slots
+while its regressors can still be non-zero. Once the last event of a trial
+is more than 'window' seconds in the past, its betas are stored as final and
+its slots are reset for a later trial, so the model size is set by the
+number of overlapping trials, not by the length of the run. Estimates for a
+trial are available (and keep improving) as soon as its volumes arrive.
+
+Usage:
+  glm = OnlineGLM(nrois=2, runlength=700.)
+  glm.addevent(trial, 'foffer', foffert, 1.5)     # onsets in s from strtt
+  glm.update(roimeans, t)                         # one volume at time t
+  glm.feed(stream.timecourse(), pulsetimes)       # all new volumes
+  glm.estimate(trial)                             # {event: betas per ROI}
+
+"""
+
+import numpy as np
+from scipy.stats import gamma
+
+# events of a trial, as logged by WMITC.py
+events = ('foffer', 'delay', 'poffer')
+
+def hrfint(t):
+
+    '''
+    Integral from 0 to t of the canonical double-gamma HRF (peak ~5 s,
+    undershoot ~15 s), scaled to integrate to 1.
+    '''
+
+    t = np.maximum(t, 0)
+
+    return (gamma.cdf(t, 6) - gamma.cdf(t, 16)/6.) / (1 - 1/6.)
+
+def boxcar(t, onset, dur):
+
+    '''
+    Boxcar of dur s starting at onset, convolved with the HRF, at times t.
+    '''
+
+    return hrfint(t - onset) - hrfint(t - onset - dur)
+
+class OnlineGLM(object):
+
+    '''
+    Recursive least squares GLM with recycled per-trial slots.
+
+    nrois: number of ROI timecourses fitted together
+    runlength: planned run length in s, scales the drift regressors
+    nslots: trials that can have live regressors at the same time
+    window: s after a trial's last event until its betas are final
+    lam: forgetting factor (1 keeps all volumes)
+    delta: prior variance of new trial parameters
+    driftdelta: prior variance of the drift parameters, diffuse so that a
+        raw baseline (ROI means around 1000) is not shrunk into the betas
+    '''
+
+    def __init__(self, nrois, runlength, nslots=5, window=32., lam=1.,
+                 delta=1e4, ndrift=3, driftdelta=1e10):
+
+        self.nrois = nrois
+        self.runlength = float(runlength)
+        self.ndrift = ndrift
+        self.nslots = nslots
+        self.window = window
+        self.lam = lam
+        self.delta = delta
+
+        npar = ndrift + nslots*len(events)
+        self.theta = np.zeros((npar, nrois))
+        self.P = np.eye(npar)*delta
+        self.P[:ndrift,:ndrift] = np.eye(ndrift)*driftdelta
+
+        # onsets and durations of the trial in each slot, nan if none
+        self.onsets = np.full((nslots, len(events)), np.nan)
+        self.durs = np.zeros((nslots, len(events)))
+        self.slottrial = [None]*nslots
+        self.final = {}
+        self.nvols = 0
+
+    def slotof(self, trial):
+
+        '''
+        Slot of a trial, taking the free (or oldest) one for a new trial.
+        '''
+
+        if trial in self.slottrial:
+            return self.slottrial.index(trial)
+
+        free = [s for s in range(self.nslots) if self.slottrial[s] is None]
+        if free:
+            slot = free[0]
+        else:
+            slot = int(np.argmin([np.nanmax(self.onsets[s])
+                                  for s in range(self.nslots)]))
+            self.retire(slot)
+        self.slottrial[slot] = trial
+
+        return slot
+
+    def cols(self, slot):
+
+        return self.ndrift + slot*len(events) + np.arange(len(events))
+
+    def addevent(self, trial, event, onset, dur):
+
+        '''
+        Adds an event of a trial. onset in s from the run start (the same
+        time base as the volume times), dur in s.
+        '''
+
+        slot = self.slotof(trial)
+        ev = events.index(event)
+        self.onsets[slot, ev] = onset
+        self.durs[slot, ev] = max(dur, .1)
+
+    def retire(self, slot):
+
+        '''
+        Stores the betas of the trial in slot as final and resets the slot.
+        '''
+
+        trial = self.slottrial[slot]
+        if trial is not None:
+            self.final[trial] = self.betas(slot)
+        cols = self.cols(slot)
+        self.theta[cols] = 0
+        self.P[cols,:] = 0
+        self.P[:,cols] = 0
+        self.P[cols, cols] = self.delta
+        self.onsets[slot] = np.nan
+        self.durs[slot] = 0
+        self.slottrial[slot] = None
+
+    def regressors(self, t):
+
+        '''
+        Design row for a volume acquired at t (s from the run start).
+        '''
+
+        x = np.zeros(self.theta.shape[0])
+        tt = 2*t/self.runlength - 1
+        x[:self.ndrift] = tt**np.arange(self.ndrift)
+        has = np.isfinite(self.onsets)
+        on = np.where(has, self.onsets, 0)
+        x[self.ndrift:] = np.where(has, boxcar(t, on, self.durs), 0).ravel()
+
+        return x
+
+    def update(self, y, t):
+
+        '''
+        RLS update with the ROI means y of one volume acquired at t.
+        '''
+
+        # trials whose regressors have died out free their slots
+        for slot in range(self.nslots):
+            if self.slottrial[slot] is not None and \
+               t > np.nanmax(self.onsets[slot] + self.durs[slot]) + self.window:
+                self.retire(slot)
+
+        x = self.regressors(t)
+        Px = self.P.dot(x)
+        gain = Px / (self.lam + x.dot(Px))
+        self.theta += np.outer(gain, np.asarray(y) - x.dot(self.theta))
+        self.P = (self.P - np.outer(gain, Px)) / self.lam
+        self.nvols = self.nvols + 1
+
+    def feed(self, rows, times, tr=2.):
+
+        '''
+        Updates with every volume in rows (volumes x ROIs) not used yet.
+        times holds the acquisition times of the volumes (e.g. the pulse
+        times); volumes past its end are timed as the last one plus tr.
+        '''
+
+        times = np.asarray(times)
+        while self.nvols < len(rows):
+            vol = self.nvols
+            if vol < len(times):
+                t = times[vol]
+            elif len(times):
+                t = times[-1] + (vol - len(times) + 1)*tr
+            else:
+                t = vol*tr
+            self.update(rows[vol], t)
+
+    def betas(self, slot):
+
+        cols = self.cols(slot)
+
+        return dict((ev, self.theta[cols[i]].copy())
+                    for i, ev in enumerate(events))
+
+    def estimate(self, trial):
+
+        '''
+        Current betas of a trial, {event: one beta per ROI}, or None if the
+        trial has not been added.
+        '''
+
+        if trial in self.slottrial:
+            return self.betas(self.slottrial.index(trial))
+
+        return self.final.get(trial)
+
+    def write(self, fname, names=None):
+
+        '''
+        Writes the betas of every trial (live ones as they are now), one row
+        per trial and event, one column per ROI.
+        '''
+
+        trials = sorted(set(self.final) |
+                        set(t for t in self.slottrial if t is not None))
+        if names is None:
+            names = ['roi%d' % roi for roi in range(self.nrois)]
+        f = open(fname, 'w')
+        f.write('"trial","event",%s\n' % ','.join('"%s"' % n for n in names))
+        for trial in trials:
+            est = self.estimate(trial)
+            for ev in events:
+                f.write('%d, %s, %s\n' % (trial, ev, ', '.join('%.6f' % b
+                                                               for b in est[ev])))
+        f.close()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-phase latency profile of a trial loop. The loop calls start() when a
+trial begins and mark() at the end of each of its phases (building a
+screen, present(), waiting for the response, logging, ...). mark() stores
+the time since the previous mark in a preallocated (trials x phases)
+array, so the phases of a trial tile it without gaps and recording costs a
+clock read and an array store, with nothing allocated per event.
+
+The profile is written next to the data file, e.g.
+stairK_01_201409181100.xpd -> stairK_01_201409181100_profile.csv, one row
+per trial and one column (ms) per phase. summarize reads any number of
+these profiles and reports p50/p90/p99/max per phase across sessions.
+
+Usage:
+  prof = PhaseProfile(('build', 'present', 'response'), ntrials)
+  prof.start(trial)
+  ...; prof.mark(trial, 'build')
+  prof.write(timingfile(exp.data.fullpath, '_profile.csv'))
+
+  python phaseprof.py data/*_profile.csv
+
+"""
+
+import time
+import numpy as np
+
+# monotonic, high resolution clock where there is one
+clock = getattr(time, 'perf_counter', time.time)
+
+class PhaseProfile(object):
+
+    '''
+    Durations (s) of named phases of every trial.
+
+    phases: phase names, in loop order
+    ntrials: trials to allocate for (grows if exceeded)
+    now: function returning the current time in s (monotonic)
+    '''
+
+    def __init__(self, phases, ntrials, now=None):
+
+        self.phases = tuple(phases)
+        self.index = dict((p, i) for i, p in enumerate(self.phases))
+        self.durs = np.full((ntrials, len(self.phases)), np.nan)
+        self.now = clock if now is None else now
+        self.last = self.now()
+
+    def start(self, trial):
+
+        '''
+        Marks the beginning of a trial (the first phase starts here).
+        '''
+
+        if trial >= len(self.durs):
+            more = np.full(self.durs.shape, np.nan)
+            self.durs = np.concatenate((self.durs, more))
+        self.last = self.now()
+
+    def mark(self, trial, phase):
+
+        '''
+        Ends a phase: stores the time since the previous mark (or start).
+        A phase marked twice in a trial adds up.
+        '''
+
+        t = self.now()
+        i = self.index[phase]
+        if np.isnan(self.durs[trial, i]):
+            self.durs[trial, i] = t - self.last
+        else:
+            self.durs[trial, i] += t - self.last
+        self.last = t
+
+    def ntrials(self):
+
+        '''
+        Number of trials with at least one phase recorded.
+        '''
+
+        done = np.nonzero(np.isfinite(self.durs).any(axis=1))[0]
+
+        return done[-1] + 1 if len(done) else 0
+
+    def write(self, fname):
+
+        '''
+        Writes one row per trial: trial and the duration (ms) of each
+        phase, nan for phases that did not run.
+        '''
+
+        n = self.ntrials()
+        rows = np.column_stack((np.arange(n), self.durs[:n]*1000.))
+        np.savetxt(fname, rows, delimiter=',', comments='',
+                   fmt=['%d'] + ['%.4f']*len(self.phases),
+                   header=','.join('"%s"' % c for c in
+                                   ('trial',) + self.phases))
+
+def readprofile(fname):
+
+    '''
+    Reads a profile back as phase names and a (trials x phases) array of
+    durations in ms.
+    '''
+
+    f = open(fname)
+    phases = [c.strip().strip('"') for c in f.readline().split(',')][1:]
+    f.close()
+    rows = np.atleast_2d(np.genfromtxt(fname, delimiter=',', skip_header=1))
+
+    return phases, rows[:,1:]
+
+def summarize(fnames):
+
+    '''
+    Pools the profiles in fnames (of the same or different loops) and
+    returns, per phase, the number of trials and the p50, p90, p99 and max
+    duration in ms. Phases keep the order of their first appearance.
+    '''
+
+    pooled, order = {}, []
+    for fname in fnames:
+        phases, durs = readprofile(fname)
+        for i, phase in enumerate(phases):
+            if phase not in pooled:
+                pooled[phase] = []
+                order.append(phase)
+            d = durs[:,i]
+            pooled[phase].append(d[np.isfinite(d)])
+
+    out = []
+    for phase in order:
+        d = np.concatenate(pooled[phase])
+        if len(d):
+            p50, p90, p99 = np.percentile(d, [50, 90, 99])
+            out.append((phase, len(d), p50, p90, p99, d.max()))
+        else:
+            out.append((phase, 0, np.nan, np.nan, np.nan, np.nan))
+
+    return out
+
+def report(summary):
+
+    lines = ['%-12s %7s %10s %10s %10s %10s' %
+             ('phase', 'n', 'p50', 'p90', 'p99', 'max')]
+    for row in summary:
+        lines.append('%-12s %7d %10.3f %10.3f %10.3f %10.3f' % row)
+
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Latency per phase (ms) '
+                                     'across session profiles.')
+    parser.add_argument('fnames', nargs='+', help='_profile.csv files')
+    args = parser.parse_args()
+
+    print(report(summarize(args.fnames)))
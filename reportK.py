@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fit diagnostics of a whole cohort without opening a window. For every
+subject with fitted parameters (fitted/fitkparams_all.txt or the
+NN_fitkparams.txt files) and a staircase file, FitK.plotfit draws the
+discount curve, SV and p(ll) panels with the non-interactive Agg backend,
+one subject per worker process, into fitted/report/NN_fit.png. An
+index.html shows them all with their k and m.
+
+Subjects with more than maxtrials trials are drawn from maxtrials evenly
+spaced trials (the fit itself is not changed). Each figure is keyed by a
+hash of the trials it draws and the parameters, kept in report.json in the
+report directory; figures whose key did not change are not drawn again
+(use --force to redraw them all).
+
+Usage:
+  python reportK.py [datadir] [--out DIR] [--procs N] [--maxtrials N]
+                    [--force]
+
+"""
+
+import os, json, hashlib, argparse
+from multiprocessing import Pool, cpu_count
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')    # no windows, in the worker processes as well
+import matplotlib.pyplot as plt
+import FitK, batchFitK, genoffers
+
+datadir = batchFitK.datadir
+maxtrials = 500
+dpi = 80
+manifestname = 'report.json'
+
+def thin(data, maxtrials=maxtrials):
+
+    '''
+    At most maxtrials evenly spaced trials of data, in their order.
+    '''
+
+    if maxtrials is None or len(data) <= maxtrials:
+        return data
+
+    return data[np.unique(np.linspace(0, len(data) - 1,
+                                      maxtrials).round().astype(int))]
+
+def figkey(data, km):
+
+    '''
+    Hash of what a figure shows: the trials drawn and k and m.
+    '''
+
+    h = hashlib.sha1(np.ascontiguousarray(data, dtype=float).tobytes())
+    h.update(('%r %r' % (float(km[0]), float(km[1]))).encode())
+
+    return h.hexdigest()
+
+def render(job):
+
+    '''
+    Draws and saves one subject's figure. Runs in a worker.
+    '''
+
+    subns, data, km, fname = job
+    fig = FitK.plotfit(km, data)
+    fig.set_size_inches(12, 4)
+    fig.suptitle('subject %s: k = %.5f, m = %.3f, %d trials' %
+                 (subns, km[0], km[1], len(data)))
+    fig.savefig(fname, dpi=dpi)
+    plt.close(fig)
+
+    return subns
+
+def readmanifest(outdir):
+
+    fname = os.path.join(outdir, manifestname)
+    if not os.path.isfile(fname):
+        return {}
+    f = open(fname)
+    keys = json.load(f)
+    f.close()
+
+    return keys
+
+def writemanifest(outdir, keys):
+
+    fname = os.path.join(outdir, manifestname)
+    f = open(fname + '.tmp', 'w')
+    json.dump(keys, f, indent=1, sort_keys=True)
+    f.close()
+    os.rename(fname + '.tmp', fname)
+
+def writeindex(outdir, rows):
+
+    f = open(os.path.join(outdir, 'index.html'), 'w')
+    f.write('<html><head><title>FitK report</title></head><body>\n')
+    for subns, k, m, ntrials in rows:
+        f.write('<h3>%s: k = %.5f, m = %.3f, %d trials</h3>\n' %
+                (subns, k, m, ntrials))
+        f.write('<img src="%s_fit.png">\n' % subns)
+    f.write('</body></html>\n')
+    f.close()
+
+def report(datadir=datadir, outdir=None, procs=None, maxtrials=maxtrials,
+           force=False):
+
+    '''
+    Draws the figures of every fitted subject in datadir that changed and
+    writes the index. Returns the subjects drawn and the ones skipped.
+    '''
+
+    outdir = outdir or '%s/fitted/report' % datadir
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    subs = batchFitK.stairfiles(datadir)
+    subnss, k, m = genoffers.readfits('%s/fitted' % datadir)
+    keys = {} if force else readmanifest(outdir)
+
+    jobs, skipped, rows, newkeys = [], [], [], {}
+    for i, subns in enumerate(subnss):
+        if subns not in subs:
+            continue
+        km = np.array([k[i], m[i]])
+        data = batchFitK.loadstair(subs[subns])
+        drawn = thin(data, maxtrials)
+        fname = os.path.join(outdir, '%s_fit.png' % subns)
+        newkeys[subns] = figkey(drawn, km)
+        rows.append((subns, k[i], m[i], len(data)))
+        if keys.get(subns) == newkeys[subns] and os.path.isfile(fname):
+            skipped.append(subns)
+        else:
+            jobs.append((subns, drawn, km, fname))
+
+    done = []
+    if jobs:
+        pool = Pool(min(procs or cpu_count(), len(jobs)))
+        try:
+            done = pool.map(render, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    writemanifest(outdir, newkeys)
+    writeindex(outdir, rows)
+
+    return done, skipped
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Draw the fit diagnostics '
+                                     'of every fitted subject.')
+    parser.add_argument('datadir', nargs='?', default=datadir)
+    parser.add_argument('--out', default=None,
+                        help='report directory (datadir/fitted/report)')
+    parser.add_argument('--procs', type=int, default=None,
+                        help='number of worker processes (all cores)')
+    parser.add_argument('--maxtrials', type=int, default=maxtrials,
+                        help='trials drawn per subject at most')
+    parser.add_argument('--force', action='store_true',
+                        help='redraw figures that are up to date')
+    args = parser.parse_args()
+
+    done, skipped = report(args.datadir, args.out, args.procs,
+                           args.maxtrials, args.force)
+    print('%d figures drawn, %d up to date' % (len(done), len(skipped)))
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Streaming ingestion of fMRI volumes as the scanner exports them. A background
+thread polls the export directory for new volume files, memory-maps each one
+without copying and pulls out the mean of every ROI through precomputed flat
+voxel indices, so only the ROI voxels are read. The ROI means go into a
+preallocated (volumes x ROIs) array the task loop can read at any time.
+
+Volumes can be uncompressed single-file NIfTI-1 (.nii) or .npy files. The
+NIfTI header is read directly (dims, datatype, vox_offset, scaling), so no
+imaging library is needed. Files are taken in name order and are expected
+to appear atomically (written elsewhere and renamed in); names starting with
+'.' are ignored.
+
+DropSimulator stands in for the scanner: it writes NIfTI volumes with a
+known ROI signal into a directory, one per TR.
+
+Usage:
+  masks = {'vmpfc': vmpfcmask, 'vs': vsmask}     # boolean 3-d arrays
+  stream = VolumeStream('/path/to/export', masks, maxvols=400)
+  stream.start()
+  stream.count, stream.timecourse()              # (volumes x ROIs)
+  stream.close()
+
+"""
+
+import os, struct, threading, time
+import numpy as np
+
+# NIfTI-1 datatype codes
+niftitypes = {2: np.uint8, 4: np.int16, 8: np.int32, 16: np.float32,
+              64: np.float64, 256: np.int8, 512: np.uint16, 768: np.uint32}
+
+def niftiheader(fname):
+
+    '''
+    Reads what is needed to map a .nii file: shape, dtype (with byte order),
+    data offset and the scaling slope and intercept.
+    '''
+
+    f = open(fname, 'rb')
+    hdr = f.read(348)
+    f.close()
+
+    endian = '<'
+    if struct.unpack('<i', hdr[:4])[0] != 348:
+        endian = '>'
+    dim = struct.unpack(endian + '8h', hdr[40:56])
+    datatype = struct.unpack(endian + 'h', hdr[70:72])[0]
+    offset = int(struct.unpack(endian + 'f', hdr[108:112])[0])
+    slope, inter = struct.unpack(endian + '2f', hdr[112:120])
+
+    shape = tuple(dim[1:1+dim[0]])
+    dtype = np.dtype(niftitypes[datatype]).newbyteorder(endian)
+
+    return shape, dtype, offset, slope, inter
+
+def mapvolume(fname):
+
+    '''
+    Memory-maps a volume file as a flat array in storage order. Returns the
+    flat array, the 3-d shape, the storage order ('F' for NIfTI) and the
+    scaling (slope, intercept).
+    '''
+
+    if fname.endswith('.npy'):
+        vol = np.load(fname, mmap_mode='r')
+        order = 'F' if np.isfortran(vol) else 'C'
+        return vol.reshape(-1, order=order), vol.shape[:3], order, (1., 0.)
+
+    shape, dtype, offset, slope, inter = niftiheader(fname)
+    nvox = int(np.prod(shape[:3]))
+    flat = np.memmap(fname, dtype=dtype, mode='r', offset=offset,
+                     shape=(nvox,))
+    if slope == 0:
+        slope, inter = 1., 0.
+
+    return flat, shape[:3], 'F', (slope, inter)
+
+def flatindices(mask, shape, order):
+
+    '''
+    Flat voxel indices of a boolean 3-d mask (or an (n x 3) array of voxel
+    coordinates) for volumes of the given shape and storage order.
+    '''
+
+    mask = np.asarray(mask)
+    if mask.dtype == bool:
+        coords = np.nonzero(mask)
+    else:
+        coords = tuple(mask.T)
+
+    return np.ravel_multi_index(coords, shape, order=order)
+
+class VolumeStream(object):
+
+    '''
+    Watches dirname for new volume files and extracts ROI means.
+
+    masks: dict of ROI name -> boolean 3-d mask or voxel coordinates
+    maxvols: volumes to allocate for
+    poll: seconds between directory scans
+    suffixes: file endings that count as volumes
+    '''
+
+    def __init__(self, dirname, masks, maxvols=1000, poll=.01,
+                 suffixes=('.nii', '.npy')):
+
+        self.dirname = dirname
+        self.names = sorted(masks)
+        self.masks = [masks[name] for name in self.names]
+        self.poll = poll
+        self.suffixes = suffixes
+        self.roimeans = np.full((maxvols, len(self.names)), np.nan)
+        self.arrived = np.full(maxvols, np.nan)
+        self.files = []
+        self.count = 0
+        self.indices = {}
+        self.seen = set()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+
+        self.thread.start()
+
+    def roiindices(self, shape, order):
+
+        '''
+        Flat indices of every ROI, computed once per volume layout.
+        '''
+
+        key = (shape, order)
+        if key not in self.indices:
+            self.indices[key] = [flatindices(mask, shape, order)
+                                 for mask in self.masks]
+
+        return self.indices[key]
+
+    def newfiles(self):
+
+        names = [name for name in os.listdir(self.dirname)
+                 if name.endswith(self.suffixes) and not name.startswith('.')
+                 and name not in self.seen]
+
+        return sorted(names)
+
+    def ingest(self, fname):
+
+        '''
+        Maps one volume and stores its ROI means as the next volume.
+        '''
+
+        flat, shape, order, (slope, inter) = mapvolume(fname)
+        vol = self.count
+        for roi, idx in enumerate(self.roiindices(shape, order)):
+            self.roimeans[vol, roi] = flat[idx].mean()*slope + inter
+        self.arrived[vol] = time.time()
+        self.files.append(fname)
+        # publish after the row is complete
+        self.count = vol + 1
+
+    def run(self):
+
+        while not self.stopped.is_set():
+            for name in self.newfiles():
+                self.seen.add(name)
+                if self.count < len(self.roimeans):
+                    self.ingest(os.path.join(self.dirname, name))
+            self.stopped.wait(self.poll)
+
+    def timecourse(self):
+
+        '''
+        ROI means of the volumes so far, (volumes x ROIs). A view, rows
+        already published do not change.
+        '''
+
+        return self.roimeans[:self.count]
+
+    def waitvolume(self, vol, timeout=None):
+
+        '''
+        Waits until volume vol has been ingested. Returns False on timeout.
+        '''
+
+        end = None if timeout is None else time.time() + timeout
+        while self.count <= vol:
+            if end is not None and time.time() > end:
+                return False
+            time.sleep(.001)
+
+        return True
+
+    def write(self, fname):
+
+        '''
+        Writes the ROI timecourses, one row per volume.
+        '''
+
+        np.savetxt(fname, self.timecourse(), delimiter=',', fmt='%.6f',
+                   header=','.join('"%s"' % name for name in self.names))
+
+    def close(self):
+
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join(1)
+
+def writenifti(fname, vol, tr=2.):
+
+    '''
+    Writes a 3-d array as an uncompressed NIfTI-1 file (int16 or float32),
+    through a temporary name so readers never see a partial file.
+    '''
+
+    vol = np.asarray(vol)
+    if vol.dtype != np.int16:
+        vol = vol.astype(np.float32)
+    datatype = 4 if vol.dtype == np.int16 else 16
+
+    hdr = bytearray(352)
+    struct.pack_into('<i', hdr, 0, 348)
+    struct.pack_into('<8h', hdr, 40, 3, vol.shape[0], vol.shape[1],
+                     vol.shape[2], 1, 1, 1, 1)
+    struct.pack_into('<2h', hdr, 70, datatype, vol.dtype.itemsize*8)
+    struct.pack_into('<8f', hdr, 76, 1, 1, 1, 1, tr, 1, 1, 1)
+    struct.pack_into('<3f', hdr, 108, 352, 1, 0)
+    hdr[344:348] = b'n+1\x00'
+
+    tmp = os.path.join(os.path.dirname(fname), '.' + os.path.basename(fname))
+    f = open(tmp, 'wb')
+    f.write(bytes(hdr))
+    f.write(vol.tobytes(order='F'))
+    f.close()
+    os.rename(tmp, fname)
+
+class DropSimulator(object):
+
+    '''
+    Writes one NIfTI volume per TR into dirname, like the scanner export.
+    Each ROI in masks follows its signal (one value per volume) on top of
+    a baseline and noise.
+    '''
+
+    def __init__(self, dirname, shape, masks, signals, tr=2., base=1000.,
+                 noise=5., seed=None):
+
+        self.dirname = dirname
+        self.shape = shape
+        self.masks = masks
+        self.signals = signals
+        self.tr = tr
+        self.base = base
+        self.noise = noise
+        self.rng = np.random.RandomState(seed)
+        self.sent = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def volume(self, vol):
+
+        data = self.base + self.noise*self.rng.randn(*self.shape)
+        for name in self.masks:
+            data[np.asarray(self.masks[name], dtype=bool)] += \
+                self.signals[name][vol]
+
+        return np.round(data).astype(np.int16)
+
+    def start(self):
+
+        self.thread.start()
+
+    def run(self):
+
+        nvols = min(len(s) for s in self.signals.values())
+        start = time.time()
+        while self.sent < nvols and not self.stopped.is_set():
+            wait = start + self.sent*self.tr - time.time()
+            if wait > 0 and self.stopped.wait(wait):
+                break
+            writenifti(os.path.join(self.dirname, 'vol%05d.nii' % self.sent),
+                       self.volume(self.sent), self.tr)
+            self.sent = self.sent + 1
+
+    def close(self):
+
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join(1)
@@ -8,8 +8,9 @@ Created on Tue Sep 16 13:21:49 2014
 
 # imports
 from os import chdir
-from glob import glob
 import numpy
+from catalog import Catalog
+import trialstore
 
 scriptdir = '/Users/christianrodriguez/Dropbox/Python/scripts'
 datadir = '/Users/christianrodriguez/Dropbox/Python/data'
@@ -25,13 +26,17 @@ subns = subn.__str__().zfill(2)
 # get the file
 #fname = '%s/stairK%s'
 chdir(datadir)
-filz = glob('stairK_%s_*xpd' % (subns))
-
-# import the data, skipping the first 10 lines used as header
-data = numpy.genfromtxt('%s/%s' % (datadir, filz[0]), delimiter=',', skip_header=10)
-
-fitkd = data[:,3:]
-fitkd = fitkd[:,:-1]
+cat = Catalog(datadir).update()
+stamps = cat.sessions(subn, 'stairK')
+if not stamps:
+    raise IOError('no stairK session of subject %s in %s' % (subns, datadir))
+if len(stamps) > 1:
+    print 'subject %s has %d stairK sessions, fitting the newest (%s)' % \
+        (subns, len(stamps), stamps[-1])
+fname = cat.latest(subn, 'stairK')
+
+# import the data [ssamnt ssdel llamnt lldel choice] through its binary copy
+fitkd = trialstore.fitmatrix(trialstore.load(fname))
 
 #if subn <= 8:
 #    fitkd[:,-1] = 1-fitkd[:,-1] # one time exception because of error
@@ -46,18 +51,22 @@ k, m, ll, res = fitk(fitkd)
 # print the output to screen
 print 'k = %.5f, m = %.3f, likelihood = %.5f' % (k, m, ll)
 
+# put bootstrap confidence intervals on k and m
+from bootK import bootk
+kci, mci, boot = bootk(fitkd, (k, m))
+print '95%% CI: k = [%.5f, %.5f], m = [%.3f, %.3f]' % (kci[0], kci[1], 
+                                                        mci[0], mci[1])
+
 # make a summary plot
-plotfit(numpy.array([k,m]))
+plotfit(numpy.array([k,m]), fitkd)
 
 # cd to fitKdata
 if  not os.path.isdir('%s/fitted' % (datadir)):
     os.mkdir('%s/fitted' % (datadir))
 
 # write a file to the fitted directory
-f = open('%s/fitted/%s_fitkparams.txt' % (datadir, subns), 'w')
-f.write('"k","m","ll"\n')
-f.write('%f, %f, %f\n' % (k, m, ll))
-f.close()
+trialstore.writeparams('%s/fitted/%s_fitkparams.txt' % (datadir, subns), 
+                       k, m, ll)
 
 # get back to scriptdir and run the offer generation script
 chdir(scriptdir)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Scanner trigger and TR pulse I/O in a background thread. The serial port is
+opened and kept open by the thread, so a slow open does not block the task,
+and every pulse the trigger box sends back is timestamped as it arrives.
+Timestamps go into a preallocated ring buffer with a single writer (the
+thread) and a count that is only ever incremented after a slot is written,
+so the trial loop can read the current volume index or recent pulse times
+at any moment without locks and without blocking.
+
+FakeScanner stands in for the scanner on a plain Linux box: it opens a
+pseudo terminal, waits for the trigger command on it and then sends one
+pulse per TR, so ScannerIO can be pointed at its port instead of the real
+device.
+
+Usage:
+  scanner = ScannerIO('/dev/tty.usbmodem12341', now=clock.monotonic_time)
+  scanner.start()
+  scanner.trigger()        # sends '[t]', returns the send time
+  scanner.volume()         # index of the last volume (-1 before the first)
+  scanner.close()
+
+  fake = FakeScanner(tr=2.)
+  fake.start()
+  scanner = ScannerIO(fake.port)
+
+"""
+
+import os, pty, select, threading, time, tty
+import numpy as np
+
+class ScannerIO(object):
+
+    '''
+    Background serial I/O with the scanner trigger box.
+
+    port, baud: serial device and speed
+    pulse: byte the box sends on every TR pulse (None counts every byte)
+    command: bytes that start the scanner
+    size: number of pulse times kept in the ring buffer
+    now: clock for the timestamps, in s (use the task's monotonic clock so
+         pulses and onsets share a time base)
+    '''
+
+    def __init__(self, port, baud=57600, pulse=b'5', command=b'[t]',
+                 size=4096, now=None):
+
+        self.port = port
+        self.baud = baud
+        self.pulse = pulse
+        self.command = command
+        self.now = time.time if now is None else now
+        self.times = np.zeros(size)
+        self.count = 0
+        self.ser = None
+        self.error = None
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+
+        '''
+        Starts the thread, which opens the port and then listens.
+        '''
+
+        self.thread.start()
+
+    def run(self):
+
+        import serial
+
+        try:
+            self.ser = serial.Serial(self.port, self.baud, timeout=.05)
+        except Exception as err:
+            self.error = err
+            self.ready.set()
+            return
+        self.ready.set()
+
+        size = len(self.times)
+        while not self.stopped.is_set():
+            data = self.ser.read(max(1, self.ser.in_waiting))
+            if not data:
+                continue
+            t = self.now()
+            for byte in bytearray(data):
+                if self.pulse is None or byte == bytearray(self.pulse)[0]:
+                    # write the slot first, then publish it
+                    self.times[self.count % size] = t
+                    self.count = self.count + 1
+        self.ser.close()
+
+    def waitready(self, timeout=None):
+
+        '''
+        Waits until the port is open. Raises the error if it failed.
+        '''
+
+        if not self.ready.wait(timeout):
+            raise IOError('serial port %s did not open' % self.port)
+        if self.error is not None:
+            raise IOError('serial port %s: %s' % (self.port, self.error))
+
+    def trigger(self, timeout=5):
+
+        '''
+        Sends the start command. Returns the time it was sent.
+        '''
+
+        self.waitready(timeout)
+        self.ser.write(self.command)
+        self.ser.flush()
+
+        return self.now()
+
+    def volume(self):
+
+        '''
+        Index of the most recent volume, -1 before the first pulse.
+        '''
+
+        return self.count - 1
+
+    def lastpulse(self):
+
+        '''
+        Time of the most recent pulse, nan before the first.
+        '''
+
+        count = self.count
+        if count == 0:
+            return float('nan')
+
+        return self.times[(count-1) % len(self.times)]
+
+    def pulsetimes(self):
+
+        '''
+        Copy of the pulse times still in the buffer, oldest first, and the
+        volume index of the first one.
+        '''
+
+        count = self.count
+        size = len(self.times)
+        first = max(0, count - size)
+        idx = np.arange(first, count) % size
+
+        return self.times[idx], first
+
+    def waitvolume(self, vol, timeout=None):
+
+        '''
+        Waits (polling) until volume vol has arrived. Returns False on
+        timeout.
+        '''
+
+        end = None if timeout is None else time.time() + timeout
+        while self.count <= vol:
+            if end is not None and time.time() > end:
+                return False
+            time.sleep(.0005)
+
+        return True
+
+    def write(self, fname, t0=0):
+
+        '''
+        Writes volume index and pulse time (s from t0) of every pulse still
+        in the buffer.
+        '''
+
+        times, first = self.pulsetimes()
+        f = open(fname, 'w')
+        f.write('"volume","time"\n')
+        for vol, t in enumerate(times):
+            f.write('%d, %.6f\n' % (first + vol, t - t0))
+        f.close()
+
+    def close(self):
+
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join(1)
+
+class FakeScanner(object):
+
+    '''
+    Pseudo terminal that behaves like the trigger box: after receiving the
+    start command it sends pulse every tr seconds, nvols times (forever if
+    nvols is None). port is the device name to open.
+    '''
+
+    def __init__(self, tr=2., pulse=b'5', command=b'[t]', nvols=None):
+
+        self.tr = tr
+        self.pulse = pulse
+        self.command = command
+        self.nvols = nvols
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        self.port = os.ttyname(self.slave)
+        self.sent = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+
+        self.thread.start()
+
+    def run(self):
+
+        # wait for the start command
+        got = b''
+        while not self.stopped.is_set() and self.command not in got:
+            if select.select([self.master], [], [], .05)[0]:
+                got = got + os.read(self.master, 64)
+
+        # one pulse per TR, on absolute deadlines
+        start = time.time()
+        while not self.stopped.is_set():
+            if self.nvols is not None and self.sent >= self.nvols:
+                break
+            wait = start + self.sent*self.tr - time.time()
+            if wait > 0 and self.stopped.wait(wait):
+                break
+            os.write(self.master, self.pulse)
+            self.sent = self.sent + 1
+
+    def close(self):
+
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join(1)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Parameter recovery by simulation, without expyriment. A population of
+softmax-hyperbolic agents (true k and m per agent) goes through the
+staircase of stairK.py and then through the WMITC offers generated from
+their staircase fits, all agents at once as (agents x trials) arrays. Both
+sets of simulated choices are fitted for all agents together with FitK's
+batched descent, and the fits are compared with the true parameters.
+
+This is meant for choosing the staircase settings (ntrials, kval, step) and
+the offer settings (pll, tsperbin): run a study per setting and compare the
+bias, spread and correlation of the recovered k and m.
+
+Usage:
+  res = study(nsub=2000, ntrials=60, step=.01, seed=0)
+  print(report(res))
+
+  python simagents.py --nsub 2000 --ntrials 60 --step .01 --seed 0
+
+"""
+
+import numpy as np
+from scipy.special import expit
+from scipy.stats import spearmanr
+import FitK, genoffers
+
+# staircase settings, as in stairK.py
+ntrials = 60
+kval = .02
+step = .01
+ssopts = [(10, 0), (10, 15), (20, 0), (20, 15)]
+lldels = (16, 45)
+
+def population(nsub, kmed=.02, ksd=1., mlo=.2, mhi=2., rng=None):
+
+    '''
+    True parameters of nsub agents: log-normal k around kmed (ksd in log
+    units) and uniform m in [mlo, mhi].
+    '''
+
+    if rng is None:
+        rng = np.random.mtrand._rand
+
+    k = kmed*np.exp(ksd*rng.randn(nsub))
+    m = rng.uniform(mlo, mhi, nsub)
+
+    return k, m
+
+def choose(k, m, data, rng):
+
+    '''
+    Simulated choices (1 for ll) of agents with true k and m (one per row)
+    for (agents x trials) offers in data, [ssamnt ssdel llamnt lldel].
+    '''
+
+    k = np.asarray(k, dtype=float)[:,None]
+    m = np.asarray(m, dtype=float)[:,None]
+    V1 = data[...,0]/(1 + k*data[...,1])
+    V2 = data[...,2]/(1 + k*data[...,3])
+
+    return (rng.rand(*V1.shape) < expit(m*(V2-V1))).astype(float)
+
+def simstair(k, m, ntrials=ntrials, kval=kval, step=step, rng=None):
+
+    '''
+    Runs the stairK.py staircase for every agent at once. Each trial the ll
+    amount is set to the current staircase k, the agent chooses and k moves
+    up by step after an ss choice and down after an ll choice; step shrinks
+    by 5% whenever a k is revisited within 5 trials. Returns the FitK trial
+    matrices (agents x trials x 5) and the staircase k after each trial
+    (agents x trials+1).
+    '''
+
+    if rng is None:
+        rng = np.random.mtrand._rand
+
+    nsub = len(k)
+    data = np.zeros((nsub, ntrials, 5))
+    kvals = np.zeros((nsub, ntrials + 1))
+    kvals[:,0] = kval
+    kv = np.full(nsub, float(kval))
+    st = np.full(nsub, float(step))
+    ss = np.array(ssopts, dtype=float)
+
+    for trial in range(ntrials):
+        # offer from the current staircase k, as itc_stair
+        pick = ss[rng.randint(0, len(ss), nsub)]
+        ssval = pick[:,0]/(1 + kv*pick[:,1])
+        lldel = rng.randint(lldels[0], lldels[1] + 1, nsub).astype(float)
+        llamt = np.round(ssval + ssval*kv*lldel, 1)
+        data[:,trial,:4] = np.column_stack((pick, llamt, lldel))
+        data[:,trial,4] = choose(k, m, data[:,trial][:,None], rng)[:,0]
+
+        # adjust the k estimate
+        kv = np.where(data[:,trial,4] == 0, kv + st, kv - st)
+        kvals[:,trial+1] = kv
+
+        # decrease step size if a k is revisited within 5 consecutive trials
+        if trial > 4:
+            last = np.sort(kvals[:,trial-3:trial+2], axis=1)
+            nuniq = 1 + np.sum(np.diff(last, axis=1) != 0, axis=1)
+            st = np.where(nuniq <= 4, st*.95, st)
+
+    return data, kvals
+
+def offerdata(offers, choices):
+
+    '''
+    FitK trial matrices (agents x trials x 5) from WMITC offers
+    [famnt fdel pamnt pdel] and choices (1 for ll). The option with the
+    longer delay is the ll, as in designworker.fitmatrix.
+    '''
+
+    fll = (offers[...,1] > offers[...,3])[...,None]
+    ss = np.where(fll, offers[...,2:4], offers[...,0:2])
+    ll = np.where(fll, offers[...,0:2], offers[...,2:4])
+
+    return np.concatenate((ss, ll, choices[...,None]), -1)
+
+def fitagents(data, grid=None, chunk=100):
+
+    '''
+    Fits k and m to every agent's trials (agents x trials x 5). The best
+    point of a coarse (k, m) grid (FitK.kmgrid(25, 25) by default) is found
+    for chunk agents at a time, and all agents are then descended together
+    from their grid points with FitK's batched descent. Returns arrays of
+    k, m and loglikelihood.
+    '''
+
+    if grid is None:
+        grid = FitK.kmgrid(25, 25)
+    kgrid, mgrid = grid
+    kg = np.asarray(kgrid, dtype=float)[None,:,None,None]
+    mg = np.asarray(mgrid, dtype=float)[None,None,:,None]
+
+    nsub = len(data)
+    km0 = np.zeros((nsub, 2))
+    for row in range(0, nsub, chunk):
+        part = data[row:row+chunk,None,None]       # (agents x 1 x 1 x trials)
+        dV = part[...,2]/(1 + kg*part[...,3]) - \
+             part[...,0]/(1 + kg*part[...,1])
+        s = np.where(part[...,4] == 1, 1., -1.)
+        surf = np.sum(np.logaddexp(0, -s*mg*dV), axis=-1)
+        best = np.argmin(surf.reshape(len(surf), -1), axis=1)
+        ki, mi = np.unravel_index(best, surf.shape[1:])
+        km0[row:row+chunk] = np.column_stack((kgrid[ki], mgrid[mi]))
+
+    bnds = ((0,1), (0,200))
+    km, f = FitK.descend(FitK.errorgrad_batch, km0, bnds, args=(data,))
+
+    return km[:,0], km[:,1], -f
+
+def recovery(true, est):
+
+    '''
+    Recovery statistics of one parameter: bias and median relative error,
+    root mean square error and the rank correlation of true and estimated
+    values (fits on a bound do not dominate it).
+    '''
+
+    true = np.asarray(true, dtype=float)
+    est = np.asarray(est, dtype=float)
+    err = est - true
+
+    return {'bias': np.mean(err),
+            'medrel': np.median(err/true),
+            'rmse': np.sqrt(np.mean(err**2)),
+            'r': spearmanr(true, est)[0]}
+
+def study(nsub=1000, ntrials=ntrials, kval=kval, step=step, pll=None,
+          tsperbin=None, seed=None, **popargs):
+
+    '''
+    Simulates nsub agents through the staircase and the WMITC offers made
+    from their staircase fits, fits both and returns the true and fitted
+    parameters and the recovery statistics of k and m for each stage.
+    popargs go to population. pll and tsperbin default to genoffers.
+    '''
+
+    rng = np.random.RandomState(seed)
+    k, m = population(nsub, rng=rng, **popargs)
+
+    # staircase and its fit
+    stair, kvals = simstair(k, m, ntrials, kval, step, rng)
+    sk, sm, sll = fitagents(stair)
+
+    # WMITC offers from the staircase fits, answered with the true k and m
+    params = {}
+    if pll is not None:
+        params['pll'] = pll
+    if tsperbin is not None:
+        params['tsperbin'] = tsperbin
+    offers = genoffers.makeoffers(np.maximum(sk, 1e-6), np.maximum(sm, 1e-3),
+                                  rng=rng, **params)
+    wmitc = offerdata(offers, np.zeros(offers.shape[:2]))
+    wmitc[...,4] = choose(k, m, wmitc, rng)
+    wk, wm, wll = fitagents(wmitc)
+
+    return {'k': k, 'm': m,
+            'stair': {'k': sk, 'm': sm, 'll': sll, 'kvals': kvals,
+                      'krec': recovery(k, sk), 'mrec': recovery(m, sm)},
+            'wmitc': {'k': wk, 'm': wm, 'll': wll, 'offers': offers,
+                      'krec': recovery(k, wk), 'mrec': recovery(m, wm)}}
+
+def report(res):
+
+    '''
+    Table of the recovery statistics of a study.
+    '''
+
+    lines = ['%-8s %-5s %10s %10s %10s %8s' %
+             ('stage', 'param', 'bias', 'medrel', 'rmse', 'r')]
+    for stage in ('stair', 'wmitc'):
+        for param in ('k', 'm'):
+            rec = res[stage][param + 'rec']
+            lines.append('%-8s %-5s %10.4g %10.4g %10.4g %8.3f' %
+                         (stage, param, rec['bias'], rec['medrel'],
+                          rec['rmse'], rec['r']))
+
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+
+    import argparse, time
+
+    parser = argparse.ArgumentParser(description='Parameter recovery of the '
+                                     'staircase and WMITC offers by '
+                                     'simulation.')
+    parser.add_argument('--nsub', type=int, default=1000)
+    parser.add_argument('--ntrials', type=int, default=ntrials)
+    parser.add_argument('--kval', type=float, default=kval)
+    parser.add_argument('--step', type=float, default=step)
+    parser.add_argument('--pll', type=float, nargs='+', default=None)
+    parser.add_argument('--tsperbin', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.time()
+    res = study(args.nsub, args.ntrials, args.kval, args.step, args.pll,
+                args.tsperbin, args.seed)
+    print(report(res))
+    print('%d agents in %.1f s' % (args.nsub, time.time() - start))
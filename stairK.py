@@ -7,6 +7,17 @@ discounting preferences, asuming a hyperbolic discounting function. The smaller
 sooner offer is selected from a small range of options. Delays for the larger
 offer are selected with uniform probability, from a range of between 16 and 45 
 days.
+
+With useado set, the staircase is replaced by adaptive design optimization 
+(see adoK.py): a grid posterior over k and the softmax slope m is updated 
+after every choice and the next offer is the one with the largest expected 
+information gain. The update and design choice run during the ITI. This
+is a different protocol (adotrials trials, 30 by default, instead of 60
+staircase trials), so it is off unless useado is set.
+
+The time spent in each phase of every trial (building and presenting the
+offer, the response, the update, logging) is written next to the data file
+as _profile.csv (see phaseprof.py).
  
 Check out:	
 http://en.wikipedia.org/wiki/Hyperbolic_discounting
@@ -15,15 +26,23 @@ http://en.wikipedia.org/wiki/Hyperbolic_discounting
 
 from expyriment import design, control, stimuli
 import random, numpy, os
+import adoK, adotables
+from phaseprof import PhaseProfile
+from trialsched import timingfile
 
-# make sure the script runs on the appropriate directory
+# make sure the script runs on the appropriate directory (ITC_MAINDIR, set
+# e.g. by headless.py replays, overrides it)
 #os.chdir('/Users/christianrodriguez/Dropbox/Python')
-os.chdir('/Users/Marjolein/Dropbox/Python')
+os.chdir(os.environ.get('ITC_MAINDIR', '/Users/Marjolein/Dropbox/Python'))
 
 # Create and initialize an Experiment
 ntrials = 60
 kval = .02
 step = .01
+useado = False    # pick offers by adaptive design optimization (changes
+                  # the protocol: adotrials ADO trials instead of ntrials)
+adotrials = 30    # ADO reaches the staircase precision in about half the trials
+adofile = 'data/ado/stairK' # precomputed ADO tables (python adotables.py)
 box_size = (100, 100)
 exp = design.Experiment('WM ITC')
 control.defaults.initialize_delay = 0
@@ -61,22 +80,27 @@ You can take that time to blink or just wait for the next trial.\n\n\n\
 \
 Press any key to start the task."
 
-# staircase scren builder
-def itc_stair(kval, curr_trial):
+# staircase scren builder, offer is [ssamnt ssdel llamnt lldel] if given
+def itc_stair(kval, curr_trial, offer=None):
     
     screen = stimuli.BlankScreen()
     
     # make the offer strings to place on screen
-    ss = random.choice([(10, 0), (10, 15), (20,0), (20, 15)])
-    ssval = ss[0]/(1+kval*ss[1])
+    if offer is None:
+        ss = random.choice([(10, 0), (10, 15), (20,0), (20, 15)])
+        ssval = ss[0]/(1+kval*ss[1])
+        lldel = random.randint(16,45)
+        llamt = round(ssval+ssval*kval*lldel,1)
+    else:
+        ss = (int(offer[0]), int(offer[1]))
+        llamt = float(offer[2])
+        lldel = int(offer[3])
     
     if ss[1]==0:
         sstext = '$'+'%.2f' % (ss[0])+'\nToday'
     else:
         sstext = '$'+'%.2f' % (ss[0])+'\n'+str(ss[1])+' days'
         
-    lldel = random.randint(16,45)
-    llamt = round(ssval+ssval*kval*lldel,1)
     lltext = '$'+'%.2f' % llamt+'\n'+str(lldel)+' days'
     
     lstim = stimuli.TextBox(text=sstext, size=box_size, position=sspos, \
@@ -85,13 +109,30 @@ def itc_stair(kval, curr_trial):
     rstim = stimuli.TextBox(text=lltext, size=box_size, position=llpos, \
             text_justification=1)
     rstim.plot(screen)
+    prof.mark(curr_trial, 'build')
     screen.present()
+    prof.mark(curr_trial, 'present')
     return ss, llamt, lldel
       
 # preload fixation cross for ITI
 fixcross = stimuli.FixCross()
 fixcross.preload()
 
+# map the precomputed ADO tables, or tabulate the design space if missing
+if useado:
+    ntrials = adotrials
+    if adotables.hastables(adofile):
+        ado = adoK.ADOK(*adotables.loadtables(adofile))
+    else:
+        ado = adoK.ADOK()
+    offer = ado.nextdesign()
+else:
+    offer = None
+
+# time spent in each phase of every trial
+prof = PhaseProfile(('build', 'present', 'response', 'iti', 'update', 
+                     'kvals', 'itiwait', 'log'), ntrials)
+
 # Start Experiment
 exp.data_variable_names = ['trial', 'k', 'ssamnt', 'ssdel', \
                             'llamnt', 'lldel', 'choice', 'RT']
@@ -103,38 +144,64 @@ response_device.wait()
   
 # loop for specified number of trials
 trial = 0
-kvals = numpy.array([kval])
+kvals = numpy.zeros(ntrials + 1)
+kvals[0] = kval
 while trial < ntrials:
     
     # present trial
-    ss, llamt, lldel = itc_stair(kval, trial)
+    prof.start(trial)
+    ss, llamt, lldel = itc_stair(kval, trial, offer)
     
     # collect behavior
     button, rt = response_device.wait_char(['f','j'])
+    prof.mark(trial, 'response')
     
     # present ITI screen
     fixcross.present()
-    exp.clock.wait(random.randint(300,500))
+    iti = random.randint(300,500)
+    itistrt = exp.clock.time
+    prof.mark(trial, 'iti')
 
-    # adjust the k estimate
+    # code the choice
     if 'f' in button:
-        kval = kval + step
         ll = 0
     elif 'j' in button:
-        kval = kval - step
         ll = 1
+
+    if useado:
+        # update the posterior and pick the next offer during the ITI
+        ado.update([ss[0], ss[1], llamt, lldel], ll)
+        kval = ado.estimate()[0]
+        offer = ado.nextdesign()
+    else:
+        # adjust the k estimate
+        if ll == 0:
+            kval = kval + step
+        else:
+            kval = kval - step
+    prof.mark(trial, 'update')
         
     # keep track of k values
-    kvals = numpy.concatenate((kvals, numpy.array([kval])))
+    kvals[trial + 1] = kval
         
     # decrease step size if a k is revisited within 5 consequetive trials
-    if trial > 4 and len(numpy.unique(kvals[-5:]))<=4:
+    if not useado and trial > 4 and \
+       len(numpy.unique(kvals[trial-3:trial+2]))<=4:
         step = step *.95
+    prof.mark(trial, 'kvals')
+
+    # wait out whatever is left of the ITI
+    exp.clock.wait(max(0, iti - (exp.clock.time - itistrt)))
+    prof.mark(trial, 'itiwait')
     
     # add data to file
     exp.data.add([trial, round(kval,3), ss[0], ss[1], llamt, lldel, ll, rt])
+    prof.mark(trial, 'log')
     trial = trial + 1
 
+# write the latency of each phase next to the data file
+prof.write(timingfile(exp.data.fullpath, '_profile.csv'))
+
 # End Experiment
 control.end(goodbye_text=None, goodbye_delay=None, fast_quit=None)
 #execfile('runFitK.py',)
\ No newline at end of file
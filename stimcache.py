@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Pre-rendered offer screens for a WMITC run block. Building a BlankScreen and
+two TextLines and plotting them right before present() puts the rendering
+time between the planned and the logged onsets of the offers. OfferScreens
+builds and preloads the screens of every trial in the block (the yellow
+fixed offer and the green adjusted offer) before the scanner is triggered,
+so the trial loop only presents surfaces that are ready.
+
+To bound memory, only the next 'ahead' trials are kept preloaded: release()
+unloads the screens of a trial that is over and preloads the next one, and
+is meant to be called during an idle period (ITI or delay).
+
+Usage:
+  screens = OfferScreens(offers, tsize, amtpos, delpos)
+  screens.prepare()                 # before the trigger
+  screens.first(trial).present()    # yellow, fixed offer
+  screens.second(trial).present()   # green, adjusted offer
+  screens.release(trial)            # optional, after the trial
+
+"""
+
+import numpy as np
+from expyriment import stimuli
+
+yellow = (255,255,0)  # first (fixed) offer
+green  = (0,255,0)    # second (probability adjusted) offer
+
+def offertext(offer):
+
+    '''
+    Amount and delay strings for one offer [amount delay].
+    '''
+
+    amnt = '$'+'%.2f' % (np.round(offer[0], decimals = 1))
+    if offer[1] == 0:
+        delay = 'Today'
+    else:
+        delay = '%.0f' % (offer[1])+' days'
+
+    return amnt, delay
+
+def offerscreen(offer, colour, tsize, amtpos, delpos):
+
+    '''
+    Builds (without preloading) the screen for one offer [amount delay].
+    '''
+
+    amnt, delay = offertext(offer)
+    screen = stimuli.BlankScreen()
+    stimuli.TextLine(text=amnt, position=amtpos, text_colour=colour,
+                     text_size = tsize).plot(screen)
+    stimuli.TextLine(text=delay, position=delpos, text_colour=colour,
+                     text_size = tsize).plot(screen)
+
+    return screen
+
+class OfferScreens(object):
+
+    '''
+    Screens of both offers of every trial in offers [famnt fdel pamnt pdel].
+    ahead is the number of trials kept preloaded (all of them by default).
+    '''
+
+    def __init__(self, offers, tsize, amtpos, delpos, ahead=None):
+
+        self.offers = np.array(offers, dtype=float)
+        self.tsize = tsize
+        self.amtpos = amtpos
+        self.delpos = delpos
+        self.ahead = len(self.offers) if ahead is None else ahead
+        self.screens = {}
+
+    def load(self, trial):
+
+        '''
+        Builds and preloads both screens of a trial, if not done yet.
+        '''
+
+        if trial in self.screens or trial >= len(self.offers):
+            return
+        pair = (offerscreen(self.offers[trial,:2], yellow, self.tsize,
+                            self.amtpos, self.delpos),
+                offerscreen(self.offers[trial,2:], green, self.tsize,
+                            self.amtpos, self.delpos))
+        for screen in pair:
+            screen.preload()
+        self.screens[trial] = pair
+
+    def prepare(self, start=0):
+
+        '''
+        Preloads the first 'ahead' trials from start on.
+        '''
+
+        for trial in range(start, start + self.ahead):
+            self.load(trial)
+
+    def first(self, trial):
+
+        self.load(trial)
+        return self.screens[trial][0]
+
+    def second(self, trial):
+
+        self.load(trial)
+        return self.screens[trial][1]
+
+    def setsecond(self, trial, offer):
+
+        '''
+        Replaces the second offer of a trial (e.g. one adapted during the
+        delay) and preloads its screen.
+        '''
+
+        self.offers[trial,2:] = offer
+        self.load(trial)
+        screen = offerscreen(self.offers[trial,2:], green, self.tsize,
+                             self.amtpos, self.delpos)
+        screen.preload()
+        self.screens[trial][1].unload()
+        self.screens[trial] = (self.screens[trial][0], screen)
+
+    def release(self, trial):
+
+        '''
+        Unloads the screens of a finished trial and preloads the trial
+        that is now 'ahead' trials away.
+        '''
+
+        pair = self.screens.pop(trial, None)
+        if pair is not None:
+            for screen in pair:
+                screen.unload()
+        self.load(trial + self.ahead)
+
+    def nloaded(self):
+
+        return len(self.screens)
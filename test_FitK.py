@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Recovery and consistency checks of FitK on simulated staircases (see
+simagents.py). Each fit is compared with the serial fit it replaced: L-BFGS-B
+from every random start in turn.
+
+Usage:
+  python -m pytest test_FitK.py
+
+"""
+
+import numpy as np
+from scipy import optimize
+import FitK, simagents
+
+bnds = ((0,1), (0,200))
+
+def stair(seed):
+
+    '''
+    Trial matrix of one simulated subject's staircase.
+    '''
+
+    rng = np.random.RandomState(seed)
+    k, m = simagents.population(1, rng=rng)
+    data, kvals = simagents.simstair(k, m, rng=rng)
+
+    return data[0]
+
+def serialfit(data, nstarts=200, seed=0):
+
+    '''
+    -1*loglikelihood of the best of nstarts L-BFGS-B runs, as the original
+    fitk did.
+    '''
+
+    rng = np.random.RandomState(seed)
+    best = np.inf
+    for i in range(nstarts):
+        res = optimize.minimize(FitK.errorgrad, [rng.rand()*.02, rng.rand()*2],
+                                args=(data,), jac=True, bounds=bnds,
+                                method='L-BFGS-B', options={'maxiter':10000})
+        best = min(best, res.fun)
+
+    return best
+
+def test_fitk_matches_serial():
+
+    # seeds 0, 1, 3 and 7 used to stall at m = 0 (chance level)
+    for seed in range(10):
+        data = stair(seed)
+        np.random.seed(seed)
+        k, m, ll, res = FitK.fitk(data)
+        assert ll >= -serialfit(data, seed=seed) - 1e-4, seed
+        assert ll > len(data)*np.log(.5) + 1, seed
+
+def test_errorgrad():
+
+    data = stair(0)
+    km = np.array([.05, .8])
+    f, g = FitK.errorgrad(km, data)
+    eps = np.array([1e-7, 1e-6])
+    for j in range(2):
+        step = np.zeros(2)
+        step[j] = eps[j]
+        num = (FitK.errorgrad(km + step, data)[0] -
+               FitK.errorgrad(km - step, data)[0])/(2*eps[j])
+        assert abs(num - g[j]) < 1e-4*max(1, abs(g[j]))
+
+def test_recovery():
+
+    # long staircases of one agent recover its k
+    rng = np.random.RandomState(0)
+    data, kvals = simagents.simstair(np.array([.03]), np.array([2.]),
+                                     ntrials=400, rng=rng)
+    np.random.seed(0)
+    k, m, ll, res = FitK.fitk(data[0])
+    assert abs(np.log(k/.03)) < .3
+
+def test_fitkgrid_matches_serial():
+
+    # seeds 2, 6, 21 and 33 used to stop about .01 short of the optimum
+    for seed in (2, 6, 21, 33):
+        data = stair(seed)
+        k, m, ll, res, surf = FitK.fitkgrid(data)
+        assert ll >= -serialfit(data, seed=seed) - 1e-6, seed
+        assert np.all(ll >= surf.max() - 1e-9)
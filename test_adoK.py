@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Consistency and recovery checks of the ADO engine: the grid posterior
+against a direct product of choice likelihoods, the memory-mapped tables
+against the computed ones, and a simulated staircase run by ADO.
+
+Usage:
+  python -m pytest test_adoK.py
+
+"""
+
+import os, tempfile
+import numpy
+from scipy.special import expit
+import adoK, adotables
+
+def simchoice(k, m, design, rng):
+
+    ssamt, ssdel, llamt, lldel = design
+    dV = llamt/(1 + k*lldel) - ssamt/(1 + k*ssdel)
+
+    return int(rng.rand() < expit(m*dV))
+
+def test_posterior_matches_likelihood():
+
+    rng = numpy.random.RandomState(0)
+    ado = adoK.ADOK()
+    designs, choices = [], []
+    for trial in range(20):
+        design = ado.designs[rng.randint(len(ado.designs))]
+        choice = simchoice(.02, 1., design, rng)
+        ado.update(design, choice)
+        designs.append(design)
+        choices.append(choice)
+
+    # log p(choice) of every trial and grid point, summed over trials
+    d = numpy.array(designs)[:,:,None]
+    dV = d[:,2]/(1 + ado.ks*d[:,3]) - d[:,0]/(1 + ado.ks*d[:,1])
+    s = numpy.where(numpy.array(choices)[:,None] == 1, 1., -1.)
+    loglik = -numpy.sum(numpy.logaddexp(0, -s*ado.ms*dV), axis=0)
+    post = numpy.exp(loglik - loglik.max())
+    assert numpy.allclose(ado.post, post/post.sum(), atol=1e-8)
+
+def test_infogain():
+
+    ado = adoK.ADOK()
+    gain = ado.infogain()
+    assert numpy.all(gain > -1e-5)
+    assert numpy.all(gain <= numpy.log(2) + 1e-5)
+
+def test_tables_match():
+
+    tmp = tempfile.mkdtemp()
+    base = os.path.join(tmp, 'stairK')
+    adotables.maketables(base)
+    mapped = adoK.ADOK(*adotables.loadtables(base))
+    ado = adoK.ADOK()
+    assert numpy.array_equal(mapped.nextdesign(), ado.nextdesign())
+    assert numpy.allclose(mapped.infogain(), ado.infogain(), atol=1e-5)
+
+def test_recovery():
+
+    # ADO staircases of simulated agents end near their k
+    rng = numpy.random.RandomState(1)
+    for k in (.005, .02, .08):
+        ado = adoK.ADOK()
+        for trial in range(60):
+            design = ado.nextdesign()
+            ado.update(design, simchoice(k, 2., design, rng))
+        assert abs(numpy.log(ado.estimate()[0]/k)) < numpy.log(2)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the bootstrap fits on a simulated staircase: no replicate stalls
+on the m = 0 bound, the replicate fits match L-BFGS-B and the intervals
+cover the fitted parameters.
+
+Usage:
+  python -m pytest test_bootK.py
+
+"""
+
+import numpy as np
+from scipy import optimize
+import FitK, bootK
+from test_FitK import stair
+
+def test_no_replicate_on_bound():
+
+    # with seed 2, 282 of 2000 replicates used to end at m = 0
+    data = stair(2)
+    kci, mci, est = bootK.bootk(data, (.02, .8),
+                                rng=np.random.RandomState(2))
+    boot = bootK.replicates(data, (.02, .8), 2000,
+                            rng=np.random.RandomState(2))[0]
+    assert np.all(est[:,1] > 1e-3)
+    assert np.all(FitK.errorfit_batch(est, boot) < len(data)*np.log(2) - .1)
+    assert mci[0] > 0
+
+    # the batched fits are as good as L-BFGS-B from the same point
+    for b in range(0, 2000, 100):
+        res = optimize.minimize(FitK.errorgrad, est[b], args=(boot[b],),
+                                jac=True, bounds=((0,1), (0,200)),
+                                method='L-BFGS-B')
+        assert FitK.errorfit_batch(est[b], boot[b])[0] <= res.fun + 1e-3
+
+def test_intervals():
+
+    data = stair(1)
+    np.random.seed(1)
+    k, m, ll, res = FitK.fitk(data)
+    for method in ('parametric', 'resample'):
+        kci, mci, est = bootK.bootk(data, (k, m), nboot=500, method=method,
+                                    rng=np.random.RandomState(0))
+        assert kci[0] <= k <= kci[1]
+        assert mci[0] <= m <= mci[1]
+        assert est.shape == (500, 2)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the session catalog on a small data tree: lookups by subject,
+task, run and kind, and updates after files are added and removed.
+
+Usage:
+  python -m pytest test_catalog.py
+
+"""
+
+import os, tempfile
+import catalog
+
+def touch(path, text=''):
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    f = open(path, 'w')
+    f.write(text)
+    f.close()
+
+def wmitc(run):
+
+    return '#e\n' * 9 + 'subject_id,run,trial,famnt\n1,%d,0,20\n' % run
+
+def maketree():
+
+    datadir = tempfile.mkdtemp()
+    touch(os.path.join(datadir, 'stairK_01_201409161320.xpd'), '#e\n')
+    touch(os.path.join(datadir, 'stairK_01_201409171000.xpd'), '#e\n')
+    touch(os.path.join(datadir, 'stairK_02_201409161400.xpd'), '#e\n')
+    touch(os.path.join(datadir, 'WMITC_01_201409181100.xpd'), wmitc(1))
+    touch(os.path.join(datadir, 'WMITC_01_201409181100_timing.csv'))
+    touch(os.path.join(datadir, 'WMITC_01_201409181130.xpd'), wmitc(2))
+    touch(os.path.join(datadir, 'offers', '1_offers.txt'))
+    touch(os.path.join(datadir, 'fitted', '01_fitkparams.txt'))
+    touch(os.path.join(datadir, 'fitted', 'notes.txt'))
+
+    return datadir
+
+def test_lookups():
+
+    datadir = maketree()
+    cat = catalog.Catalog(datadir).update()
+    join = lambda *p: os.path.join(datadir, *p)
+
+    assert cat.subjects('stairK') == [1, 2]
+    assert cat.sessions(1, 'stairK') == ['201409161320', '201409171000']
+    assert cat.latest('01', 'stairK') == join('stairK_01_201409171000.xpd')
+    assert cat.only(2, 'stairK') == join('stairK_02_201409161400.xpd')
+    assert cat.only(1, 'WMITC', run=2) == join('WMITC_01_201409181130.xpd')
+    assert cat.latest(1, 'WMITC', run=1, kind='timing') == \
+           join('WMITC_01_201409181100_timing.csv')
+    assert cat.latest(3, 'stairK') is None
+    assert cat.offers(1) == join('offers', '1_offers.txt')
+    assert cat.params(1) == join('fitted', '01_fitkparams.txt')
+    try:
+        cat.only(1, 'stairK')
+    except ValueError:
+        pass
+    else:
+        assert False
+
+def test_update():
+
+    datadir = maketree()
+    catalog.Catalog(datadir).update()
+    assert os.path.isfile(os.path.join(datadir, catalog.catalogname))
+
+    # a new session and a removed one are seen by a catalog loaded later
+    touch(os.path.join(datadir, 'stairK_02_201409201200.xpd'), '#e\n')
+    os.remove(os.path.join(datadir, 'stairK_01_201409161320.xpd'))
+    os.remove(os.path.join(datadir, 'fitted', '01_fitkparams.txt'))
+    cat = catalog.Catalog(datadir).update()
+    assert cat.sessions(2, 'stairK') == ['201409161400', '201409201200']
+    assert cat.sessions(1, 'stairK') == ['201409171000']
+    assert cat.params(1) is None
+
+    # a directory that is gone takes its files along
+    os.remove(os.path.join(datadir, 'offers', '1_offers.txt'))
+    os.rmdir(os.path.join(datadir, 'offers'))
+    assert catalog.Catalog(datadir).update().offers(1) is None
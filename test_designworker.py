@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the background offer worker: what Retarget returns, and an
+adaptive WMITC run replayed headless (see headless.py) with the worker in
+the loop.
+
+Usage:
+  python -m pytest test_designworker.py
+
+"""
+
+import time, tempfile
+import numpy as np
+import designworker, genoffers, headless
+
+def history(offers, k=.02, m=.8, seed=0):
+
+    '''
+    WMITC history rows [famnt fdel pamnt pdel choice] of an agent with
+    (k, m), choice 1 for ll.
+    '''
+
+    rng = np.random.RandomState(seed)
+    data = designworker.fitmatrix(np.column_stack((offers,
+                                                   np.zeros(len(offers)))))
+    dv = data[:,2]/(1 + k*data[:,3]) - data[:,0]/(1 + k*data[:,1])
+    choices = rng.rand(len(offers)) < 1/(1 + np.exp(-m*dv))
+
+    return [list(o) + [float(c)] for o, c in zip(offers, choices)]
+
+def test_retarget_second_offer():
+
+    # WMITC replaces offers[trial,2:] with what Retarget returns
+    offers = genoffers.makeoffers(.02, .8, rng=np.random.RandomState(0))
+    fun = designworker.Retarget(.02, .8)
+    assert fun(5, history(offers[:5]), offers[5]) is None
+    poffer = fun(40, history(offers[:40]), offers[40])
+    assert np.shape(poffer) == (2,)
+    assert poffer[1] == offers[40,3]
+    assert poffer[0] > 0
+
+def test_adaptive_replay():
+
+    workdir = tempfile.mkdtemp()
+    headless.makeoffers(workdir, 1, seed=0)
+    fname = headless.replay('WMITC.py', workdir, 1, answers=[1], seed=0,
+                            settings={'adaptive': True})
+    offers = np.genfromtxt('%s/data/offers/1_offers.txt' % workdir,
+                           delimiter=',', skip_header=1)[:40]
+    data = np.genfromtxt(fname, delimiter=',', skip_header=10)
+
+    # columns after subject_id: run, trial, famnt, fdel, pamnt, pdel, ...
+    assert data.shape[0] == len(offers)
+    assert np.array_equal(data[:,3:5], offers[:,:2])
+    assert np.array_equal(data[:,6], offers[:,3])
+    assert np.any(data[:,5] != offers[:,2])
+
+def test_late_results_dropped():
+
+    # a result that misses its deadline must not stay around
+    def slow(trial, delay):
+        time.sleep(delay)
+        return [20., 30.]
+
+    worker = designworker.DesignWorker(slow)
+    worker.start()
+    worker.request(0, .2)
+    poffer, adapted = worker.get(0, [10., 30.], timeout=.01)
+    assert not adapted
+    time.sleep(.3)
+    worker.request(1, 0.)
+    poffer, adapted = worker.get(1, [10., 30.], timeout=1.)
+    worker.close()
+    assert adapted and list(poffer) == [20., 30.]
+    assert worker.results == {}
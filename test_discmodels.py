@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the discount model fits on simulated staircases: the hyperbolic
+model against FitK.fitk, the nesting of hyperbolic in hyperboloid, the
+exponential model against a dense grid, and the gradients.
+
+Usage:
+  python -m pytest test_discmodels.py
+
+"""
+
+import numpy as np
+import FitK, discmodels
+from test_FitK import stair
+
+def test_hyperbolic_matches_fitk():
+
+    # seeds 0, 1 and 3 used to stop at m = 0 (chance level)
+    for seed in (0, 1, 3):
+        data = stair(seed)
+        np.random.seed(seed)
+        k, m, ll, res = FitK.fitk(data)
+        fit = discmodels.fitmodel(data, discmodels.Hyperbolic(),
+                                  rng=np.random.RandomState(seed))
+        assert abs(fit['LL'] - ll) < 1e-4, seed
+
+def test_nested():
+
+    data = stair(0)
+    res = discmodels.fitmodels(data, procs=1, seed=0)
+    assert res[2]['LL'] >= res[0]['LL'] - 1e-6
+    stat, df, p = discmodels.lrtest(res[0], res[2])
+    assert df == 1 and stat >= 0
+
+def test_exponential_grid():
+
+    data = stair(3)
+    model = discmodels.Exponential()
+    k, m = np.meshgrid(np.logspace(-5, 0, 200),
+                       np.logspace(-3, np.log10(200), 200))
+    f = discmodels.modelgrad(np.column_stack((k.ravel(), m.ravel())),
+                             data, model)[0]
+    fit = discmodels.fitmodel(data, model, rng=np.random.RandomState(0))
+    assert fit['LL'] >= -f.min() - 1e-6
+
+def test_gradients():
+
+    data = stair(1)
+    for model, theta in zip(discmodels.models,
+                            ([.05, .8], [.03, .5], [.05, .7, .8])):
+        theta = np.array(theta)
+        f, g = discmodels.modelgrad(theta, data, model)
+        for j in range(len(theta)):
+            step = np.zeros(len(theta))
+            step[j] = 1e-7
+            num = (discmodels.modelgrad(theta + step, data, model)[0] -
+                   discmodels.modelgrad(theta - step, data, model)[0])/2e-7
+            assert abs(num[0] - g[0,j]) < 1e-4*max(1, abs(g[0,j]))
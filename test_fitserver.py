@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the fitting service on a Unix socket in a temporary directory:
+fits match FitK, repeated jobs come from the cache, offers without a seed
+do not, failed jobs raise, and remotefit works without a service.
+
+Usage:
+  python -m pytest test_fitserver.py
+
+"""
+
+import os, time, tempfile, threading
+import numpy as np
+import FitK, fitserver
+from test_FitK import stair
+
+def startserver():
+
+    path = os.path.join(tempfile.mkdtemp(), 'fitK.sock')
+    thread = threading.Thread(target=fitserver.serve,
+                              kwargs={'path': path, 'warm': False})
+    thread.daemon = True
+    thread.start()
+    client = fitserver.FitClient(path, timeout=60)
+    for i in range(100):
+        if os.path.exists(path) and client.alive():
+            break
+        time.sleep(.05)
+
+    return client, thread
+
+def test_service():
+
+    client, thread = startserver()
+    try:
+        data = stair(0)
+        k, m, ll = client.fit(data, grid=True)
+        assert abs(ll - FitK.fitk(data, grid=True)[2]) < 1e-6
+        assert client.call('fit', data=data.tolist(), grid=True) == [k, m, ll]
+        assert client.call('ping')['cached'] == 1
+
+        a = client.offers(.02, .8, seed=1)
+        assert a.shape == (160, 4)
+        assert np.array_equal(a, client.offers(.02, .8, seed=1))
+        assert not np.array_equal(client.offers(.02, .8),
+                                  client.offers(.02, .8))
+
+        try:
+            client.call('nothing')
+        except RuntimeError as err:
+            assert 'unknown job' in str(err)
+        else:
+            assert False
+    finally:
+        client.stop()
+        thread.join(5)
+    assert not os.path.exists(client.path)
+
+def test_remotefit_local():
+
+    data = stair(1)
+    path = os.path.join(tempfile.mkdtemp(), 'none.sock')
+    k, m, ll = fitserver.remotefit(data, grid=True, path=path)
+    assert abs(ll - FitK.fitk(data, grid=True)[2]) < 1e-6
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the offer generator: every offer has the choice probability it
+was made for, batches match their scalar shapes, and readfits merges the
+fit table with newer per-subject fits.
+
+Usage:
+  python -m pytest test_genoffers.py
+
+"""
+
+import os, time, tempfile
+import numpy as np
+import genoffers, trialstore
+
+def pll(offers, k, m):
+
+    '''
+    p(ll) of every offer [famnt fdelay pamnt pdelay] under (k, m).
+    '''
+
+    fll = offers[:,1] > offers[:,3]
+    ss = np.where(fll[:,None], offers[:,2:4], offers[:,0:2])
+    ll = np.where(fll[:,None], offers[:,0:2], offers[:,2:4])
+    dv = ll[:,0]/(1 + k*ll[:,1]) - ss[:,0]/(1 + k*ss[:,1])
+
+    return 1/(1 + np.exp(-m*dv))
+
+def test_target_probabilities():
+
+    for k, m in ((.02, .8), (.005, 2.), (.1, .3)):
+        offers = genoffers.makeoffers(k, m, rng=np.random.RandomState(0))
+        assert offers.shape == (4*genoffers.tsperbin, 4)
+        p = pll(offers, k, m)
+        # rounding the amounts to cents moves p a little
+        near = np.abs(p[:,None] - np.array(genoffers.pll)[None,:]) < .02
+        assert np.all(near.any(axis=1))
+        assert np.all(near.sum(axis=0) == genoffers.tsperbin)
+
+def test_batch():
+
+    k = np.array([.01, .02, .05])
+    m = np.array([.5, 1., 2.])
+    offers = genoffers.makeoffers(k, m, rng=np.random.RandomState(0))
+    assert offers.shape == (3, 4*genoffers.tsperbin, 4)
+    for i in range(3):
+        assert np.all(np.abs(pll(offers[i], k[i], m[i]) - .5) > .05)
+
+def test_readfits_merge():
+
+    tmp = tempfile.mkdtemp()
+    trialstore.writeparams(os.path.join(tmp, '01_fitkparams.txt'),
+                           .01, 1., -30)
+    f = open(os.path.join(tmp, 'fitkparams_all.txt'), 'w')
+    f.write('"subject","k","m","ll","file"\n')
+    f.write('01, 0.030000, 0.500000, -31.0, stairK_01_1.xpd\n')
+    f.write('02, 0.020000, 0.800000, -32.0, stairK_02_1.xpd\n')
+    f.close()
+    os.utime(os.path.join(tmp, '01_fitkparams.txt'),
+             (time.time() - 10, time.time() - 10))
+
+    # 02 is refitted after the table, 03 is not in it
+    trialstore.writeparams(os.path.join(tmp, '02_fitkparams.txt'),
+                           .04, 1.5, -29)
+    trialstore.writeparams(os.path.join(tmp, '03_fitkparams.txt'),
+                           .05, .9, -28)
+    os.utime(os.path.join(tmp, 'fitkparams_all.txt'),
+             (time.time() - 5, time.time() - 5))
+
+    subns, k, m = genoffers.readfits(tmp)
+    assert subns == ['01', '02', '03']
+    assert np.allclose(k, [.03, .04, .05])
+    assert np.allclose(m, [.5, 1.5, .9])
+
+def test_writeall():
+
+    tmp = tempfile.mkdtemp()
+    trialstore.writeparams(os.path.join(tmp, '04_fitkparams.txt'),
+                           .02, .8, -30)
+    offersdir = os.path.join(tmp, 'offers')
+    assert genoffers.writeall(tmp, offersdir,
+                              np.random.RandomState(0)) == ['04']
+    offers = trialstore.readoffers(os.path.join(offersdir, '04_offers.txt'))
+    assert offers.shape == (4*genoffers.tsperbin, 4)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Recovery checks of the online trial-wise GLM on a noise-free simulated run:
+WMITC-like trials every 20 s, known betas per trial and event, a raw ROI
+baseline and a linear drift.
+
+Usage:
+  python -m pytest test_onlineglm.py
+
+"""
+
+import numpy as np
+import onlineglm
+
+def simrun(glm, base, ntrials=20, tr=2., seed=0):
+
+    '''
+    Feeds a simulated run to glm, adding each trial's events at its first
+    onset as WMITC.py does. Returns the true betas per trial.
+    '''
+
+    rng = np.random.RandomState(seed)
+    times = np.arange(0, glm.runlength, tr)
+    y = base + 3*(2*times/glm.runlength - 1)
+    trials = {}
+    for trial in range(ntrials):
+        t0 = 5. + 20*trial
+        trials[trial] = ([(t0, 1.5), (t0 + 2, 6.), (t0 + 10, 1.5)],
+                         rng.uniform(1, 10, len(onlineglm.events)))
+        for (onset, dur), beta in zip(*trials[trial]):
+            y = y + beta*onlineglm.boxcar(times, onset, dur)
+
+    for vol, t in enumerate(times):
+        for trial in trials:
+            evs = trials[trial][0]
+            if evs[0][0] <= t < evs[0][0] + tr:
+                for ev, (onset, dur) in zip(onlineglm.events, evs):
+                    glm.addevent(trial, ev, onset, dur)
+        glm.update([y[vol]], t)
+
+    return dict((trial, trials[trial][1]) for trial in trials)
+
+def maxerror(glm, true):
+
+    return max(abs(glm.estimate(trial)[ev][0] - true[trial][i])
+               for trial in true for i, ev in enumerate(onlineglm.events))
+
+def test_recovery_raw_baseline():
+
+    # a raw baseline of 1000 used to be shrunk into the trial betas
+    glm = onlineglm.OnlineGLM(1, 440.)
+    true = simrun(glm, 1000.)
+    assert maxerror(glm, true) < .05
+
+def test_baseline_invariance():
+
+    est = []
+    for base in (0., 1000.):
+        glm = onlineglm.OnlineGLM(1, 440.)
+        simrun(glm, base)
+        est.append([glm.estimate(0)[ev][0] for ev in onlineglm.events])
+    assert np.allclose(est[0], est[1], atol=1e-3)
+
+def test_diffuse_prior_exact():
+
+    glm = onlineglm.OnlineGLM(1, 440., delta=1e10, window=60., nslots=6)
+    true = simrun(glm, 1000.)
+    assert maxerror(glm, true) < 1e-3
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the headless report on replayed and fitted staircases (see
+headless.py and batchFitK.py): figures are drawn once, skipped while their
+inputs are unchanged and drawn again when a fit changes. Skipped without
+matplotlib.
+
+Usage:
+  python -m pytest test_reportK.py
+
+"""
+
+import os, tempfile
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+
+import batchFitK, headless, reportK, trialstore
+
+def fittedtree(nsub=3):
+
+    workdir = tempfile.mkdtemp()
+    for subject in range(1, nsub + 1):
+        headless.replay('stairK.py', workdir, subject, seed=subject)
+    datadir = os.path.join(workdir, 'data')
+    batchFitK.batchfit(datadir, procs=2, grid=True)
+
+    return datadir
+
+def test_report():
+
+    datadir = fittedtree()
+    outdir = os.path.join(datadir, 'fitted', 'report')
+
+    done, skipped = reportK.report(datadir, procs=2)
+    assert sorted(done) == ['01', '02', '03'] and skipped == []
+    for subns in done:
+        fname = os.path.join(outdir, '%s_fit.png' % subns)
+        assert open(fname, 'rb').read(8) == b'\x89PNG\r\n\x1a\n'
+    assert '02_fit.png' in open(os.path.join(outdir, 'index.html')).read()
+
+    done, skipped = reportK.report(datadir, procs=2)
+    assert done == [] and len(skipped) == 3
+
+    # a new fit of one subject redraws only that figure
+    pfile = batchFitK.paramsfile(datadir, '02')
+    k, m, ll = trialstore.readparams(pfile)
+    trialstore.writeparams(pfile, k*2, m, ll)
+    os.remove(os.path.join(datadir, 'fitted', 'fitkparams_all.txt'))
+    done, skipped = reportK.report(datadir, procs=2)
+    assert done == ['02'] and len(skipped) == 2
+
+def test_thin():
+
+    data = np.random.RandomState(0).rand(2000, 5)
+    drawn = reportK.thin(data, 500)
+    assert len(drawn) == 500
+    assert np.array_equal(drawn[0], data[0])
+    assert np.array_equal(drawn[-1], data[-1])
+    assert len(reportK.thin(data[:10], 500)) == 10
+    assert reportK.figkey(drawn, (.02, .8)) != reportK.figkey(drawn, (.02, .9))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the absolute-deadline scheduler on a virtual clock: planned
+onsets, no drift when every present() costs time, and the timing log round
+trip.
+
+Usage:
+  python -m pytest test_trialsched.py
+
+"""
+
+import os, tempfile
+import numpy as np
+import trialsched
+
+class VirtualClock(object):
+
+    '''
+    Clock in s that only moves when waited on or told to.
+    '''
+
+    def __init__(self):
+
+        self.t = 0.
+
+    def now(self):
+
+        # every look at the clock costs a little, so spin loops end
+        self.t = self.t + 1e-5
+        return self.t
+
+    def wait(self, ms):
+
+        self.t = self.t + ms/1000.
+
+def plan(ntrials=20):
+
+    itis = np.full(ntrials, 400.)
+    itis[::2] = 600.
+
+    return trialsched.planrun(ntrials, 2., 500, 1500, 6000, 3000, itis), itis
+
+def test_planrun():
+
+    planned, itis = plan()
+    assert planned.shape == (20, len(trialsched.events))
+    assert planned[0,0] == 2.
+    assert np.allclose(np.diff(planned[0]), [.5, 1.5, 6.])
+    assert np.allclose(np.diff(planned[:,0]), 11. + itis[:-1]/1000.)
+
+def test_no_drift():
+
+    # every present() takes 12 ms, relative waits would drift by that much
+    # per event
+    planned, itis = plan()
+    clock = VirtualClock()
+    sched = trialsched.Scheduler(planned, 0., now=clock.now, wait=clock.wait)
+    for trial in range(len(planned)):
+        for ev in range(len(trialsched.events)):
+            sched.waituntil(trial, ev)
+            clock.wait(12)
+            sched.mark(trial, ev)
+    err = sched.errors()
+    assert np.all(err > 11.9) and np.all(err < 12.5)
+    for ev in trialsched.events:
+        assert abs(sched.summary()[ev]['drift']) < .01
+
+def test_late_deadline():
+
+    planned, itis = plan(2)
+    clock = VirtualClock()
+    sched = trialsched.Scheduler(planned, 0., now=clock.now, wait=clock.wait)
+    clock.wait(3000)
+    assert sched.waituntil(0, 0) < 0
+    assert sched.remaining(0, 0, 500) == 0
+
+def test_write_read():
+
+    planned, itis = plan(3)
+    clock = VirtualClock()
+    sched = trialsched.Scheduler(planned, 0., now=clock.now, wait=clock.wait)
+    for trial in range(3):
+        for ev in range(len(trialsched.events)):
+            sched.waituntil(trial, ev)
+            sched.mark(trial, ev)
+    fname = os.path.join(tempfile.mkdtemp(), 'WMITC_01_201409181100.xpd')
+    sched.write(trialsched.timingfile(fname))
+    p, a = trialsched.readtiming(fname[:-4] + '_timing.csv')
+    assert np.allclose(p, planned, atol=1e-6)
+    assert np.allclose(a, sched.actual, atol=1e-6)
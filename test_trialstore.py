@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks of the binary trial store: .xpd, offers and fitted parameter files
+round trip through their .npy copies, stale copies are rebuilt, and files
+without column names are refused.
+
+Usage:
+  python -m pytest test_trialstore.py
+
+"""
+
+import os, time, tempfile
+import numpy as np
+import trialstore
+
+def writexpd(fname, rows):
+
+    f = open(fname, 'w')
+    for i in range(9):
+        f.write('#e mainfile: stairK.py\n')
+    f.write('subject_id,trial,k,ssamnt,ssdel,llamnt,lldel,choice,RT\n')
+    for row in rows:
+        f.write(','.join('%g' % v for v in row) + '\n')
+    f.close()
+
+def test_xpd_roundtrip():
+
+    fname = os.path.join(tempfile.mkdtemp(), 'stairK_01_201409161320.xpd')
+    rows = [[1, 0, .03, 10, 0, 12.5, 20, 1, 812],
+            [1, 1, .02, 20, 15, 31.2, 33, 0, 640]]
+    writexpd(fname, rows)
+    rec = trialstore.load(fname)
+    assert rec.dtype['trial'] == np.int32
+    assert np.array_equal(trialstore.fitmatrix(rec),
+                          np.array(rows, dtype=float)[:,3:8])
+
+    # a newer source is converted again
+    time.sleep(.01)
+    writexpd(fname, rows[:1])
+    os.utime(fname, (time.time() + 1, time.time() + 1))
+    assert len(trialstore.load(fname)) == 1
+
+def test_offers_and_params():
+
+    tmp = tempfile.mkdtemp()
+    offers = np.array([[20, 0, 31.25, 30], [40, 60, 18.5, 15]])
+    fname = os.path.join(tmp, '01_offers.txt')
+    trialstore.writeoffers(fname, offers)
+    assert os.path.isfile(fname + '.npy')
+    assert np.allclose(trialstore.readoffers(fname), offers)
+    assert np.allclose(np.genfromtxt(fname, delimiter=',', skip_header=1),
+                       offers)
+
+    fname = os.path.join(tmp, '01_fitkparams.txt')
+    trialstore.writeparams(fname, .0213, .87, -31.5)
+    assert np.allclose(trialstore.readparams(fname), (.0213, .87, -31.5))
+
+def test_no_names():
+
+    tmp = tempfile.mkdtemp()
+    for name, text in (('empty.xpd', ''), ('comments.xpd', '#a\n#b\n'),
+                       ('empty.txt', '')):
+        fname = os.path.join(tmp, name)
+        f = open(fname, 'w')
+        f.write(text)
+        f.close()
+        assert trialstore.readnames(fname)[0] == []
+        try:
+            trialstore.convert(fname)
+        except ValueError:
+            pass
+        else:
+            assert False, name
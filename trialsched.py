@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Absolute-deadline timing for the WMITC trial loop. Chains of relative waits
+add every bit of presentation overhead to all later onsets, so the task
+drifts against the scanner clock. Here every onset of the run is planned up
+front as an absolute time from the start mark (strtt) and the loop waits
+until each deadline, so rendering and logging time is absorbed by the
+following wait instead of accumulating.
+
+Each trial takes a fixed slot: fixation, first offer, delay, second offer
+(up to the max decision time) and the jittered ITI. The ITI blank starts at
+the response and lasts until the next trial's deadline, so a response does
+not move later onsets.
+
+Planned and actual onsets of every event are kept in preallocated arrays
+and can be written next to the data file, e.g. WMITC_01_201409181100.xpd ->
+WMITC_01_201409181100_timing.csv, for checking timing precision.
+
+Usage:
+  planned = planrun(ntrials, start, fixcprest, foprest, dprest, maxdt, itis)
+  sched = Scheduler(planned, strtt, now=clock.monotonic_time,
+                    wait=exp.clock.wait)
+  sched.waituntil(trial, 1); screen.present(); foffert = sched.mark(trial, 1)
+  sched.write(timingfile(exp.data.fullpath))
+
+"""
+
+import time
+import numpy as np
+
+# events of a trial, in order
+events = ('fix', 'foffer', 'delay', 'poffer')
+
+def planrun(ntrials, start, fixcprest, foprest, dprest, maxdt, itis):
+
+    '''
+    Onsets (s from the start mark) of every event of every trial, shape
+    (trials x events). start is the onset of the first trial in s, the
+    durations are in ms and itis holds one ITI (ms) per trial.
+    '''
+
+    durs = np.array([fixcprest, foprest, dprest, maxdt], dtype=float)
+    slots = durs.sum() + np.asarray(itis, dtype=float)[:ntrials]
+    trialstart = start + np.concatenate(([0], np.cumsum(slots)[:-1]))/1000.
+    within = np.concatenate(([0], np.cumsum(durs[:-1])))/1000.
+
+    return trialstart[:,None] + within[None,:]
+
+def timingfile(datafile, suffix='_timing.csv'):
+
+    '''
+    Name of a log (timing by default) that goes next to a data file.
+    '''
+
+    return datafile.rsplit('.', 1)[0] + suffix
+
+class Scheduler(object):
+
+    '''
+    Waits for absolute deadlines and logs planned vs actual onsets.
+
+    planned: onsets in s from t0, (trials x events)
+    t0: start mark, in the time base of now
+    now: function returning the current time in s (monotonic)
+    wait: function waiting for a number of ms (e.g. exp.clock.wait). It is
+          used for all but the last spin ms of a wait.
+    '''
+
+    def __init__(self, planned, t0, now=None, wait=None, spin=2):
+
+        self.planned = np.asarray(planned, dtype=float)
+        self.actual = np.full(self.planned.shape, np.nan)
+        self.t0 = t0
+        self.now = time.time if now is None else now
+        self.wait = (lambda ms: time.sleep(ms/1000.)) if wait is None else wait
+        self.spin = spin
+
+    def elapsed(self):
+
+        return self.now() - self.t0
+
+    def waituntil(self, trial, event=0, onset=None):
+
+        '''
+        Waits until the planned onset of an event (or until onset, in s from
+        t0, if given). Returns the remaining time in ms when the wait began;
+        negative means the deadline had already passed.
+        '''
+
+        if onset is None:
+            onset = self.planned[trial, event]
+        left = (onset - self.elapsed())*1000.
+        if left > self.spin:
+            self.wait(int(left - self.spin))
+        while self.elapsed() < onset:
+            pass
+
+        return left
+
+    def remaining(self, trial, event, dur):
+
+        '''
+        ms left of a window of dur ms that opened at the planned onset of an
+        event, e.g. the response window of the second offer.
+        '''
+
+        return max(0, int(dur - (self.elapsed() -
+                                 self.planned[trial, event])*1000.))
+
+    def mark(self, trial, event):
+
+        '''
+        Records the actual onset of an event, right after present(). Returns
+        it in s from t0.
+        '''
+
+        self.actual[trial, event] = self.elapsed()
+
+        return self.actual[trial, event]
+
+    def errors(self):
+
+        '''
+        Actual minus planned onsets, in ms.
+        '''
+
+        return (self.actual - self.planned)*1000.
+
+    def write(self, fname):
+
+        '''
+        Writes one row per event: trial, event, planned and actual onset
+        (s from t0) and the error (ms).
+        '''
+
+        err = self.errors()
+        f = open(fname, 'w')
+        f.write('"trial","event","planned","actual","error"\n')
+        for trial in range(self.planned.shape[0]):
+            for ev in range(self.planned.shape[1]):
+                f.write('%d, %s, %.6f, %.6f, %.3f\n' %
+                        (trial, events[ev], self.planned[trial, ev],
+                         self.actual[trial, ev], err[trial, ev]))
+        f.close()
+
+    def summary(self):
+
+        '''
+        Timing error per event (ms): mean, sd, max absolute and the drift
+        (slope of the error over trials, ms per trial).
+        '''
+
+        return summarize(self.errors())
+
+def summarize(err):
+
+    '''
+    Summary of a (trials x events) error array in ms, keyed by event name.
+    '''
+
+    out = {}
+    for ev in range(err.shape[1]):
+        e = err[:,ev]
+        ok = np.isfinite(e)
+        drift = np.polyfit(np.nonzero(ok)[0], e[ok], 1)[0] \
+                if ok.sum() > 1 else np.nan
+        out[events[ev]] = {'mean': np.mean(e[ok]), 'sd': np.std(e[ok]),
+                           'maxabs': np.max(np.abs(e[ok])), 'drift': drift}
+
+    return out
+
+def readtiming(fname):
+
+    '''
+    Reads a timing log back into (trials x events) planned and actual
+    arrays.
+    '''
+
+    rows = np.genfromtxt(fname, delimiter=',', skip_header=1,
+                         usecols=(0, 2, 3))
+    ntrials = int(rows[:,0].max()) + 1
+
+    return rows[:,1].reshape(ntrials, -1), rows[:,2].reshape(ntrials, -1)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Binary trial store. Every stage of the pipeline reads CSV text: staircase and
+WMITC .xpd files, _fitkparams.txt and _offers.txt. This module converts them
+once into structured NumPy .npy files (one record per row, one named field
+per column) that load as zero-copy, read-only memory maps, so group analyses
+and refits over many sessions skip text parsing.
+
+The field types come from a schema keyed by the column names used in the
+scripts ('data_variable_names' for .xpd files, the header for .txt files).
+Columns not in the schema are stored as float64.
+
+The .npy file sits next to its source, with the same name plus '.npy'
+(e.g. stairK_01_201409161320.xpd.npy), and is rebuilt only when the source
+is newer.
+
+The offers and fitted parameters are written through writeoffers and
+writeparams, which store the text file and its .npy together, and read
+through readoffers and readparams.
+
+Usage:
+  rec = load('data/stairK_01_201409161320.xpd')   # converts on first use
+  rec['choice'], rec['lldel'], ...
+  fitmatrix(rec)                                   # FitK trial matrix
+  offers = readoffers('data/offers/01_offers.txt')
+  k, m, ll = readparams('data/fitted/01_fitkparams.txt')
+  python trialstore.py [datadir]                   # convert a whole tree
+
+"""
+
+import os, sys
+import numpy as np
+
+# column types, everything not listed is float64
+schema = {'subject_id': np.int32,
+          'run':        np.int32,
+          'trial':      np.int32}
+
+def readnames(fname):
+
+    '''
+    Returns the column names of a source file and the number of lines
+    before its first data row.
+    '''
+
+    f = open(fname)
+    nskip = 0
+    line = ''
+    for line in f:
+        nskip = nskip + 1
+        line = line.strip()
+        # .xpd files open with '#' comment lines before the names
+        if fname.endswith('.xpd') and line.startswith('#'):
+            continue
+        break
+    f.close()
+
+    # an empty file (or one with only the .xpd comments) has no names
+    if not line.strip() or (fname.endswith('.xpd') and line.startswith('#')):
+        return [], nskip
+
+    # np.savetxt puts '# ' in front of the offers header
+    names = [n.strip().strip('#').strip().strip('"')
+             for n in line.split(',')]
+
+    return names, nskip
+
+def recdtype(names):
+
+    return np.dtype([(n, schema.get(n, np.float64)) for n in names])
+
+def convert(fname, out=None):
+
+    '''
+    Parses a .xpd or .txt source file and writes it as a structured .npy.
+    Returns the name of the .npy file.
+    '''
+
+    if out is None:
+        out = fname + '.npy'
+
+    names, nskip = readnames(fname)
+    if not names:
+        raise ValueError('%s has no column names' % fname)
+    data = np.genfromtxt(fname, delimiter=',', skip_header=nskip,
+                         comments=None)
+    data = np.atleast_2d(data)
+    if data.size == 0:
+        data = data.reshape(0, len(names))
+
+    rec = np.empty(len(data), dtype=recdtype(names))
+    for col, name in enumerate(names):
+        rec[name] = data[:,col]
+
+    # write under a temporary name so readers never map half a file
+    tmp = out + '.tmp.npy'
+    np.save(tmp, rec)
+    os.rename(tmp, out)
+
+    return out
+
+def isstale(fname, out=None):
+
+    if out is None:
+        out = fname + '.npy'
+
+    return not os.path.isfile(out) or \
+           os.path.getmtime(out) < os.path.getmtime(fname)
+
+def load(fname, mmap=True):
+
+    '''
+    Returns the records of a .xpd or .txt source file (or of a .npy made
+    by convert), converting the source first if its .npy is missing or
+    older. With mmap the records are a read-only memory map.
+    '''
+
+    if fname.endswith('.npy'):
+        out = fname
+    else:
+        out = fname + '.npy'
+        if isstale(fname, out):
+            convert(fname, out)
+
+    return np.load(out, mmap_mode='r' if mmap else None)
+
+def fitmatrix(rec):
+
+    '''
+    FitK trial matrix [r1 d1 r2 d2 choice] from staircase records.
+    '''
+
+    return np.column_stack((rec['ssamnt'], rec['ssdel'], rec['llamnt'],
+                            rec['lldel'], rec['choice'])).astype(float)
+
+def offermatrix(rec):
+
+    '''
+    Offer table [famnt fdelay pamnt pdelay] from _offers.txt records.
+    '''
+
+    return np.column_stack((rec['famnt'], rec['fdelay'], rec['pamnt'],
+                            rec['pdelay'])).astype(float)
+
+def readoffers(fname):
+
+    '''
+    Offer table [famnt fdelay pamnt pdelay] of an _offers.txt file, as a
+    new (writable) array.
+    '''
+
+    return offermatrix(load(fname))
+
+def writeoffers(fname, offers):
+
+    '''
+    Writes an offer table in the text format WMITC.py shows the
+    experimenter and its .npy copy, so readers never parse the text.
+    '''
+
+    np.savetxt(fname, offers, delimiter=',', fmt='%.2f',
+               header='"famnt","fdelay","pamnt","pdelay"')
+    convert(fname)
+
+def readparams(fname):
+
+    '''
+    k, m and loglikelihood of a _fitkparams.txt file.
+    '''
+
+    rec = load(fname)
+
+    return float(rec['k'][0]), float(rec['m'][0]), float(rec['ll'][0])
+
+def writeparams(fname, k, m, ll):
+
+    '''
+    Writes a _fitkparams.txt file (as runFitK.py always has) and its .npy
+    copy.
+    '''
+
+    f = open(fname, 'w')
+    f.write('"k","m","ll"\n')
+    f.write('%f, %f, %f\n' % (k, m, ll))
+    f.close()
+    convert(fname)
+
+def sources(datadir):
+
+    '''
+    Every .xpd, _offers.txt and _fitkparams.txt file under datadir.
+    '''
+
+    found = []
+    for root, dirs, files in os.walk(datadir):
+        for name in sorted(files):
+            if name.endswith(('.xpd', '_offers.txt', '_fitkparams.txt')):
+                found.append(os.path.join(root, name))
+
+    return found
+
+def convertall(datadir):
+
+    '''
+    Converts every stale source file under datadir. Returns the .npy
+    files written.
+    '''
+
+    return [convert(fname) for fname in sources(datadir) if isstale(fname)]
+
+if __name__ == '__main__':
+
+    datadir = sys.argv[1] if len(sys.argv) > 1 else \
+              '/Users/christianrodriguez/Dropbox/Python/data'
+    written = convertall(datadir)
+    print('converted %d files' % len(written))